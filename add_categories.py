@@ -1,5 +1,16 @@
-from app import create_app
-from database import db, Category
+from flask import Flask
+
+from config import Config
+from database import db, Category, category_cache
+
+def create_app():
+    """Minimal app on the same database and instance folder as app.py."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    # Committing categories bumps the cache stamp, so running workers reload
+    category_cache.init_app(app)
+    return app
 
 def add_categories():
     app = create_app()
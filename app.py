@@ -2,24 +2,40 @@ from flask import Flask, render_template, request, redirect, url_for, flash, jso
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
 from flask_wtf.csrf import CSRFProtect
+from sqlalchemy.orm import joinedload
+import click
 import os
-import uuid
 from datetime import datetime, timedelta
 import bleach
-from PIL import Image
 import io
 
 from config import Config
-from database import db, User, Post, Comment, Like, Category
+from database import (db, view_counter, post_search, category_cache, upload_store,
+                      post_trending, post_views, post_related, rollups, User, Post, Comment, Like, Category,
+                      COUNTER_COLUMNS, reconcile_counters, count_words, trending_events,
+                      approve_comments, delete_comments, page_cache, snapshots)
+from feeds import post_cards, post_rows, author_stats, card_tags
+from comment_threads import comment_threads
+from content_transfer import export_ndjson, import_ndjson
+from keyset import keyset_paginate, approximate_count
+from unique_names import add_unique
+from image_pipeline import ImagePipeline, stored_name
+from schema import add_missing_columns, backfill
+from request_profiler import RequestProfiler, timed
+from http_cache import HttpCache
+from static_snapshots import Page, rendering
 from forms import LoginForm, RegistrationForm, PostForm, CommentForm, ProfileForm
 
 # Initialize extensions
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 csrf = CSRFProtect()
+image_pipeline = ImagePipeline(upload_store)
+request_profiler = RequestProfiler()
+http_cache = HttpCache()
 
-def create_app():
-    app = Flask(__name__)
+def create_app(instance_path=None):
+    app = Flask(__name__, instance_path=instance_path)
     app.config.from_object(Config)
     # Ensure upload folder exists and is absolute
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
@@ -29,9 +45,23 @@ def create_app():
     
     # Initialize extensions
     db.init_app(app)
+    view_counter.init_app(app)
+    category_cache.init_app(app)
+    post_trending.init_app(app)
+    post_views.init_app(app)
+    post_related.init_app(app)
+    rollups.init_app(app)
+    upload_store.init_app(app)
+    image_pipeline.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
+    request_profiler.init_app(app)
+    page_cache.init_app(app)
+    http_cache.init_app(app)
+    snapshots.init_app(app)
+    # A page served from the cache still counts as a view
+    page_cache.on_hit('view', view_counter.increment)
     
     # Configure login manager
     login_manager.login_view = 'login'
@@ -51,35 +81,17 @@ def create_app():
         slug = slug.strip('-')
         return slug
     
+    @timed('save_image')
     def save_image(image_file):
-        """Save and resize uploaded image"""
+        """Queue an uploaded image for resizing; returns its filename or None"""
         if not image_file:
             return None
         try:
-            filename = str(uuid.uuid4()) + '.jpg'
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            # Create upload folder if it doesn't exist
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            
-            # Open and process image
-            img = Image.open(image_file)
-            
-            # Resize if too large
-            max_size = (1200, 800)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Save image
-            img.save(filepath, 'JPEG', quality=85)
-            
-            return filename
-        except Exception:
+            return image_pipeline.submit(image_file)
+        except ValueError:
             return None
     
+    @timed('sanitize_html')
     def sanitize_html(content):
         """Sanitize HTML content to prevent XSS"""
         allowed_tags = ['p', 'br', 'b', 'i', 'u', 'em', 'strong', 'h1', 'h2', 'h3', 
@@ -90,8 +102,7 @@ def create_app():
     # Context processors
     @app.context_processor
     def inject_categories():
-        categories = Category.query.all()
-        return dict(categories=categories)
+        return dict(categories=category_cache.all())
     
     @app.context_processor
     def inject_user():
@@ -104,6 +115,14 @@ def create_app():
     # Bootstrap database (tables, categories, admin) even when running via `flask run`
     def bootstrap_defaults():
         db.create_all()
+        added = add_missing_columns(db)
+        if {f'posts.{name}' for name in COUNTER_COLUMNS} & set(added):
+            reconcile_counters()
+        if 'posts.word_count' in added:
+            backfill(db, Post.__table__, 'word_count', 'content', count_words)
+        post_search.ensure_schema()
+        post_trending.ensure_built(trending_events)
+        rollups.ensure_built()
         if Category.query.count() == 0:
             default_categories = [
                 ('Technology', 'technology'),
@@ -134,52 +153,143 @@ def create_app():
 
     with app.app_context():
         bootstrap_defaults()
+
+    # CLI commands
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recompute like/comment counters on every post."""
+        fixed = reconcile_counters()
+        print(f'Reconciled counters on {fixed} post(s).')
+
+    @app.cli.command('process-images')
+    def process_images_command():
+        """Render variants for uploads left unprocessed by a stopped worker."""
+        done = image_pipeline.process_pending()
+        print(f'Processed {done} pending image(s).')
+
+    @app.cli.command('prune-uploads')
+    def prune_uploads_command():
+        """Delete uploaded images no post or profile refers to any more."""
+        removed = upload_store.prune()
+        print(f'Removed {removed} unreferenced image(s).')
+
+    @app.cli.command('recompute-trending')
+    def recompute_trending_command():
+        """Rebuild trending scores from likes, comments and view totals."""
+        ranked = post_trending.rebuild(trending_events())
+        print(f'Recomputed trending scores for {ranked} post(s).')
+
+    @app.cli.command('rebuild-related')
+    def rebuild_related_command():
+        """Recompute TF-IDF vectors and related posts for every published post."""
+        indexed = post_related.rebuild()
+        print(f'Rebuilt related posts for {indexed} post(s).')
+
+    @app.cli.command('compact-view-buckets')
+    def compact_view_buckets_command():
+        """Roll old hourly view buckets into days and drop expired ones."""
+        removed = post_views.compact()
+        print(f'Compacted {removed} view bucket row(s).')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute the daily analytics rollups from the source tables."""
+        written = rollups.rebuild()
+        print(f'Rebuilt {written} rollup row(s).')
+
+    @app.cli.command('publish-snapshots')
+    @click.option('--force', is_flag=True, help='Re-render and rewrite every snapshot.')
+    def publish_snapshots_command(force):
+        """Write static HTML for published posts and feeds whose inputs changed."""
+        counts = snapshots.build(force=force)
+        print(f"Snapshots: {counts['written']} written, {counts['unchanged']} unchanged, "
+              f"{counts['removed']} removed (in {snapshots.path}).")
+
+    @app.cli.command('export-content')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    def export_content_command(path):
+        """Stream categories, users, posts, comments and likes to an NDJSON file."""
+        with open(path, 'w', encoding='utf-8') as out:
+            counts = export_ndjson(out)
+        print('Exported ' + ', '.join(f'{n} {kind}(s)' for kind, n in counts.items()) + f' to {path}.')
+
+    @app.cli.command('import-content')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--skip-derived', is_flag=True,
+                  help='Leave counters, rollups and trending scores to their own commands.')
+    def import_content_command(path, skip_derived):
+        """Bulk-load an NDJSON file written by export-content."""
+        with open(path, encoding='utf-8') as lines:
+            counts = import_ndjson(lines, rebuild_derived=not skip_derived)
+        print('Imported ' + ', '.join(f'{n} {kind}(s)' for kind, n in counts.items()) + '.')
+        if skip_derived:
+            print('Now run reconcile-counters, rebuild-rollups, recompute-trending and rebuild-related.')
+        else:
+            print('Now run rebuild-related.')
+
+    @app.cli.command('reindex-search')
+    def reindex_search_command():
+        """Rebuild the full-text search index for posts."""
+        post_search.rebuild()
+        print(f'Rebuilt {post_search.backend} search index for posts.')
     
     # Routes
     
     @app.route('/')
+    @page_cache.cached
+    @http_cache.policy('feed')
     def index():
         """Public blog feed"""
-        page = request.args.get('page', 1, type=int)
+        cursor = request.args.get('cursor')
         category = request.args.get('category')
         
         # Base query for published posts
-        query = Post.query.filter_by(is_published=True)
+        query = post_cards().filter_by(is_published=True).filter(Post.published_at != None)  # noqa: E711
         
         # Filter by category
         if category:
-            query = query.join(Category).filter(Category.slug == category)
-        
-        # Order by publication date
-        posts = query.order_by(Post.published_at.desc()).paginate(
-            page=page, per_page=app.config['POSTS_PER_PAGE'], error_out=False
-        )
+            query = query.filter(Post.category_id == category_cache.id_for_slug(category))
         
-        # Get featured posts (most viewed in last 7 days)
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        featured_query = Post.query.filter_by(is_published=True).filter(
-            Post.published_at != None,  # noqa: E711
-            Post.published_at >= seven_days_ago
-        ).order_by(Post.views.desc()).limit(3)
+        # Newest first, seeking past the cursor instead of using OFFSET
+        posts = keyset_paginate(query, (Post.published_at, Post.id),
+                                cursor=cursor, per_page=app.config['POSTS_PER_PAGE'])
         
-        featured_posts = featured_query.all()
+        # Featured posts: the top of the trending board (recent activity, decayed)
+        featured_ids = post_trending.top(3, Post.is_published == True, Post.published_at != None)  # noqa: E711,E712
+        featured_posts = post_trending.load(post_cards(), featured_ids)
+        page_cache.tag('posts', *card_tags(posts.items), *card_tags(featured_posts))
         
         return render_template('index.html', posts=posts, featured_posts=featured_posts, category=category)
     
     @app.route('/post/<slug>')
+    @page_cache.cached
+    @http_cache.policy('page')
     def view_post(slug):
         """Individual blog post"""
-        post = Post.query.filter_by(slug=slug, is_published=True).first_or_404()
-        
-        # Increment view count
-        post.increment_views()
-        
-        # Get comments
-        comments = Comment.query.filter_by(
-            post_id=post.id, 
-            parent_id=None,
-            is_approved=True
-        ).order_by(Comment.created_at.desc()).all()
+        # Revalidation needs only the post's and its author's timestamps and counters
+        stamp = db.session.query(
+            Post.id, Post.updated_at, User.updated_at, *(getattr(Post, name) for name in COUNTER_COLUMNS)
+        ).join(User, User.id == Post.user_id).filter(
+            Post.slug == slug, Post.is_published == True  # noqa: E712
+        ).first_or_404()
+        not_modified = http_cache.validate(*stamp, last_modified=stamp[1])
+        if not_modified is not None:
+            view_counter.increment(stamp.id)
+            return not_modified
+        post = db.session.get(Post, stamp.id)
+        
+        # Increment view count (a snapshot counts its views through post_live)
+        if not rendering():
+            post.increment_views()
+            page_cache.replay('view', post.id)
+        
+        # Get a page of comment threads with their replies in two queries
+        comments = comment_threads(
+            post.id,
+            cursor=request.args.get('comments_cursor'),
+            per_page=app.config['COMMENTS_PER_PAGE'],
+            thread_id=request.args.get('thread'),
+        )
         
         # Check if current user liked this post
         user_liked = False
@@ -189,12 +299,16 @@ def create_app():
                 post_id=post.id
             ).first() is not None
         
-        # Get similar posts
-        similar_posts = Post.query.filter(
-            Post.category_id == post.category_id,
-            Post.id != post.id,
+        # Posts closest in wording and tags, looked up from the precomputed table
+        similar_posts = post_related.load(post_cards().filter(Post.is_published == True), post.id, 3)
+        
+        # Count the author's posts instead of loading every one of them
+        author_post_count = db.session.query(db.func.count(Post.id)).filter(
+            Post.user_id == post.user_id,
             Post.is_published == True
-        ).order_by(Post.views.desc()).limit(3).all()
+        ).scalar()
+        
+        page_cache.tag(*card_tags([post]), *card_tags(similar_posts))
         
         form = CommentForm()
         return render_template('post.html', 
@@ -202,31 +316,36 @@ def create_app():
                              comments=comments, 
                              form=form,
                              user_liked=user_liked,
-                             similar_posts=similar_posts)
+                             similar_posts=similar_posts,
+                             author_post_count=author_post_count)
     
     @app.route('/search')
+    @page_cache.cached
+    @http_cache.policy('feed')
     def search():
         """Search blog posts"""
         query = request.args.get('q', '')
         page = request.args.get('page', 1, type=int)
         category_slug = request.args.get('category')
         
-        base_query = Post.query.filter(Post.is_published == True)
+        base_query = post_cards().filter(Post.is_published == True)
 
         if category_slug:
-            base_query = base_query.join(Category).filter(Category.slug == category_slug)
+            base_query = base_query.filter(Post.category_id == category_cache.id_for_slug(category_slug))
 
         if query:
-            base_query = base_query.filter(
-                (Post.title.ilike(f'%{query}%') | 
-                 Post.content.ilike(f'%{query}%') |
-                 Post.tags.ilike(f'%{query}%'))
-            )
+            # Ranked full-text match; newest first among equally relevant posts.
+            # Relevance order can't be seeked, so this stays OFFSET-paged with
+            # a briefly cached total rather than a COUNT(*) per page.
+            base_query = post_search.search(base_query, query)
             posts = base_query.order_by(Post.published_at.desc()).paginate(
-                page=page, per_page=app.config['POSTS_PER_PAGE'], error_out=False
+                page=page, per_page=app.config['POSTS_PER_PAGE'], error_out=False, count=False
             )
+            posts.total = approximate_count(('post-search', query.lower(), category_slug), base_query,
+                                            ttl=app.config['PAGINATION_COUNT_TTL'])
         else:
             posts = []
+        page_cache.tag('posts')
         
         return render_template('search.html', posts=posts, query=query, category=category_slug)
     
@@ -288,15 +407,11 @@ def create_app():
     @login_required
     def dashboard():
         """User dashboard"""
-        user_posts = Post.query.filter_by(user_id=current_user.id)\
+        user_posts = post_rows().filter_by(user_id=current_user.id)\
             .order_by(Post.created_at.desc()).all()
         
-        stats = {
-            'total_posts': len(user_posts),
-            'published_posts': len([p for p in user_posts if p.is_published]),
-            'total_views': sum(p.views for p in user_posts),
-            'total_likes': sum(len(p.likes) for p in user_posts)
-        }
+        stats = author_stats(current_user.id)
+        stats['views_7d'] = post_views.total(timedelta(days=7), Post.user_id == current_user.id)
         
         return render_template('dashboard.html', posts=user_posts, stats=stats)
     
@@ -305,16 +420,9 @@ def create_app():
     def create_post():
         """Create new blog post"""
         form = PostForm()
-        form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+        form.category_id.choices = category_cache.choices()
         
         if form.validate_on_submit():
-            slug = generate_slug(form.title.data)
-            
-            # Check if slug already exists
-            existing_post = Post.query.filter_by(slug=slug).first()
-            if existing_post:
-                slug = f"{slug}-{str(uuid.uuid4())[:8]}"
-            
             # Save cover image if uploaded
             cover_image = None
             if form.cover_image.data:
@@ -322,7 +430,6 @@ def create_app():
             
             post = Post(
                 title=form.title.data,
-                slug=slug,
                 content=sanitize_html(form.content.data),
                 excerpt=form.excerpt.data,
                 category_id=form.category_id.data,
@@ -335,7 +442,8 @@ def create_app():
             if form.is_published.data:
                 post.published_at = datetime.utcnow()
             
-            db.session.add(post)
+            # Taken slugs get the next free -N suffix
+            add_unique(db.session, post, Post.slug, generate_slug(form.title.data))
             db.session.commit()
             
             flash('Post created successfully!', 'success')
@@ -354,7 +462,7 @@ def create_app():
             abort(403)
         
         form = PostForm(obj=post)
-        form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+        form.category_id.choices = category_cache.choices()
 
         if form.validate_on_submit():
             # Update post
@@ -474,8 +582,23 @@ def create_app():
         
         return jsonify({
             'liked': liked,
-            'like_count': len(post.likes)
+            'like_count': post.like_count
+        })
+    
+    @app.route('/post/<slug>/live')
+    def post_live(slug):
+        """Counts and viewer state for a post page served as a static snapshot"""
+        post = db.session.query(Post.id, Post.like_count, Post.views).filter_by(
+            slug=slug, is_published=True
+        ).first_or_404()
+        view_counter.increment(post.id)
+        response = jsonify({
+            'authenticated': current_user.is_authenticated,
+            'like_count': post.like_count,
+            'views': (post.views or 0) + view_counter.pending(post.id),
         })
+        response.headers['Cache-Control'] = 'no-store'
+        return response
     
     # Profile routes
     @app.route('/profile', methods=['GET', 'POST'])
@@ -502,16 +625,12 @@ def create_app():
             flash('Profile updated successfully!', 'success')
             return redirect(url_for('profile'))
 
-        recent_posts = sorted(
-            current_user.posts,
-            key=lambda p: p.updated_at or p.created_at,
-            reverse=True
-        )[:5]
-        total_views = sum(p.views for p in current_user.posts)
-        total_likes = sum(len(p.likes) for p in current_user.posts)
+        recent_posts = post_rows().filter_by(user_id=current_user.id).order_by(
+            db.func.coalesce(Post.updated_at, Post.created_at).desc()
+        ).limit(5).all()
         
         return render_template('profile.html', form=form, recent_posts=recent_posts,
-                               total_views=total_views, total_likes=total_likes)
+                               stats=author_stats(current_user.id))
     
     # Admin routes
     @app.route('/admin')
@@ -521,15 +640,16 @@ def create_app():
         if not current_user.is_admin():
             abort(403)
         
+        totals = rollups.totals('users', 'posts', 'comments', 'approved_comments')
         stats = {
-            'total_users': User.query.count(),
-            'total_posts': Post.query.count(),
-            'total_comments': Comment.query.count(),
-            'pending_comments': Comment.query.filter_by(is_approved=False).count()
+            'total_users': totals['users'],
+            'total_posts': totals['posts'],
+            'total_comments': totals['comments'],
+            'pending_comments': totals['comments'] - totals['approved_comments']
         }
         
         # Recent activity
-        recent_posts = Post.query.order_by(Post.created_at.desc()).limit(10).all()
+        recent_posts = post_cards().order_by(Post.created_at.desc()).limit(10).all()
         recent_users = User.query.order_by(User.created_at.desc()).limit(10).all()
         
         return render_template('admin.html', 
@@ -544,12 +664,62 @@ def create_app():
         if not current_user.is_admin():
             abort(403)
         
-        pending_comments = Comment.query.filter_by(is_approved=False).all()
-        all_comments = Comment.query.order_by(Comment.created_at.desc()).all()
+        status = request.args.get('status', 'pending')
+        post_slug = request.args.get('post', '').strip()
+        author = request.args.get('author', '').strip()
+        age = request.args.get('age', type=int)
+        if age is not None:
+            # Non-positive ages mean no filter; huge ones would overflow timedelta
+            age = min(age, 3650) if age > 0 else None
+
+        query = Comment.query.options(
+            joinedload(Comment.commenter).load_only(User.username),
+            joinedload(Comment.post).load_only(Post.title, Post.slug),
+        )
+        if status in ('pending', 'approved'):
+            query = query.filter(Comment.is_approved == (status == 'approved'))
+        if post_slug:
+            post_id = db.select(Post.id).where(Post.slug == post_slug).scalar_subquery()
+            query = query.filter(Comment.post_id == post_id)
+        if author:
+            user_id = db.select(User.id).where(User.username == author).scalar_subquery()
+            query = query.filter(Comment.user_id == user_id)
+        if age:
+            query = query.filter(Comment.created_at >= datetime.utcnow() - timedelta(days=age))
+        
+        # Newest first, seeking past the cursor (ix_comments_moderation)
+        comments = keyset_paginate(query, (Comment.created_at, Comment.id),
+                                   cursor=request.args.get('cursor'),
+                                   per_page=app.config['COMMENTS_PER_PAGE'])
+        totals = rollups.totals('comments', 'approved_comments')
         
         return render_template('admin_comments.html',
-                             pending_comments=pending_comments,
-                             all_comments=all_comments)
+                             comments=comments,
+                             pending_count=totals['comments'] - totals['approved_comments'],
+                             filters={'status': status, 'post': post_slug,
+                                      'author': author, 'age': age or ''})
+    
+    @app.route('/admin/comments/bulk', methods=['POST'])
+    @login_required
+    def bulk_moderate_comments():
+        """Approve or delete a batch of comments (admin only)"""
+        if not current_user.is_admin():
+            abort(403)
+        
+        data = request.get_json(silent=True) or request.form
+        action = data.get('action')
+        ids = data.get('ids') if request.is_json else request.form.getlist('ids')
+        # Bounded so one request stays one reasonably sized IN (...) list
+        if action not in ('approve', 'delete') or not isinstance(ids, list) or len(ids) > 500:
+            abort(400)
+        
+        ids = [str(i) for i in ids]
+        changed = approve_comments(ids) if action == 'approve' else delete_comments(ids)
+        
+        if request.is_json:
+            return jsonify({'success': True, 'action': action, 'count': changed})
+        flash(f'{changed} comment(s) {"approved" if action == "approve" else "deleted"}.', 'success')
+        return redirect(request.referrer or url_for('admin_comments'))
     
     @app.route('/admin/comment/<comment_id>/approve', methods=['POST'])
     @login_required
@@ -598,34 +768,28 @@ def create_app():
         if not current_user.is_admin():
             abort(403)
         
-        # Daily post counts for last 30 days
-        import datetime
-        thirty_days_ago = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-        
-        daily_posts = db.session.query(
-            db.func.date(Post.created_at).label('date'),
-            db.func.count(Post.id).label('count')
-        ).filter(
-            Post.created_at >= thirty_days_ago
-        ).group_by(
-            db.func.date(Post.created_at)
-        ).all()
-        
-        # Top categories
-        top_categories = db.session.query(
-            Category.name,
-            db.func.count(Post.id).label('count')
-        ).join(Post).filter(
-            Post.is_published == True
-        ).group_by(
-            Category.name
-        ).order_by(
-            db.desc('count')
-        ).limit(5).all()
+        # Daily post counts and top categories, from the daily rollups
+        daily_posts = rollups.series('posts', 30)
+        names = dict(category_cache.choices())
+        top_categories = [(names.get(category_id), count)
+                          for category_id, count in rollups.by_dimension('published', 5)]
+        
+        # Views per day and the most viewed posts, from the view buckets
+        def views_summary():
+            top_posts = post_views.top(timedelta(days=7), 5)
+            titles = dict(db.session.query(Post.id, Post.title)
+                          .filter(Post.id.in_([row.item_id for row in top_posts])))
+            return post_views.series(timedelta(days=30)), [
+                {'id': row.item_id, 'title': titles.get(row.item_id), 'views': row.views}
+                for row in top_posts
+            ]
+        daily_views, top_posts = rollups.cached('views', views_summary)
         
         return jsonify({
             'daily_posts': [{'date': str(d[0]), 'count': d[1]} for d in daily_posts],
-            'top_categories': [{'category': c[0], 'count': c[1]} for c in top_categories]
+            'top_categories': [{'category': c[0], 'count': c[1]} for c in top_categories],
+            'daily_views': [{'date': start.date().isoformat(), 'views': views} for start, views in daily_views],
+            'top_posts_7d': top_posts
         })
     
     # Error handlers
@@ -675,8 +839,45 @@ def create_app():
         if not filename:
             return jsonify({'error': 'Invalid image'}), 400
 
-        url = url_for('static', filename=f'uploads/{filename}')
-        return jsonify({'url': url}), 201
+        # Variants are rendered in the background; poll status_url until ready
+        return jsonify(upload_status_payload(filename)), 202
+
+    @app.route('/api/upload-image/<job_id>')
+    @login_required
+    def upload_image_status(job_id):
+        if image_pipeline.status(job_id) is None:
+            return jsonify({'error': 'Unknown upload'}), 404
+        return jsonify(upload_status_payload(stored_name(job_id)))
+
+    # Static snapshots (see static_snapshots.py): post pages, the recent feed and category feeds
+    @snapshots.source('posts')
+    def post_snapshots(ids):
+        query = db.session.query(
+            Post.id, Post.slug, Post.updated_at, User.updated_at, Post.comment_count,
+            Post.approved_comment_count
+        ).join(User, User.id == Post.user_id).filter(Post.is_published == True)  # noqa: E712
+        if ids is not None:
+            query = query.filter(Post.id.in_(ids))
+        for row in query:
+            # Likes and views are refreshed by the page's post_live call
+            yield Page(row.id, url_for('view_post', slug=row.slug), f'post/{row.slug}/index.html',
+                       stamp=tuple(row[2:]))
+
+    @snapshots.source('feeds')
+    def feed_snapshots(keys):
+        yield Page('recent', url_for('index'), 'index.html')
+        for (slug,) in db.session.query(Category.slug).order_by(Category.slug):
+            yield Page(f'category:{slug}', url_for('index', category=slug), f'category/{slug}/index.html')
+
+    def upload_status_payload(filename):
+        job_id = image_pipeline.stem_for(filename)
+        return {
+            'status': image_pipeline.status(job_id),
+            'url': url_for('static', filename=f'uploads/{filename}'),
+            'placeholder_url': url_for('static', filename='images/image-pending.svg'),
+            'srcset': image_pipeline.srcset(filename),
+            'status_url': url_for('upload_image_status', job_id=job_id),
+        }
     
     return app
 
@@ -1,20 +1,34 @@
-from flask import Flask, request, g
+from flask import Flask, request, g, session
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, current_user
+from flask_login import LoginManager, current_user, user_logged_in
 from config import Config
 import os
 import json
 from authlib.integrations.flask_client import OAuth
+from view_counter import ViewCounter
+from image_pipeline import ImagePipeline
+from upload_store import UploadStore
+from request_profiler import RequestProfiler
+from page_cache import PageCache
+from http_cache import HttpCache
+from static_snapshots import SnapshotPublisher
 
 db = SQLAlchemy()
+view_counter = ViewCounter(db, 'blogs', key_type=int)
+upload_store = UploadStore(db)
+image_pipeline = ImagePipeline(upload_store)
+request_profiler = RequestProfiler()
+page_cache = PageCache(db)
+http_cache = HttpCache()
+snapshots = SnapshotPublisher(db)
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 oauth = OAuth()
 
-def create_app(config_class=Config):
-    app = Flask(__name__, instance_relative_config=True)
+def create_app(config_class=Config, instance_path=None):
+    app = Flask(__name__, instance_path=instance_path, instance_relative_config=True)
     app.config.from_object(config_class)
     
     # Ensure instance folder exists
@@ -35,7 +49,16 @@ def create_app(config_class=Config):
         os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
 
     db.init_app(app)
+    view_counter.init_app(app)
+    upload_store.init_app(app)
+    image_pipeline.init_app(app)
     login_manager.init_app(app)
+    request_profiler.init_app(app)
+    page_cache.init_app(app)
+    http_cache.init_app(app)
+    snapshots.init_app(app)
+    # A page served from the cache still counts as a view
+    page_cache.on_hit('view', view_counter.increment)
     
     # Configure session persistence BEFORE OAuth
     app.config.update(
@@ -47,15 +70,22 @@ def create_app(config_class=Config):
     
     oauth.init_app(app)
     
-    from app.models import User, Blog, Comment, Like, Bookmark
+    from app.models import User, Blog, Comment, Like, Bookmark, blog_trending, blog_views, blog_related, rollups
+    blog_trending.init_app(app)
+    blog_views.init_app(app)
+    blog_related.init_app(app)
+    rollups.init_app(app)
     
     @app.before_request
     def before_request():
         g.user = current_user
-        # Ensure session is permanent for OAuth state persistence
-        from flask import session
+    
+    # Only logins (and the Google OAuth handshake, see auth.google_login) make
+    # the session permanent. Anonymous reads never touch the session, so they
+    # get no Set-Cookie and stay cacheable by browsers and CDNs.
+    @user_logged_in.connect_via(app)
+    def keep_login_session(sender, user, **extra):
         session.permanent = True
-        app.permanent_session_lifetime = app.config['PERMANENT_SESSION_LIFETIME']
     
     # Register blueprints
     from app.auth import bp as auth_bp
@@ -70,9 +100,23 @@ def create_app(config_class=Config):
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
     
-    # Create tables
+    # Create tables (and add columns introduced since the database was created)
+    from app.models import COUNTER_COLUMNS, reconcile_counters, blog_search, blog_trending, trending_events
+    from app.utils import count_words
+    from schema import add_missing_columns, backfill
     with app.app_context():
         db.create_all()
+        added = add_missing_columns(db)
+        if {f'blogs.{name}' for name in COUNTER_COLUMNS} & set(added):
+            reconcile_counters()
+        if 'blogs.word_count' in added:
+            backfill(db, Blog.__table__, 'word_count', 'content', count_words)
+        blog_search.ensure_schema()
+        blog_trending.ensure_built(trending_events)
+        rollups.ensure_built()
+
+    from app.commands import register_commands
+    register_commands(app)
 
     # Try loading Google OAuth config from instance/google_oauth.json if env missing
     if not (app.config.get('GOOGLE_CLIENT_ID') and app.config.get('GOOGLE_CLIENT_SECRET')):
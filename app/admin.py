@@ -1,9 +1,11 @@
+from datetime import timedelta
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from sqlalchemy import desc
 from app import db
-from app.models import User, Blog, Comment
+from app.models import User, Blog, blog_views, rollups
 from app.utils import slugify
+from app.feeds import blog_cards
 
 bp = Blueprint('admin', __name__)
 
@@ -22,19 +24,19 @@ def admin_required(f):
 @login_required
 @admin_required
 def panel():
-    # Get stats
-    total_users = User.query.count()
-    total_blogs = Blog.query.count()
-    total_comments = Comment.query.count()
+    # Get stats (daily rollups and view buckets, cached briefly)
+    totals = rollups.totals('users', 'blogs', 'comments')
+    views_7d = rollups.cached('views_7d', lambda: blog_views.total(timedelta(days=7)))
     
     # Recent activity
-    recent_blogs = Blog.query.order_by(desc(Blog.created_at)).limit(10).all()
+    recent_blogs = blog_cards().order_by(desc(Blog.created_at)).limit(10).all()
     recent_users = User.query.order_by(desc(User.created_at)).limit(10).all()
     
     return render_template('admin/panel.html',
-                         total_users=total_users,
-                         total_blogs=total_blogs,
-                         total_comments=total_comments,
+                         total_users=totals['users'],
+                         total_blogs=totals['blogs'],
+                         total_comments=totals['comments'],
+                         views_7d=views_7d,
                          recent_blogs=recent_blogs,
                          recent_users=recent_users)
 
@@ -83,7 +85,7 @@ def manage_blogs():
     page = request.args.get('page', 1, type=int)
     status = request.args.get('status', 'all')
     
-    query = Blog.query
+    query = blog_cards()
     
     if status != 'all':
         query = query.filter_by(status=status)
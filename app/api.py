@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify, url_for, current_app
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
-import os
-from app import db
+from app import db, image_pipeline, http_cache, view_counter
+from image_pipeline import stored_name
 from app.models import Blog, Like, Bookmark, Comment
-from app.utils import is_allowed_file, avatar_static_path
+from app.utils import is_allowed_file, avatar_static_path, render_markdown, slugify
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from keyset import keyset_paginate
+from unique_names import add_unique
+from request_profiler import span
 from datetime import datetime, timezone
 
 bp = Blueprint('api', __name__)
@@ -30,13 +34,10 @@ def like_blog(blog_id):
     
     db.session.commit()
     
-    # Get updated like count
-    like_count = Like.query.filter_by(blog_id=blog_id).count()
-    
     return jsonify({
         'success': True,
         'liked': liked,
-        'like_count': like_count
+        'like_count': blog.like_count
     })
 
 @bp.route('/bookmark/<int:blog_id>', methods=['POST'])
@@ -97,13 +98,24 @@ def add_comment(blog_id):
     })
 
 @bp.route('/comments/<int:blog_id>')
+@http_cache.policy('api')
 def get_comments(blog_id):
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 10
     
-    comments = Comment.query.filter_by(blog_id=blog_id)\
-        .order_by(Comment.created_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
+    # The denormalized counter stands in for a COUNT(*) on every page
+    total = db.session.query(Blog.comment_count).filter_by(id=blog_id).scalar() or 0
+    
+    # Comments are never edited: the count and the newest one identify the thread
+    newest_id, newest_at = db.session.query(func.max(Comment.id), func.max(Comment.created_at)) \
+        .filter(Comment.blog_id == blog_id).one()
+    not_modified = http_cache.validate(blog_id, total, newest_id, last_modified=newest_at)
+    if not_modified is not None:
+        return not_modified
+    comments = keyset_paginate(
+        Comment.query.filter_by(blog_id=blog_id).options(joinedload(Comment.user)),
+        (Comment.created_at, Comment.id), cursor=cursor, per_page=per_page, total=total
+    )
     
     comments_data = []
     for comment in comments.items:
@@ -113,7 +125,7 @@ def get_comments(blog_id):
             'created_at': comment.created_at.isoformat(),
             'user': {
                 'username': comment.user.username,
-                'avatar': comment.user.avatar,
+                'avatar': getattr(comment.user, 'avatar', None),
                 'avatar_url': url_for('static', filename=avatar_static_path(comment.user))
             }
         })
@@ -122,9 +134,25 @@ def get_comments(blog_id):
         'success': True,
         'comments': comments_data,
         'has_next': comments.has_next,
+        'next_cursor': comments.next_cursor,
         'total': comments.total
     })
 
+@bp.route('/blog/<int:blog_id>/live')
+def blog_live(blog_id):
+    """Counts and viewer state for a blog page served as a static snapshot."""
+    blog = db.session.query(Blog.id, Blog.like_count, Blog.views).filter_by(
+        id=blog_id, status='published'
+    ).first_or_404()
+    view_counter.increment(blog.id)
+    response = jsonify({
+        'authenticated': current_user.is_authenticated,
+        'like_count': blog.like_count,
+        'views': (blog.views or 0) + view_counter.pending(blog.id),
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @bp.route('/upload', methods=['POST'])
 @login_required
 def upload_image():
@@ -137,21 +165,39 @@ def upload_image():
         return jsonify({'success': False, 'error': 'No file selected'}), 400
     
     if file and is_allowed_file(file.filename):
-        # Generate unique filename
-        filename = secure_filename(file.filename)
-        unique_filename = f"{current_user.id}_{int(datetime.now().timestamp())}_{filename}"
-        
-        # Save file
-        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
+        # Resized into variants in the background; poll status_url until ready
+        try:
+            with span('save_image'):
+                filename = image_pipeline.submit(file)
+        except ValueError as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
         
-        return jsonify({
-            'success': True,
-            'filename': unique_filename,
-            'url': url_for('static', filename=f'uploads/{unique_filename}')
-        })
+        return jsonify(_upload_response(filename)), 202
     
     return jsonify({'success': False, 'error': 'Invalid file type'}), 400
 
+@bp.route('/upload/<job_id>')
+@login_required
+def upload_status(job_id):
+    status = image_pipeline.status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    
+    return jsonify(_upload_response(stored_name(job_id)))
+
+def _upload_response(filename):
+    job_id = image_pipeline.stem_for(filename)
+    status = image_pipeline.status(job_id)
+    return {
+        'success': status != 'failed',
+        'status': status,
+        'filename': filename,
+        'url': url_for('static', filename=f'uploads/{filename}'),
+        'placeholder_url': url_for('static', filename='images/image-pending.svg'),
+        'srcset': image_pipeline.srcset(filename),
+        'status_url': url_for('api.upload_status', job_id=job_id)
+    }
+
 @bp.route('/update-avatar', methods=['POST'])
 @login_required
 def update_avatar():
@@ -164,22 +210,19 @@ def update_avatar():
         return jsonify({'success': False, 'error': 'No file selected'}), 400
     
     if file and is_allowed_file(file.filename):
-        # Generate unique filename
-        filename = secure_filename(file.filename)
-        unique_filename = f"avatar_{current_user.id}_{int(datetime.now().timestamp())}_{filename}"
-        
-        # Save file
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
+        try:
+            with span('save_image'):
+                filename = image_pipeline.submit(file)
+        except ValueError as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
         
         # Update user avatar
-        current_user.avatar = unique_filename
+        current_user.avatar = filename
         db.session.commit()
         
-        return jsonify({
-            'success': True,
-            'avatar_url': url_for('static', filename=f'uploads/{unique_filename}')
-        })
+        response = _upload_response(filename)
+        response['avatar_url'] = response['url']
+        return jsonify(response), 202
     
     return jsonify({'success': False, 'error': 'Invalid file type'}), 400
 
@@ -194,6 +237,13 @@ def update_bio():
     
     return jsonify({'success': True})
 
+@bp.route('/preview', methods=['POST'])
+@login_required
+def preview():
+    # Server-side render for the editor preview; repeat previews hit the LRU
+    content = (request.json or {}).get('content', '')
+    return jsonify({'success': True, 'html': render_markdown(content)})
+
 @bp.route('/autosave', methods=['POST'])
 @login_required
 def autosave():
@@ -223,12 +273,11 @@ def autosave():
         slug = slugify(title) if title else 'draft-' + str(int(datetime.now().timestamp()))
         blog = Blog(
             title=title or 'Untitled',
-            slug=slug,
             content=content,
             author_id=current_user.id,
             status='draft'
         )
-        db.session.add(blog)
+        add_unique(db.session, blog, Blog.slug, slug)
         message = 'New draft created.'
     
     db.session.commit()
@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, current_user, login_required
 from app import db, oauth
 from app.models import User
 from app.utils import slugify
+from unique_names import add_unique
 import os
 import json
 
@@ -104,9 +105,9 @@ def google_login():
         flash('Google login is not configured. Please set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET.', 'danger')
         return redirect(url_for('auth.login'))
 
-    # Mark session as permanent and ensure it's initialized before OAuth redirect
+    # Mark session as permanent and ensure it's initialized before OAuth redirect,
+    # so the OAuth state survives the round trip to Google
     session.permanent = True
-    current_app.permanent_session_lifetime = current_app.config['PERMANENT_SESSION_LIFETIME']
     # Force session to be created and ensure it's saved
     session['_oauth_init'] = True
     
@@ -174,17 +175,11 @@ def google_callback():
         base_username = slugify(name) if name else (email.split('@')[0])
         username = base_username or f'user_{os.urandom(4).hex()}'
 
-        # Ensure unique username
-        original = username
-        i = 1
-        while User.query.filter_by(username=username).first():
-            username = f"{original}{i}"
-            i += 1
-
-        user = User(username=username, email=email, avatar=picture)
+        user = User(email=email, avatar=picture)
         # Set a random password to satisfy non-null constraint
         user.set_password(os.urandom(16).hex())
-        db.session.add(user)
+        # Ensure unique username (name, name1, name2, ...)
+        add_unique(db.session, user, User.username, username, sep='')
         db.session.commit()
 
     login_user(user, remember=True)
@@ -246,5 +241,7 @@ def google_config():
 @login_required
 def logout():
     logout_user()
+    # Back to a browser-session cookie that is not refreshed on every response
+    session.permanent = False
     flash('You have been logged out.', 'info')
     return redirect(url_for('main.index'))
\ No newline at end of file
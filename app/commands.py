@@ -0,0 +1,77 @@
+"""Flask CLI commands (run with ``flask --app wsgi <command>``)."""
+import click
+
+
+def register_commands(app):
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recompute like/comment counters on every blog."""
+        from app.models import reconcile_counters
+        fixed = reconcile_counters()
+        click.echo(f'Reconciled counters on {fixed} blog(s).')
+
+    @app.cli.command('recompute-trending')
+    def recompute_trending_command():
+        """Rebuild trending scores from likes, comments and view totals."""
+        from app.models import blog_trending, trending_events
+        ranked = blog_trending.rebuild(trending_events())
+        click.echo(f'Recomputed trending scores for {ranked} blog(s).')
+
+    @app.cli.command('rebuild-related')
+    def rebuild_related_command():
+        """Recompute TF-IDF vectors and related stories for every published blog."""
+        from app.models import blog_related
+        indexed = blog_related.rebuild()
+        click.echo(f'Rebuilt related stories for {indexed} blog(s).')
+
+    @app.cli.command('compact-view-buckets')
+    def compact_view_buckets_command():
+        """Roll old hourly view buckets into days and drop expired ones."""
+        from app.models import blog_views
+        removed = blog_views.compact()
+        click.echo(f'Compacted {removed} view bucket row(s).')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute the daily admin rollups from the source tables."""
+        from app.models import rollups
+        written = rollups.rebuild()
+        click.echo(f'Rebuilt {written} rollup row(s).')
+
+    @app.cli.command('reindex-search')
+    def reindex_search_command():
+        """Rebuild the full-text search index for blogs."""
+        from app.models import blog_search
+        blog_search.rebuild()
+        click.echo(f'Rebuilt {blog_search.backend} search index for blogs.')
+
+    @app.cli.command('publish-snapshots')
+    @click.option('--force', is_flag=True, help='Re-render and rewrite every snapshot.')
+    def publish_snapshots_command(force):
+        """Write static HTML for published blogs and feeds whose inputs changed."""
+        from app import snapshots
+        counts = snapshots.build(force=force)
+        click.echo(f"Snapshots: {counts['written']} written, {counts['unchanged']} unchanged, "
+                   f"{counts['removed']} removed (in {snapshots.path}).")
+
+    @app.cli.command('rerender-blogs')
+    @click.option('--all', 'force', is_flag=True, help='Re-render every blog, not just stale ones.')
+    def rerender_blogs_command(force):
+        """Re-render stored Markdown HTML (run after changing allowed tags)."""
+        from app.models import rerender_blogs
+        rewritten = rerender_blogs(force=force)
+        click.echo(f'Re-rendered {rewritten} blog(s).')
+
+    @app.cli.command('process-images')
+    def process_images_command():
+        """Render variants for uploads left unprocessed by a stopped worker."""
+        from app import image_pipeline
+        done = image_pipeline.process_pending()
+        click.echo(f'Processed {done} pending image(s).')
+
+    @app.cli.command('prune-uploads')
+    def prune_uploads_command():
+        """Delete uploaded images no blog refers to any more."""
+        from app import upload_store
+        removed = upload_store.prune()
+        click.echo(f'Removed {removed} unreferenced image(s).')
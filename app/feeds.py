@@ -0,0 +1,66 @@
+"""List-page queries for blogs.
+
+Every card list (home, recent, popular, search, my blogs, profile, admin)
+renders the author, counters, reading time and a short excerpt.
+``blog_cards`` eager-loads the author in the list query itself and swaps the
+Markdown body for a short SQL-side prefix; counts come from the
+denormalized counter columns and the viewer's likes from one IN query, so a
+page of any size costs a fixed number of queries.
+
+Dashboard and profile totals come from one grouped query (``author_stats``)
+over the counter columns, so they cost the same for any number of blogs.
+"""
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import defer, joinedload, load_only, with_expression
+from app import db
+from app.models import Blog, Comment, Like
+
+# Enough characters for the longest excerpt() a card asks for
+PREVIEW_CHARS = 400
+
+def blog_cards(query=None):
+    """Apply feed-card loader options to a Blog query."""
+    if query is None:
+        query = Blog.query
+    return query.options(
+        joinedload(Blog.author),
+        defer(Blog.content),
+        defer(Blog.content_html),
+        with_expression(Blog.content_preview, func.substr(Blog.content, 1, PREVIEW_CHARS)),
+    )
+
+def blog_rows(query=None):
+    """Load only the columns an author's blog list shows (no content)."""
+    if query is None:
+        query = Blog.query
+    return query.options(load_only(
+        Blog.title, Blog.slug, Blog.status, Blog.views, Blog.like_count,
+        Blog.created_at, Blog.updated_at,
+    ))
+
+def author_stats(author_id):
+    """Blog, published, like, view and comment totals for one author, in one query."""
+    comments = select(func.count(Comment.id)).where(Comment.user_id == author_id).scalar_subquery()
+    row = db.session.execute(
+        select(
+            func.count(Blog.id).label('total_blogs'),
+            func.count(case((Blog.status == 'published', 1))).label('published_blogs'),
+            func.coalesce(func.sum(Blog.like_count), 0).label('total_likes'),
+            func.coalesce(func.sum(Blog.views), 0).label('total_views'),
+            comments.label('total_comments'),
+        ).where(Blog.author_id == author_id)
+    ).one()
+    return row._asdict()
+
+def liked_blog_ids(user, blogs):
+    """IDs of the given blogs that ``user`` has liked, in a single query."""
+    ids = [blog.id for blog in blogs]
+    if not ids or not getattr(user, 'is_authenticated', False):
+        return set()
+    return set(db.session.scalars(
+        select(Like.blog_id).where(Like.user_id == user.id, Like.blog_id.in_(ids))
+    ))
+
+def card_tags(blogs):
+    """Page-cache tags for a page showing ``blogs`` with their authors."""
+    return [tag for blog in blogs for tag in (f'post:{blog.id}', f'user:{blog.author_id}')]
@@ -1,66 +1,94 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from sqlalchemy import or_, desc, func
-from app import db
-from app.models import User, Blog, Comment, Like, Bookmark
-from app.utils import slugify, markdown_to_html, estimate_reading_time
-from datetime import datetime, timezone
+from sqlalchemy import desc, func
+from app import db, page_cache, http_cache, view_counter, snapshots
+from app.models import User, Blog, Comment, Like, Bookmark, blog_search, blog_trending, blog_views, blog_related, \
+    COUNTER_COLUMNS
+from app.feeds import blog_cards, blog_rows, author_stats, liked_blog_ids, card_tags
+from sqlalchemy.orm import joinedload
+from app.utils import slugify, estimate_reading_time
+from keyset import keyset_paginate, approximate_count
+from unique_names import add_unique
+from static_snapshots import Page, rendering
+from datetime import datetime, timedelta, timezone
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
+@page_cache.cached
+@http_cache.policy('feed')
 def index():
     # Featured blogs
-    featured_blogs = Blog.query.filter_by(
+    featured_blogs = blog_cards().filter_by(
         status='published', 
         featured=True
     ).order_by(desc(Blog.created_at)).limit(3).all()
+    page_cache.tag('posts', *card_tags(featured_blogs))
     
     return render_template('index.html', 
-                         featured_blogs=featured_blogs)
+                         featured_blogs=featured_blogs,
+                         liked_ids=liked_blog_ids(current_user, featured_blogs))
 
 @bp.route('/recent-stories')
+@page_cache.cached
+@http_cache.policy('feed')
 def recent_stories():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
     # Recent blogs
-    recent_blogs = Blog.query.filter_by(
-        status='published'
-    ).order_by(desc(Blog.created_at)).paginate(
-        page=page, per_page=12, error_out=False
+    recent_blogs = keyset_paginate(
+        blog_cards().filter_by(status='published'),
+        (Blog.created_at, Blog.id), cursor=cursor, per_page=12
     )
+    page_cache.tag('posts', *card_tags(recent_blogs.items))
     
     return render_template('blog/recent_stories.html', 
-                         recent_blogs=recent_blogs)
+                         recent_blogs=recent_blogs,
+                         liked_ids=liked_blog_ids(current_user, recent_blogs.items))
 
 @bp.route('/popular-stories')
+@page_cache.cached
+@http_cache.policy('feed')
 def popular_stories():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
-    # Popular blogs (by views)
-    popular_blogs = Blog.query.filter_by(
-        status='published'
-    ).order_by(desc(Blog.views)).paginate(
-        page=page, per_page=12, error_out=False
+    # Trending blogs: one range read of the leaderboard, then the cards by id
+    board = blog_trending.table
+    popular_blogs = keyset_paginate(
+        blog_trending.ranked().join(Blog, Blog.id == board.c.item_id).filter(Blog.status == 'published'),
+        blog_trending.keys, cursor=cursor, per_page=12
     )
+    popular_blogs.items = blog_trending.load(blog_cards(), [row.item_id for row in popular_blogs.items])
+    page_cache.tag('posts', *card_tags(popular_blogs.items))
     
     return render_template('blog/popular_stories.html', 
-                         popular_blogs=popular_blogs)
+                         popular_blogs=popular_blogs,
+                         liked_ids=liked_blog_ids(current_user, popular_blogs.items))
 
 @bp.route('/blog/<slug>')
+@page_cache.cached
+@http_cache.policy('page')
 def blog(slug):
-    blog = Blog.query.filter_by(slug=slug, status='published').first_or_404()
+    # Revalidation needs only the blog's and its author's timestamps and counters
+    stamp = db.session.query(
+        Blog.id, Blog.updated_at, User.updated_at, *(getattr(Blog, name) for name in COUNTER_COLUMNS)
+    ).join(User, User.id == Blog.author_id).filter(
+        Blog.slug == slug, Blog.status == 'published'
+    ).first_or_404()
+    not_modified = http_cache.validate(*stamp, last_modified=stamp[1])
+    if not_modified is not None:
+        view_counter.increment(stamp.id)
+        return not_modified
     
-    # Increment views
-    blog.views = (blog.views or 0) + 1
-    db.session.commit()
+    blog = Blog.query.options(joinedload(Blog.author)).filter_by(id=stamp.id).one()
+    
+    # Increment views (buffered, flushed in batches; a snapshot counts its views through blog_live)
+    if not rendering():
+        blog.increment_views()
+        page_cache.replay('view', blog.id)
     
-    # Get related blogs
-    related_blogs = Blog.query.filter(
-        Blog.status == 'published',
-        Blog.id != blog.id,
-        Blog.tags.contains(blog.tags.split(',')[0]) if blog.tags else True
-    ).limit(3).all()
+    # Blogs closest in wording and tags, looked up from the precomputed table
+    related_blogs = blog_related.load(blog_cards().filter(Blog.status == 'published'), blog.id, 3)
     
     # Check if user liked/bookmarked
     is_liked = False
@@ -75,8 +103,9 @@ def blog(slug):
             user_id=current_user.id
         ).first() is not None
     
-    # Convert markdown to HTML
-    blog.content_html = markdown_to_html(blog.content)
+    # Rendered at save time; rows saved before that are rendered once here
+    blog.ensure_rendered()
+    page_cache.tag(*card_tags([blog]), *card_tags(related_blogs))
     
     return render_template('blog/blog.html', 
                          blog=blog,
@@ -87,28 +116,35 @@ def blog(slug):
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    # User's blogs
-    user_blogs = Blog.query.filter_by(
+    # User's most recently edited blogs (the dashboard shows five)
+    user_blogs = blog_rows().filter_by(
         author_id=current_user.id
-    ).order_by(desc(Blog.updated_at)).all()
+    ).order_by(desc(Blog.updated_at)).limit(5).all()
     
-    # Stats
-    total_blogs = len(user_blogs)
-    published_blogs = len([b for b in user_blogs if b.status == 'published'])
-    total_likes = sum(blog.likes.count() for blog in user_blogs)
-    total_views = sum(blog.views for blog in user_blogs)
+    # Stats, from one grouped query over the counter columns
+    stats = author_stats(current_user.id)
+    own_blogs = blog_rows().filter_by(author_id=current_user.id)
+    most_viewed = own_blogs.order_by(desc(Blog.views), Blog.id).first()
+    most_liked = own_blogs.order_by(desc(Blog.like_count), Blog.id).first()
+    views_7d = blog_views.total(timedelta(days=7), Blog.author_id == current_user.id)
     
-    # Bookmarks
+    # Bookmarks, with the bookmarked blog and its author in the same query
     bookmarks = Bookmark.query.filter_by(
         user_id=current_user.id
+    ).options(
+        joinedload(Bookmark.blog).load_only(Blog.title, Blog.slug, Blog.author_id)
+        .joinedload(Blog.author)
     ).order_by(desc(Bookmark.created_at)).limit(10).all()
     
     return render_template('blog/dashboard.html',
                          user_blogs=user_blogs,
-                         total_blogs=total_blogs,
-                         published_blogs=published_blogs,
-                         total_likes=total_likes,
-                         total_views=total_views,
+                         total_blogs=stats['total_blogs'],
+                         published_blogs=stats['published_blogs'],
+                         total_likes=stats['total_likes'],
+                         total_views=stats['total_views'],
+                         views_7d=views_7d,
+                         most_viewed=most_viewed,
+                         most_liked=most_liked,
                          bookmarks=bookmarks)
 
 
@@ -118,17 +154,8 @@ def duplicate(blog_id):
     # Allow authors to quickly duplicate a blog as a draft
     blog = Blog.query.filter_by(id=blog_id, author_id=current_user.id).first_or_404()
 
-    # Generate a unique slug for the copied blog
-    slug = slugify(blog.title)
-    counter = 1
-    original_slug = slug
-    while Blog.query.filter_by(slug=slug).first():
-        slug = f"{original_slug}-{counter}"
-        counter += 1
-
     new_blog = Blog(
         title=f"{blog.title} (Copy)",
-        slug=slug,
         content=blog.content,
         tags=blog.tags,
         author_id=current_user.id,
@@ -136,7 +163,8 @@ def duplicate(blog_id):
         excerpt=blog.excerpt
     )
 
-    db.session.add(new_blog)
+    # Give the copy the next free slug after the original's
+    add_unique(db.session, new_blog, Blog.slug, slugify(blog.title))
     db.session.commit()
 
     flash('Draft copied. You can edit the copy now.', 'success')
@@ -175,24 +203,15 @@ def editor(blog_id=None):
             message = 'Blog updated successfully!'
         else:
             # Create new blog
-            slug = slugify(title)
-            counter = 1
-            original_slug = slug
-            
-            while Blog.query.filter_by(slug=slug).first():
-                slug = f"{original_slug}-{counter}"
-                counter += 1
-            
             blog = Blog(
                 title=title,
-                slug=slug,
                 content=content,
                 tags=tags,
                 author_id=current_user.id,
                 status=status,
                 excerpt=content[:200] + '...' if len(content) > 200 else content
             )
-            db.session.add(blog)
+            add_unique(db.session, blog, Blog.slug, slugify(title))
             message = 'Blog saved successfully!'
         
         db.session.commit()
@@ -206,28 +225,31 @@ def editor(blog_id=None):
     return render_template('blog/editor.html', blog=blog)
 
 @bp.route('/profile/<username>')
+@page_cache.cached
+@http_cache.policy('feed')
 def profile(username):
     user = User.query.filter_by(username=username).first_or_404()
     
     # Get user's published blogs
-    published_blogs = Blog.query.filter_by(
+    published_blogs = blog_cards().filter_by(
         author_id=user.id, 
         status='published'
     ).order_by(desc(Blog.created_at)).all()
     
     # Get user stats
-    total_blogs = Blog.query.filter_by(author_id=user.id).count()
-    total_likes = db.session.query(func.count(Like.id)).join(Blog).filter(
-        Blog.author_id == user.id
-    ).scalar() or 0
+    stats = author_stats(user.id)
+    page_cache.tag(f'user:{user.id}', *card_tags(published_blogs))
     
     return render_template('user/profile.html',
                          user=user,
                          published_blogs=published_blogs,
-                         total_blogs=total_blogs,
-                         total_likes=total_likes)
+                         total_blogs=stats['total_blogs'],
+                         total_likes=stats['total_likes'],
+                         total_comments=stats['total_comments'])
 
 @bp.route('/search')
+@page_cache.cached
+@http_cache.policy('feed')
 def search():
     query = request.args.get('q', '').strip()
     page = request.args.get('page', 1, type=int)
@@ -235,17 +257,18 @@ def search():
     if not query:
         return redirect(url_for('main.index'))
     
-    # Search in title, content, and tags
-    search_results = Blog.query.filter(
-        Blog.status == 'published',
-        or_(
-            Blog.title.ilike(f'%{query}%'),
-            Blog.content.ilike(f'%{query}%'),
-            Blog.tags.ilike(f'%{query}%')
-        )
-    ).order_by(desc(Blog.created_at)).paginate(
-        page=page, per_page=10, error_out=False
+    # Ranked full-text match on title, tags and content. Relevance has no
+    # stable key to seek on, so this stays OFFSET-paged, but the total comes
+    # from a short-lived cache instead of a COUNT(*) per page.
+    matches = blog_search.search(blog_cards().filter(Blog.status == 'published'), query)
+    search_results = matches.order_by(desc(Blog.created_at)).paginate(
+        page=page, per_page=10, error_out=False, count=False
     )
+    search_results.total = approximate_count(
+        ('blog-search', query.lower()), matches,
+        ttl=current_app.config['PAGINATION_COUNT_TTL']
+    )
+    page_cache.tag('posts')
     
     return render_template('search.html', 
                          query=query,
@@ -254,12 +277,11 @@ def search():
 @bp.route('/my-blogs')
 @login_required
 def my_blogs():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
-    blogs = Blog.query.filter_by(
-        author_id=current_user.id
-    ).order_by(desc(Blog.updated_at)).paginate(
-        page=page, per_page=10, error_out=False
+    blogs = keyset_paginate(
+        blog_cards().filter_by(author_id=current_user.id),
+        (Blog.updated_at, Blog.id), cursor=cursor, per_page=10
     )
     
     return render_template('blog/my_blogs.html', blogs=blogs)
@@ -275,4 +297,21 @@ def delete_blog(blog_id):
     db.session.delete(blog)
     db.session.commit()
     flash('Blog deleted successfully.', 'success')
-    return redirect(url_for('main.my_blogs'))
\ No newline at end of file
+    return redirect(url_for('main.my_blogs'))
+
+# Static snapshots (see static_snapshots.py): blog pages, the home page and recent stories
+@snapshots.source('blogs')
+def blog_snapshots(ids):
+    query = db.session.query(Blog.id, Blog.slug, Blog.updated_at, User.updated_at, Blog.comment_count) \
+        .join(User, User.id == Blog.author_id).filter(Blog.status == 'published')
+    if ids is not None:
+        query = query.filter(Blog.id.in_(ids))
+    for row in query:
+        # Views are refreshed by the page's blog_live call
+        yield Page(row.id, url_for('main.blog', slug=row.slug), f'blog/{row.slug}/index.html',
+                   stamp=tuple(row[2:]))
+
+@snapshots.source('feeds')
+def feed_snapshots(keys):
+    yield Page('index', url_for('main.index'), 'index.html')
+    yield Page('recent', url_for('main.recent_stories'), 'recent-stories/index.html')
@@ -1,7 +1,16 @@
 from datetime import datetime, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from app import db, login_manager
+from sqlalchemy import bindparam, column, event, func, inspect, literal, or_, select, table
+from sqlalchemy.orm import query_expression
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db, login_manager, view_counter, upload_store, page_cache, snapshots
+from app.utils import content_digest, count_words, render_markdown
+from related_posts import RelatedIndex
+from rollups import DailyRollups
+from search_index import SearchIndex
+from trending import TrendingBoard
+from view_buckets import ViewBuckets
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -49,6 +58,13 @@ class Blog(db.Model):
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), unique=True, nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
+    # Sanitized HTML rendered from `content`, plus the digest it was rendered from
+    content_html = db.Column(db.Text)
+    content_hash = db.Column(db.String(64))
+    # Kept in sync with content on save so list pages can skip loading the body
+    word_count = db.Column(db.Integer)
+    # Filled by feed queries (app/feeds.py) with the start of content
+    content_preview = query_expression()
     excerpt = db.Column(db.String(300))
     cover_image = db.Column(db.String(200))
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -59,6 +75,10 @@ class Blog(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
                           onupdate=lambda: datetime.now(timezone.utc))
     
+    # Denormalized counters, maintained by the Like/Comment mapper events below
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    
     # Relationships
     comments = db.relationship('Comment', backref='blog', lazy='dynamic',
                               cascade='all, delete-orphan')
@@ -69,9 +89,56 @@ class Blog(db.Model):
     # Tags (simple implementation)
     tags = db.Column(db.String(500))
     
+    # Seek indexes for the keyset-paginated feeds (see keyset.py)
+    __table_args__ = (
+        db.Index('ix_blogs_status_created', 'status', 'created_at', 'id'),
+        db.Index('ix_blogs_status_views', 'status', 'views', 'id'),
+        db.Index('ix_blogs_author_updated', 'author_id', 'updated_at', 'id'),
+    )
+    
+    @property
+    def reading_time(self):
+        """Reading time in minutes (same rule as estimate_reading_time)."""
+        words = self.word_count if self.word_count is not None else count_words(self.content)
+        return max(1, words // 200)
+    
+    @property
+    def preview_text(self):
+        """Start of the content for cards, without loading the body in feeds."""
+        return self.content_preview if self.content_preview is not None else (self.content or '')
+    
+    def render_content(self):
+        """Re-render content_html if the markdown (or renderer) changed."""
+        digest = content_digest(self.content)
+        if self.content_html is None or self.content_hash != digest:
+            self.content_html = render_markdown(self.content, digest)
+            self.content_hash = digest
+    
+    def ensure_rendered(self):
+        """Return content_html, backfilling rows saved before it was stored.
+        
+        The backfill bypasses the ORM so it does not bump updated_at, and
+        commits on its own connection so it never commits (or expires) the
+        request's session.
+        """
+        digest = content_digest(self.content)
+        if self.content_html is None or self.content_hash != digest:
+            html = render_markdown(self.content, digest)
+            with db.engine.begin() as conn:
+                conn.execute(_blog_rendered.update().where(
+                    _blog_rendered.c.id == self.id
+                ).values(content_html=html, content_hash=digest))
+            set_committed_value(self, 'content_html', html)
+            set_committed_value(self, 'content_hash', digest)
+        return self.content_html
+    
     def increment_views(self):
-        self.views = (self.views or 0) + 1
-        db.session.commit()
+        view_counter.increment(self.id)
+
+    @property
+    def view_count(self):
+        """Stored views plus views still buffered by the view counter."""
+        return (self.views or 0) + view_counter.pending(self.id)
     
     def __repr__(self):
         return f'<Blog {self.title}>'
@@ -87,6 +154,8 @@ class Comment(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
                           onupdate=lambda: datetime.now(timezone.utc))
     
+    __table_args__ = (db.Index('ix_comments_blog_created', 'blog_id', 'created_at', 'id'),)
+    
     def __repr__(self):
         return f'<Comment {self.id}>'
 
@@ -118,6 +187,170 @@ class Bookmark(db.Model):
     def __repr__(self):
         return f'<Bookmark blog:{self.blog_id} user:{self.user_id}>'
 
+# Counter maintenance. A lightweight table() is used on purpose so these
+# UPDATEs do not fire Blog.updated_at's onupdate.
+COUNTER_COLUMNS = ('like_count', 'comment_count')
+_blog_counters = table('blogs', column('id'), *(column(name) for name in COUNTER_COLUMNS))
+
+def _adjust_counters(connection, blog_id, **deltas):
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas or blog_id is None:
+        return
+    connection.execute(
+        _blog_counters.update()
+        .where(_blog_counters.c.id == blog_id)
+        .values({name: _blog_counters.c[name] + delta for name, delta in deltas.items()})
+    )
+
+@event.listens_for(Like, 'after_insert')
+def _like_inserted(mapper, connection, target):
+    _adjust_counters(connection, target.blog_id, like_count=1)
+
+@event.listens_for(Like, 'after_delete')
+def _like_deleted(mapper, connection, target):
+    _adjust_counters(connection, target.blog_id, like_count=-1)
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, target):
+    _adjust_counters(connection, target.blog_id, comment_count=1)
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    _adjust_counters(connection, target.blog_id, comment_count=-1)
+
+def reconcile_counters():
+    """Recompute every blog's counters from the likes/comments tables.
+
+    Only rows whose stored counters drifted are rewritten. Returns the number
+    of blogs that were corrected.
+    """
+    likes = Like.__table__
+    comments = Comment.__table__
+    counts = {
+        'like_count': select(func.count()).select_from(likes)
+            .where(likes.c.blog_id == _blog_counters.c.id).scalar_subquery(),
+        'comment_count': select(func.count()).select_from(comments)
+            .where(comments.c.blog_id == _blog_counters.c.id).scalar_subquery(),
+    }
+    drifted = or_(*(_blog_counters.c[name] != expr for name, expr in counts.items()))
+    result = db.session.execute(_blog_counters.update().where(drifted).values(counts))
+    db.session.commit()
+    return result.rowcount
+
+# Render published blogs at write time instead of on every page view
+_blog_rendered = table('blogs', column('id'), column('content'),
+                       column('content_html'), column('content_hash'))
+
+@event.listens_for(Blog, 'before_insert')
+@event.listens_for(Blog, 'before_update')
+def _render_on_save(mapper, connection, target):
+    if target.word_count is None or inspect(target).attrs.content.history.has_changes():
+        target.word_count = count_words(target.content)
+    if target.status == 'published':
+        target.render_content()
+
+def rerender_blogs(force=False, batch_size=200):
+    """Re-render stored HTML for blogs whose digest is stale (or all of them).
+    
+    Walks the table in id order in batches so memory stays flat. Returns the
+    number of rows rewritten.
+    """
+    t = _blog_rendered
+    last_id, rewritten = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(t.c.id, t.c.content, t.c.content_hash)
+            .where(t.c.id > last_id).order_by(t.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return rewritten
+        last_id = rows[-1].id
+        updates = []
+        for row in rows:
+            digest = content_digest(row.content)
+            if force or row.content_hash != digest:
+                updates.append({'row_id': row.id, 'html': render_markdown(row.content, digest),
+                                'digest': digest})
+        if updates:
+            db.session.execute(
+                t.update().where(t.c.id == bindparam('row_id'))
+                .values(content_html=bindparam('html'), content_hash=bindparam('digest')),
+                updates
+            )
+            db.session.commit()
+            rewritten += len(updates)
+
+# Full-text index over blog title/tags/content (FTS5 or tsvector)
+blog_search = SearchIndex(db, Blog)
+
+# Uploaded images referenced by these columns are kept; the rest can be pruned
+upload_store.track(Blog.cover_image)
+upload_store.track(Blog.content)
+
+# Decayed view/like/comment scores behind the popular stories page
+blog_trending = TrendingBoard(db, Blog)
+
+# When views happened (hourly, then daily), for windowed statistics
+blog_views = ViewBuckets(db, Blog)
+
+# Precomputed TF-IDF neighbours behind the related stories on a blog page
+blog_related = RelatedIndex(db, Blog, fields={Blog.title: 2.0, Blog.content: 1.0},
+                            tags=Blog.tags, where={Blog.status: 'published'})
+
+# Anonymous page cache: tags purged when these rows change
+page_cache.track(Blog, lambda blog: {'posts', f'post:{blog.id}', f'user:{blog.author_id}'})
+page_cache.track(Comment, lambda comment: {f'post:{comment.blog_id}'})
+page_cache.track(Like, lambda like: {f'post:{like.blog_id}'})
+page_cache.track(User, lambda user: {f'user:{user.id}'})
+
+# Static snapshots of blog and feed pages (sources are registered in app/main.py)
+snapshots.track(Blog, lambda blog: {('blogs', blog.id), ('feeds', None)})
+snapshots.track(Comment, lambda comment: {('blogs', comment.blog_id)})
+
+# Daily counts behind the admin panel
+rollups = DailyRollups(db)
+rollups.track('users', User, User.created_at)
+rollups.track('blogs', Blog, Blog.created_at)
+rollups.track('published', Blog, Blog.created_at, where={Blog.status: 'published'})
+rollups.track('comments', Comment, Comment.created_at)
+rollups.track('likes', Like, Like.created_at)
+
+@event.listens_for(Like, 'after_insert')
+def _like_trending(mapper, connection, target):
+    blog_trending.record(connection, 'like', {target.blog_id: 1}, target.created_at)
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_trending(mapper, connection, target):
+    blog_trending.record(connection, 'comment', {target.blog_id: 1}, target.created_at)
+
+@view_counter.on_flush
+def _views_flushed(connection, counts):
+    blog_views.record(connection, counts)
+    blog_trending.record(connection, 'view', counts)
+
+def trending_events():
+    """Every recorded event as ``(blog_id, kind, when, n)`` for ``blog_trending.rebuild``.
+    
+    Views come from the view buckets; views from before the buckets existed
+    count as of when the blog was created.
+    """
+    likes = Like.__table__
+    comments = Comment.__table__
+    blogs = Blog.__table__
+    bucketed = blog_views.totals(None)
+    queries = (
+        select(likes.c.blog_id, literal('like'), likes.c.created_at, literal(1)),
+        select(comments.c.blog_id, literal('comment'), comments.c.created_at, literal(1)),
+        select(blogs.c.id, literal('view'), blogs.c.created_at,
+               blogs.c.views - func.coalesce(bucketed.c.views, 0))
+            .outerjoin(bucketed, bucketed.c.item_id == blogs.c.id)
+            .where(blogs.c.views > func.coalesce(bucketed.c.views, 0)),
+    )
+    for query in queries:
+        for row in db.session.execute(query.execution_options(yield_per=1000)):
+            yield tuple(row)
+    yield from blog_views.events()
+
 @login_manager.user_loader
 def load_user(id):
     return User.query.get(int(id))
\ No newline at end of file
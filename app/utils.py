@@ -1,9 +1,31 @@
 import re
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from flask import current_app
 import os
 import markdown
 from bleach import clean
+from request_profiler import span
+
+# Markdown renderer settings. Editing these changes RENDER_VERSION, which marks
+# every stored Blog.content_html as stale (see `flask rerender-blogs`).
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables']
+ALLOWED_TAGS = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em',
+                'blockquote', 'code', 'pre', 'ul', 'ol', 'li', 'a', 'img',
+                'br', 'hr', 'table', 'thead', 'tbody', 'tr', 'th', 'td']
+ALLOWED_ATTRS = {
+    'a': ['href', 'title'],
+    'img': ['src', 'alt', 'title']
+}
+RENDER_VERSION = hashlib.sha256(
+    repr((MARKDOWN_EXTENSIONS, ALLOWED_TAGS, sorted(ALLOWED_ATTRS.items()))).encode('utf-8')
+).hexdigest()[:12]
+
+RENDER_CACHE_SIZE = 256
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
 
 def slugify(text):
     """Convert text to URL-friendly slug."""
@@ -18,6 +40,10 @@ def format_date(date, format='%B %d, %Y'):
         return ''
     return date.strftime(format)
 
+def count_words(content):
+    """Number of whitespace-separated words in content."""
+    return len((content or '').split())
+
 def estimate_reading_time(content):
     """Estimate reading time in minutes."""
     words_per_minute = 200
@@ -33,15 +59,30 @@ def excerpt(content, length=200):
 
 def markdown_to_html(content):
     """Convert markdown to safe HTML."""
-    html = markdown.markdown(content, extensions=['fenced_code', 'tables'])
-    allowed_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em', 
-                   'blockquote', 'code', 'pre', 'ul', 'ol', 'li', 'a', 'img', 
-                   'br', 'hr', 'table', 'thead', 'tbody', 'tr', 'th', 'td']
-    allowed_attrs = {
-        'a': ['href', 'title'],
-        'img': ['src', 'alt', 'title']
-    }
-    return clean(html, tags=allowed_tags, attributes=allowed_attrs)
+    with span('markdown'):
+        html = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS)
+    with span('sanitize_html'):
+        return clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS)
+
+def content_digest(content):
+    """Hash of markdown source plus renderer settings (stored as Blog.content_hash)."""
+    return hashlib.sha256(f'{RENDER_VERSION}:{content or ""}'.encode('utf-8')).hexdigest()
+
+def render_markdown(content, digest=None):
+    """markdown_to_html with an LRU of recent output keyed by content digest."""
+    digest = digest or content_digest(content)
+    with _render_cache_lock:
+        html = _render_cache.get(digest)
+        if html is not None:
+            _render_cache.move_to_end(digest)
+            return html
+
+    html = markdown_to_html(content or '')
+    with _render_cache_lock:
+        _render_cache[digest] = html
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return html
 
 def is_allowed_file(filename):
     """Check if file extension is allowed."""
@@ -0,0 +1,192 @@
+"""Synthetic, reproducible blog data for benchmarks.
+
+``generate`` builds plain row dicts for either schema: ``'root'`` (app.py /
+database.py: UUID ids, categories, threaded comments) or ``'package'`` (the
+``app/`` blueprints: integer ids, bookmarks, Markdown source). Sizes and the
+random seed are parameters, so two runs with the same arguments produce the
+same rows.
+
+The shape tries to look like a real site rather than uniform noise: post
+lengths vary widely, a few authors write most posts, likes and comments
+pile up on a minority of popular posts, about a third of comments are
+replies, and timestamps spread over the last 90 days.
+
+``load`` bulk-inserts the rows with Core ``executemany`` (mapper events do
+not fire) and then rebuilds what those events would have maintained:
+counters, rendered HTML, rollups, trending scores and related posts.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+WORDS = (
+    'python flask database query index cache latency request template session '
+    'server deploy worker queue memory profile benchmark design pattern test '
+    'release feature bug review team product user growth travel food health '
+    'morning coffee city mountain river garden music film book story idea '
+    'simple fast small large early late better clear quiet bright'
+).split()
+TAGS = ('python', 'flask', 'sql', 'devops', 'travel', 'food', 'health', 'career', 'design', 'music')
+HISTORY = timedelta(days=90)
+
+
+class Sizes:
+    def __init__(self, users=200, posts=2000, comments=10000, likes=20000, bookmarks=3000):
+        self.users = users
+        self.posts = posts
+        self.comments = comments
+        self.likes = likes
+        self.bookmarks = bookmarks
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _sentence(rng, low=6, high=18):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+def markdown_body(rng):
+    """A Markdown post: headings, paragraphs, lists, a link, sometimes code."""
+    # Log-normal paragraph counts: most posts are short, a few are very long
+    paragraphs = max(1, min(60, int(rng.lognormvariate(1.6, 0.7))))
+    blocks = []
+    for i in range(paragraphs):
+        if i and i % 4 == 0:
+            blocks.append('## ' + _sentence(rng, 2, 5).rstrip('.'))
+        kind = rng.random()
+        if kind < 0.12:
+            blocks.append('\n'.join(f'- {_sentence(rng, 3, 8)}' for _ in range(rng.randint(2, 6))))
+        elif kind < 0.18:
+            blocks.append('```python\n' + '\n'.join(
+                f'{rng.choice(WORDS)} = {rng.choice(WORDS)}({rng.randint(0, 99)})'
+                for _ in range(rng.randint(2, 8))) + '\n```')
+        else:
+            text = ' '.join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+            if kind > 0.9:
+                text += f' See [{rng.choice(WORDS)}](https://example.com/{rng.choice(WORDS)}).'
+            blocks.append(text)
+    return '\n\n'.join(blocks)
+
+
+def _html(markdown_text):
+    import markdown
+    return markdown.markdown(markdown_text, extensions=['fenced_code'])
+
+
+def _skewed(rng, n):
+    """Index in ``range(n)`` with a long-tailed (Zipf-like) popularity."""
+    return min(n - 1, int(n * rng.random() ** 3))
+
+
+def generate(flavor, sizes, seed=1, password_hash='x', categories=()):
+    """Rows for each table as ``{table_name: [row, ...]}``, in insert order.
+
+    ``categories`` are existing category ids (root schema only).
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    root = flavor == 'root'
+
+    def new_id(i):
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4)) if root else i + 1
+
+    def moment(after=None):
+        start = after or now - HISTORY
+        return start + (now - start) * rng.random()
+
+    users = []
+    for i in range(sizes.users):
+        user = {'id': new_id(i), 'username': f'user{i}', 'email': f'user{i}@example.com',
+                'password_hash': password_hash, 'bio': _sentence(rng), 'created_at': moment()}
+        user['role'] = ('admin' if i == 0 else 'user') if root else ('admin' if i == 0 else 'reader')
+        users.append(user)
+
+    posts = []
+    for i in range(sizes.posts):
+        author = users[_skewed(rng, len(users))]
+        created = moment(author['created_at'])
+        body = markdown_body(rng)
+        title = _sentence(rng, 3, 8).rstrip('.')
+        published = rng.random() < 0.85
+        post = {
+            'id': new_id(i), 'title': title, 'slug': f'post-{i}', 'excerpt': _sentence(rng)[:300],
+            'tags': ','.join(rng.sample(TAGS, rng.randint(1, 3))), 'views': int(rng.paretovariate(1.2) * 20),
+            'created_at': created, 'updated_at': created, 'word_count': len(body.split()),
+        }
+        if root:
+            post.update(content=_html(body), user_id=author['id'], category_id=rng.choice(categories),
+                        is_published=published, published_at=created if published else None)
+        else:
+            post.update(content=body, author_id=author['id'],
+                        status='published' if published else 'draft', featured=rng.random() < 0.02)
+        posts.append(post)
+    post_key = 'post_id' if root else 'blog_id'
+
+    comments = []
+    by_post = {}
+    for i in range(sizes.comments):
+        post = posts[_skewed(rng, len(posts))]
+        created = moment(post['created_at'])
+        comment = {'id': new_id(i), 'content': _sentence(rng, 4, 40), post_key: post['id'],
+                   'user_id': rng.choice(users)['id'], 'created_at': created, 'updated_at': created}
+        if root:
+            siblings = by_post.setdefault(post['id'], [])
+            comment['is_approved'] = rng.random() < 0.9
+            comment['parent_id'] = rng.choice(siblings) if siblings and rng.random() < 0.35 else None
+            siblings.append(comment['id'])
+        comments.append(comment)
+
+    def pairs(count, extra):
+        seen, rows = set(), []
+        for _ in range(count * 3):
+            if len(rows) >= count:
+                break
+            key = (users[rng.randrange(len(users))]['id'], posts[_skewed(rng, len(posts))]['id'])
+            if key not in seen:
+                seen.add(key)
+                rows.append({'id': new_id(len(rows)), 'user_id': key[0], post_key: key[1],
+                             'created_at': moment(), **extra})
+        return rows
+
+    tables = {'users': users, 'posts' if root else 'blogs': posts, 'comments': comments,
+              'likes': pairs(sizes.likes, {})}
+    if not root:
+        tables['bookmarks'] = pairs(sizes.bookmarks, {})
+    return tables
+
+
+def load(flavor, db, sizes, seed=1, batch_size=1000):
+    """Insert a generated dataset into the app's database and rebuild derived data.
+
+    Must run inside an app context. Returns ``{table: rows}``.
+    """
+    from sqlalchemy import select
+    if flavor == 'root':
+        from database import Category, category_cache, post_related, post_trending, reconcile_counters, \
+            rollups, trending_events
+        categories = list(db.session.execute(select(Category.id)).scalars())
+    else:
+        from app.models import blog_related as post_related, blog_trending as post_trending, \
+            reconcile_counters, rerender_blogs, rollups, trending_events
+        categories = ()
+
+    from werkzeug.security import generate_password_hash
+    tables = generate(flavor, sizes, seed, generate_password_hash('benchmark'), categories)
+    metadata = db.metadata
+    for name, rows in tables.items():
+        # Replies point at earlier comments, so rows go in generation order
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(metadata.tables[name].insert(), rows[start:start + batch_size])
+        db.session.commit()
+
+    reconcile_counters()
+    if flavor == 'package':
+        rerender_blogs(force=True)
+    else:
+        category_cache.invalidate()
+    rollups.rebuild()
+    post_trending.rebuild(trending_events())
+    post_related.rebuild()
+    return {name: len(rows) for name, rows in tables.items()}
@@ -0,0 +1,159 @@
+"""Peak memory and latency of image uploads, to size web workers.
+
+Each case runs in a fresh interpreter, because peak RSS (``ru_maxrss``) only
+ever grows within a process (and on Linux is inherited from the parent, so
+the parent never touches pixel data itself). A child builds the package app with
+``IMAGE_WORKERS=0`` so the resize happens inside the measured process,
+records its peak RSS once the app is warm, posts one upload through the
+test client and reports how much the peak grew. The ``inline-thumbnail``
+case replays the old ``save_image`` (full decode, then thumbnail) on the
+same photo for comparison.
+
+    python benchmarks/image_uploads.py [--json results.json]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (case, width, height, format)
+CASES = (
+    ('jpeg-12mp', 4032, 3024, 'JPEG'),
+    ('jpeg-24mp', 6000, 4000, 'JPEG'),
+    ('png-6mp', 3000, 2000, 'PNG'),
+    ('inline-thumbnail', 4032, 3024, 'JPEG'),
+)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def make_image(path, width, height, fmt):
+    from PIL import Image
+
+    # Smooth gradients plus grain compress like a photo, unlike pure noise
+    base = Image.linear_gradient('L').resize((width, height))
+    grain = Image.effect_noise((width, height), 24)
+    img = Image.merge('RGB', (base, grain, Image.blend(base, grain, 0.5)))
+    img.save(path, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+
+
+def run_child(case, path):
+    sys.path.insert(0, ROOT)
+    from config import Config
+    from app import create_app, db
+    from app.models import User
+
+    workdir = tempfile.mkdtemp(prefix='bench-images-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        IMAGE_WORKERS = 0
+        VIEW_COUNTER_FLUSH_INTERVAL = 0
+        WTF_CSRF_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    client.get('/')
+
+    # The multipart body is written to disk and streamed in as wsgi.input,
+    # the way a server hands it over, so the client adds no memory of its own
+    boundary = 'bench-boundary'
+    body_path = os.path.join(workdir, 'body')
+    with open(body_path, 'wb') as body, open(path, 'rb') as fh:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="image"; '
+                   f'filename="{os.path.basename(path)}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        for chunk in iter(lambda: fh.read(64 * 1024), b''):
+            body.write(chunk)
+        body.write(f'\r\n--{boundary}--\r\n'.encode())
+    baseline = peak_rss_mb()
+
+    start = time.perf_counter()
+    if case == 'inline-thumbnail':
+        from PIL import Image
+        with open(path, 'rb') as fh:
+            img = Image.open(io.BytesIO(fh.read()))
+            img.thumbnail((1200, 800), Image.Resampling.LANCZOS)
+            img.convert('RGB').save(os.path.join(workdir, 'out.jpg'), 'JPEG', quality=85)
+        status = 200
+    else:
+        with open(body_path, 'rb') as body:
+            status = client.post(
+                '/api/upload', input_stream=body, content_length=os.path.getsize(body_path),
+                content_type=f'multipart/form-data; boundary={boundary}',
+            ).status_code
+    elapsed = time.perf_counter() - start
+
+    peak = peak_rss_mb()
+    print(json.dumps({
+        'case': case,
+        'status': status,
+        'upload_mb': round(os.path.getsize(path) / (1024 * 1024), 2),
+        'seconds': round(elapsed, 3),
+        'baseline_rss_mb': round(baseline, 1),
+        'peak_rss_mb': round(peak, 1),
+        'upload_rss_mb': round(peak - baseline, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', nargs=2, metavar=('CASE', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--make', nargs=4, metavar=('PATH', 'W', 'H', 'FMT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+    if args.make:
+        path, width, height, fmt = args.make
+        make_image(path, int(width), int(height), fmt)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-images-') as tmp:
+        for case, width, height, fmt in CASES:
+            path = os.path.join(tmp, f'{width}x{height}.{fmt.lower()}')
+            if not os.path.exists(path):
+                subprocess.run([sys.executable, __file__, '--make', path, str(width), str(height), fmt],
+                               check=True)
+            out = subprocess.run(
+                [sys.executable, __file__, '--child', case, path],
+                check=True, capture_output=True, text=True, cwd=ROOT,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'case':<18}{'status':>7}{'file MB':>9}{'seconds':>9}{'peak MB':>9}{'+RSS MB':>9}")
+    for r in results:
+        print(f"{r['case']:<18}{r['status']:>7}{r['upload_mb']:>9}{r['seconds']:>9}"
+              f"{r['peak_rss_mb']:>9}{r['upload_rss_mb']:>9}")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
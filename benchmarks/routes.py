@@ -0,0 +1,266 @@
+"""Latency, SQL query count and memory of every page, for both apps.
+
+Each app runs in a fresh interpreter on its own SQLite file, seeded with a
+synthetic dataset (see ``dataset.py``). Every route in ``ROUTES`` is then
+requested through the test client: a few warm-up requests, ``--requests``
+timed ones, and one more under ``tracemalloc`` for the peak Python memory
+it allocates (kept out of the timed runs, since tracing slows everything
+down). A timed request that does not answer 200 stops the run, so an error
+page is never reported as a measurement. Query counts come from a cursor-execute listener on the engine;
+a route whose count differs between runs shows up as ``queries_max`` >
+``queries_min``. The anonymous page cache is turned off, so every request
+measures the view itself.
+
+    python benchmarks/routes.py [--app root|package|both] [--posts 2000 ...]
+                                [--json results.json] [--compare old.json]
+
+The JSON file records the dataset sizes, seed and git commit next to the
+results, so runs on different commits can be compared with ``--compare``.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, path, who) per app. Paths are formatted with values picked from the
+# dataset; ``who`` is None (anonymous), 'author' or 'admin'.
+ROUTES = {
+    'root': (
+        ('index', '/', None),
+        ('index-category', '/?category={category}', None),
+        ('post', '/post/{slug}', None),
+        ('post-author', '/post/{slug}', 'author'),
+        ('search', '/search?q=python', None),
+        ('login', '/login', None),
+        ('dashboard', '/dashboard', 'author'),
+        ('profile', '/profile', 'author'),
+        ('admin', '/admin', 'admin'),
+        ('admin-comments', '/admin/comments', 'admin'),
+        ('api-analytics', '/api/analytics', 'admin'),
+    ),
+    'package': (
+        ('index', '/', None),
+        ('recent-stories', '/recent-stories', None),
+        ('popular-stories', '/popular-stories', None),
+        ('blog', '/blog/{slug}', None),
+        ('blog-author', '/blog/{slug}', 'author'),
+        ('api-comments', '/api/comments/{post_id}', None),
+        ('search', '/search?q=python', None),
+        ('profile', '/profile/{username}', None),
+        ('login', '/auth/login', None),
+        ('dashboard', '/dashboard', 'author'),
+        ('my-blogs', '/my-blogs', 'author'),
+        ('admin', '/admin/', 'admin'),
+        ('admin-users', '/admin/users', 'admin'),
+        ('admin-blogs', '/admin/blogs', 'admin'),
+    ),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_app(flavor, workdir):
+    sys.path.insert(0, ROOT)
+    import config
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'WTF_CSRF_ENABLED': False,
+        # Otherwise every anonymous request after the warm-up is a page cache hit
+        'PAGE_CACHE_BACKEND': 'off',
+    }
+    if flavor == 'package':
+        from app import create_app, db
+        app = create_app(type('BenchConfig', (config.Config,), settings))
+    else:
+        # app.py shares its name with the app/ package, so load it by path
+        for key, value in settings.items():
+            setattr(config.Config, key, value)
+        spec = importlib.util.spec_from_file_location('blog_app', os.path.join(ROOT, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        from database import db
+        app = module.create_app()
+    return app, db
+
+
+def pick_targets(flavor, db):
+    """Dataset values for the route paths and the users to log in as."""
+    from sqlalchemy import func, select
+    if flavor == 'root':
+        from database import Category, Post, User
+        post = db.session.execute(
+            select(Post.id, Post.slug, Post.user_id).where(Post.is_published == True)  # noqa: E712
+            .order_by(Post.comment_count.desc()).limit(1)).one()
+        author = db.session.execute(
+            select(Post.user_id).group_by(Post.user_id).order_by(func.count().desc()).limit(1)).scalar()
+        admin = db.session.execute(select(User.id).where(User.role == 'admin').limit(1)).scalar()
+        category = db.session.execute(
+            select(Category.slug).join(Post, Post.category_id == Category.id)
+            .group_by(Category.slug).order_by(func.count().desc()).limit(1)).scalar()
+        username = db.session.execute(select(User.username).where(User.id == author)).scalar()
+    else:
+        from app.models import Blog, User
+        post = db.session.execute(
+            select(Blog.id, Blog.slug, Blog.author_id).where(Blog.status == 'published')
+            .order_by(Blog.comment_count.desc()).limit(1)).one()
+        author = db.session.execute(
+            select(Blog.author_id).group_by(Blog.author_id).order_by(func.count().desc()).limit(1)).scalar()
+        admin = db.session.execute(select(User.id).where(User.role == 'admin').limit(1)).scalar()
+        username = db.session.execute(select(User.username).where(User.id == author)).scalar()
+        category = None
+    values = {'slug': post.slug, 'post_id': post.id, 'category': category, 'username': username}
+    return values, {'author': author, 'admin': admin}
+
+
+def run_child(flavor, options):
+    from dataset import Sizes, load
+
+    workdir = tempfile.mkdtemp(prefix=f'bench-routes-{flavor}-')
+    app, db = build_app(flavor, workdir)
+    sizes = Sizes(**options['sizes'])
+    started = time.perf_counter()
+    with app.app_context():
+        rows = load(flavor, db, sizes, seed=options['seed'])
+        values, logins = pick_targets(flavor, db)
+        engine = db.engine
+    seed_seconds = time.perf_counter() - started
+
+    clients = {None: app.test_client()}
+    for who, user_id in logins.items():
+        client = clients[who] = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    from sqlalchemy import event
+    event.listen(engine, 'before_cursor_execute', count)
+
+    results = []
+    for name, path, who in ROUTES[flavor]:
+        url = path.format(**values)
+        client = clients[who]
+        for _ in range(options['warmup']):
+            client.get(url)
+
+        timings, counts, status = [], [], None
+        for _ in range(options['requests']):
+            queries[0] = 0
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            counts.append(queries[0])
+            status = response.status_code
+            if status != 200:
+                # An error page is not a measurement of the view
+                raise SystemExit(f'{flavor} {name} ({url}) returned {status}')
+
+        tracemalloc.start()
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({
+            'route': name, 'path': path, 'user': who or 'anonymous', 'status': status,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p90_ms': round(percentile(timings, 90), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'queries_min': min(counts), 'queries_max': max(counts),
+            'peak_kb': round(peak / 1024, 1),
+        })
+    print(json.dumps({'app': flavor, 'rows': rows, 'seed_seconds': round(seed_seconds, 2),
+                      'routes': results}))
+
+
+def print_table(run, baseline=None):
+    old = {r['route']: r for r in baseline['routes']} if baseline else {}
+    print(f"\n{run['app']} app ({', '.join(f'{n} {t}' for t, n in run['rows'].items())})")
+    print(f"{'route':<18}{'status':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KB':>9}"
+          + (f"{'p50 was':>9}{'q was':>7}" if old else ''))
+    for r in run['routes']:
+        q = str(r['queries_max']) if r['queries_min'] == r['queries_max'] \
+            else f"{r['queries_min']}-{r['queries_max']}"
+        line = (f"{r['route']:<18}{r['status']:>7}{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}"
+                f"{q:>9}{r['peak_kb']:>9}")
+        if r['route'] in old:
+            line += f"{old[r['route']]['p50_ms']:>9}{old[r['route']]['queries_max']:>7}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--app', choices=('root', 'package', 'both'), default='both')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=10000)
+    parser.add_argument('--likes', type=int, default=20000)
+    parser.add_argument('--bookmarks', type=int, default=3000)
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--compare', help='results file from an earlier run to show alongside')
+    parser.add_argument('--child', nargs=2, metavar=('APP', 'OPTIONS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], json.loads(args.child[1]))
+        return
+
+    options = {
+        'sizes': {'users': args.users, 'posts': args.posts, 'comments': args.comments,
+                  'likes': args.likes, 'bookmarks': args.bookmarks},
+        'requests': args.requests, 'warmup': args.warmup, 'seed': args.seed,
+    }
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = {run['app']: run for run in json.load(fh)['runs']}
+
+    runs = []
+    for flavor in (('root', 'package') if args.app == 'both' else (args.app,)):
+        child = subprocess.run(
+            [sys.executable, __file__, '--child', flavor, json.dumps(options)],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        if child.returncode:
+            sys.exit(child.stderr.strip().splitlines()[-1] if child.stderr.strip() else
+                     f'{flavor} benchmark failed with exit code {child.returncode}')
+        out = child.stdout
+        run = json.loads(out.strip().splitlines()[-1])
+        runs.append(run)
+        print_table(run, baseline.get(flavor))
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'commit': git_commit(), 'options': options, 'runs': runs}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""In-process cache of the categories table.
+
+Categories are read on every template render (nav, footer, search filter)
+and by the post forms, but change almost never. The cache keeps an immutable
+snapshot per process and reloads it when its version changes: commits that
+touch a category bump the local version and the mtime of a stamp file in the
+instance folder, so other workers and scripts (``add_categories.py``) are
+picked up on their next lookup without a query per request.
+"""
+import os
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+
+CachedCategory = namedtuple('CachedCategory', 'id name slug description')
+
+
+class CategoryCache:
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.stamp_path = None
+        self._lock = threading.Lock()
+        self._version = 0
+        self._loaded_key = None
+        self._categories = ()
+        self._by_slug = {}
+
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, self._mark_dirty)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def init_app(self, app):
+        self.stamp_path = os.path.join(app.instance_path, 'categories.version')
+        os.makedirs(app.instance_path, exist_ok=True)
+        app.extensions['category_cache'] = self
+
+    # Invalidation -----------------------------------------------------
+
+    def _mark_dirty(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info['categories_dirty'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('categories_dirty', False):
+            self.invalidate()
+
+    def _after_rollback(self, session):
+        session.info.pop('categories_dirty', None)
+
+    def invalidate(self):
+        """Drop the snapshot here and in every process sharing the instance folder."""
+        with self._lock:
+            self._version += 1
+        if self.stamp_path:
+            with open(self.stamp_path, 'a'):
+                os.utime(self.stamp_path)
+
+    # Lookups ----------------------------------------------------------
+
+    def _stamp(self):
+        if not self.stamp_path:
+            return 0
+        try:
+            return os.stat(self.stamp_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _snapshot(self):
+        key = (self._version, self._stamp())
+        if key != self._loaded_key:
+            rows = self.db.session.execute(select(
+                self.model.id, self.model.name, self.model.slug, self.model.description
+            )).all()
+            categories = tuple(CachedCategory(*row) for row in rows)
+            with self._lock:
+                self._categories = categories
+                self._by_slug = {c.slug: c for c in categories}
+                self._loaded_key = key
+        return self._categories
+
+    def all(self):
+        """Every category, in table order."""
+        return self._snapshot()
+
+    def choices(self):
+        """``(id, name)`` pairs for a SelectField."""
+        return [(c.id, c.name) for c in self._snapshot()]
+
+    def id_for_slug(self, slug):
+        """Category id for ``slug``, or None if there is no such category."""
+        self._snapshot()
+        category = self._by_slug.get(slug)
+        return category.id if category else None
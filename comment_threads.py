@@ -0,0 +1,91 @@
+"""Threaded comments for a post in a fixed number of queries.
+
+A page of top-level comments is keyset-paginated like the feeds; every
+approved reply beneath them, at any depth, comes from one recursive CTE
+query, with the commenter loaded in both. The tree is assembled in memory:
+replies nested deeper than ``MAX_DEPTH`` are shown at that depth, and each
+thread shows its first ``REPLIES_PER_THREAD`` replies with a link to the rest.
+"""
+from sqlalchemy import literal, select
+from sqlalchemy.orm import joinedload
+
+from database import Comment, User
+from keyset import keyset_paginate
+
+MAX_DEPTH = 4
+REPLIES_PER_THREAD = 20
+
+
+class CommentNode:
+    """A comment with its (depth-limited) replies."""
+
+    __slots__ = ('comment', 'depth', 'replies', 'thread', 'more_replies', 'container')
+
+    def __init__(self, comment, depth, thread=None):
+        self.comment = comment
+        self.depth = depth
+        self.replies = []
+        self.thread = thread or self
+        self.more_replies = 0
+        # The replies list this node was shown in
+        self.container = None
+
+
+def _with_commenter(query):
+    return query.options(joinedload(Comment.commenter).load_only(User.username, User.profile_image))
+
+
+def _descendants(root_ids):
+    """Query of every approved reply beneath ``root_ids``, oldest first."""
+    c = Comment.__table__
+    approved = c.c.is_approved == True  # noqa: E712
+    tree = select(c.c.id).where(c.c.parent_id.in_(root_ids), approved) \
+        .cte('reply_tree', recursive=True)
+    # UNION (not UNION ALL) so a parent_id cycle cannot recurse forever
+    tree = tree.union(select(c.c.id).join(tree, c.c.parent_id == tree.c.id).where(approved))
+    return _with_commenter(Comment.query).join(tree, Comment.id == tree.c.id) \
+        .order_by(Comment.created_at, Comment.id)
+
+
+def comment_threads(post_id, cursor=None, per_page=20, thread_id=None,
+                    max_depth=MAX_DEPTH, replies_per_thread=REPLIES_PER_THREAD):
+    """A keyset page of the post's threads; ``items`` are :class:`CommentNode` roots.
+
+    With ``thread_id`` the page holds only that thread, with all its replies.
+    """
+    roots = _with_commenter(Comment.query).filter(
+        Comment.post_id == post_id,
+        Comment.parent_id == None,  # noqa: E711
+        Comment.is_approved == True,  # noqa: E712
+    )
+    if thread_id is not None:
+        roots = roots.filter(Comment.id == thread_id)
+        replies_per_thread = None
+    page = keyset_paginate(roots, (Comment.created_at, Comment.id), cursor=cursor, per_page=per_page)
+
+    nodes = {comment.id: CommentNode(comment, 0) for comment in page.items}
+    page.items = list(nodes.values())
+    if not nodes:
+        return page
+
+    shown = {}
+    threads = dict(nodes)
+    for reply in _descendants(list(nodes)):
+        thread = threads.get(reply.parent_id)
+        if thread is None:
+            continue
+        threads[reply.id] = thread
+        if replies_per_thread is not None and shown.get(thread.comment.id, 0) >= replies_per_thread:
+            thread.more_replies += 1
+            continue
+        parent = nodes.get(reply.parent_id)
+        if parent is None:
+            thread.more_replies += 1  # its parent was cut by the per-thread limit
+            continue
+        shown[thread.comment.id] = shown.get(thread.comment.id, 0) + 1
+        node = CommentNode(reply, min(parent.depth + 1, max_depth), thread)
+        nodes[reply.id] = node
+        # Past the depth limit, replies join the list their parent was shown in
+        node.container = parent.replies if parent.depth < max_depth else parent.container
+        node.container.append(node)
+    return page
@@ -16,6 +16,15 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    # Uploaded images are resized into variants by a pool of this many
+    # processes (0 = inline in the request); past IMAGE_MAX_PENDING queued
+    # jobs per web worker, uploads are processed inline instead.
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    IMAGE_MAX_PENDING = int(os.environ.get('IMAGE_MAX_PENDING', 32))
+    # Uploads above this many pixels are refused before decoding
+    IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 50_000_000))
+    # Unprocessed uploads wait here; keep it outside the static folder
+    IMAGE_SPOOL_DIR = os.environ.get('IMAGE_SPOOL_DIR') or None
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SERVER_NAME = os.environ.get('SERVER_NAME') or None  # e.g., 'localhost:5000'
     
@@ -25,9 +34,54 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'  # Allows cross-site POST for OAuth redirect
     
+    # Buffered view counter: flush every N seconds or once M views are pending.
+    # Interval 0 writes every view straight through. Backend 'file' shares one
+    # spool file between all workers on the host.
+    VIEW_COUNTER_FLUSH_INTERVAL = float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 5))
+    VIEW_COUNTER_FLUSH_THRESHOLD = int(os.environ.get('VIEW_COUNTER_FLUSH_THRESHOLD', 200))
+    VIEW_COUNTER_BACKEND = os.environ.get('VIEW_COUNTER_BACKEND', 'memory')
+    VIEW_COUNTER_SPOOL_DIR = os.environ.get('VIEW_COUNTER_SPOOL_DIR') or None
+
     # Pagination
+    POSTS_PER_PAGE = 10
     BLOGS_PER_PAGE = 10
     COMMENTS_PER_PAGE = 20
+    # Seconds a cached result total (e.g. search hit counts) may be stale
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL', 60))
+
+    # Trending: an event's weight halves every this many hours
+    TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+
+    # Seconds admin dashboards and /api/analytics may serve cached rollups
+    ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+
+    # View buckets: hourly for this many days, then daily until dropped
+    VIEW_BUCKET_HOURLY_DAYS = int(os.environ.get('VIEW_BUCKET_HOURLY_DAYS', 2))
+    VIEW_BUCKET_RETENTION_DAYS = int(os.environ.get('VIEW_BUCKET_RETENTION_DAYS', 400))
+
+    # Request profiling: Server-Timing header and a JSON log line per request;
+    # a sampled fraction also runs under cProfile, dumped if slower than PROFILE_SLOW_MS
+    PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+    PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or None
+
+    # Anonymous page cache: 'memory' (per worker), 'file' (shared on the host) or 'off'.
+    # Entries are purged by writes to what they show and expire after PAGE_CACHE_TTL seconds.
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 60))
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR') or None
+
+    # Seconds browsers and CDNs may reuse a logged-out feed page without revalidating
+    HTTP_CACHE_FEED_MAX_AGE = int(os.environ.get('HTTP_CACHE_FEED_MAX_AGE', 60))
+
+    # Static HTML snapshots of published posts and feeds (flask publish-snapshots).
+    # With SNAPSHOT_ON_PUBLISH, publishing or commenting refreshes the affected pages.
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or None
+    SNAPSHOT_ON_PUBLISH = os.environ.get('SNAPSHOT_ON_PUBLISH', '').lower() in ('1', 'true', 'yes')
+    SNAPSHOT_MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', 24 * 3600))
+    SNAPSHOT_BASE_URL = os.environ.get('SNAPSHOT_BASE_URL') or None
 
     # OAuth (Google)
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID') or ''
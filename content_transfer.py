@@ -0,0 +1,252 @@
+"""Streaming NDJSON export and bulk import of the blog's content.
+
+One JSON object per line, tagged with its ``type`` (category, user, post,
+comment, like) and written in that order so every row's references come
+before it. Export streams each table in batches, so memory use does not
+grow with the size of the site; import reads the file line by line and
+writes ``BATCH_SIZE`` rows per INSERT. The format only uses portable JSON
+types, so a dump from SQLite loads into Postgres and back.
+
+Import merges into a non-empty database:
+
+* rows whose id already exists are skipped, so an interrupted import can
+  simply be run again;
+* categories and users matching an existing slug or email are merged into
+  it, and a username taken by someone else gets a numeric suffix;
+* a post whose slug is taken gets the next free ``-N`` suffix;
+* a like that duplicates an existing (user, post) like is skipped.
+
+Export writes comments in id order, so a reply can come before its
+parent. A reply whose parent is already stored is linked as it is
+inserted. Otherwise the link waits in the ``import_reply_links`` table until
+the end. That keeps memory flat however many replies the dump holds, and an
+interrupted import still restores the links it saved when it is run again.
+
+Bulk inserts bypass the mapper events, so the denormalized counters,
+rollups and trending scores are rebuilt once at the end. With
+``rebuild_derived=False`` (``flask import-content --skip-derived``) that is
+left to the ``reconcile-counters``, ``rebuild-rollups`` and
+``recompute-trending`` commands. Related posts are always left to ``flask
+rebuild-related``, a batch job too slow to tack onto an import.
+"""
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, delete, select, update
+
+from database import (db, category_cache, page_cache, post_trending, rollups, reconcile_counters,
+                      trending_events, Category, Comment, Like, Post, User)
+from unique_names import allocate
+
+BATCH_SIZE = 1000
+
+# Reply links whose parent was not stored yet; kept out of db.metadata so
+# create_all() leaves it alone
+reply_links = Table(
+    'import_reply_links', MetaData(),
+    Column('child_id', String(36), primary_key=True),
+    Column('parent_id', String(36), nullable=False),
+)
+
+# Export order: referenced tables first
+MODELS = (
+    ('category', Category),
+    ('user', User),
+    ('post', Post),
+    ('comment', Comment),
+    ('like', Like),
+)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot export {type(value).__name__}')
+
+
+def export_ndjson(out, batch_size=BATCH_SIZE):
+    """Write every row to the text stream ``out``; returns ``{type: rows}``."""
+    counts = {}
+    for kind, model in MODELS:
+        table = model.__table__
+        stmt = select(table).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+        counts[kind] = 0
+        for row in db.session.execute(stmt).mappings():
+            out.write(json.dumps({'type': kind, **row}, default=_encode, separators=(',', ':')))
+            out.write('\n')
+            counts[kind] += 1
+    return counts
+
+
+class _Importer:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.models = dict(MODELS)
+        self.pending = {kind: [] for kind in self.models}
+        self.counts = {kind: 0 for kind in self.models}
+        # Ids of imported categories/users merged into existing rows
+        self.category_ids = {}
+        self.user_ids = {}
+        reply_links.create(db.engine, checkfirst=True)
+
+    def add(self, record):
+        kind = record.pop('type', None)
+        if kind not in self.models:
+            raise ValueError(f'Unknown record type: {kind!r}')
+        self.pending[kind].append(self._row(self.models[kind].__table__, record))
+        # Flush referenced types first so foreign keys always resolve
+        if len(self.pending[kind]) >= self.batch_size:
+            for other, _ in MODELS:
+                self.flush(other)
+                if other == kind:
+                    break
+
+    def _row(self, table, record):
+        # References between records are by id, so every row needs one
+        row = {'id': str(uuid.uuid4())}
+        for column in table.columns:
+            if column.key not in record:
+                continue
+            value = record[column.key]
+            if isinstance(value, str) and isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            row[column.key] = value
+        return row
+
+    def flush(self, kind):
+        rows, self.pending[kind] = self.pending[kind], []
+        if not rows:
+            return
+        rows = getattr(self, f'_prepare_{kind}')(rows)
+        table = self.models[kind].__table__
+        # executemany needs the same keys in every row; omitted columns get their defaults
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for group in groups.values():
+            db.session.execute(table.insert(), group)
+        db.session.commit()
+        self.counts[kind] += len(rows)
+
+    def _existing(self, column, values):
+        values = {v for v in values if v is not None}
+        if not values:
+            return set()
+        return set(db.session.execute(select(column).where(column.in_(values))).scalars())
+
+    def _new(self, model, rows):
+        """Rows whose id is not in the database (or earlier in the batch) yet."""
+        existing = self._existing(model.id, [row.get('id') for row in rows])
+        fresh = []
+        for row in rows:
+            if row.get('id') not in existing:
+                existing.add(row.get('id'))
+                fresh.append(row)
+        return fresh
+
+    def _merge(self, model, rows, column, ids):
+        """Map rows whose ``column`` value already exists onto the existing row's id."""
+        rows = self._new(model, rows)
+        existing = dict(db.session.execute(
+            select(column, model.id).where(column.in_({row[column.key] for row in rows}))
+        ).all()) if rows else {}
+        fresh = []
+        for row in rows:
+            match = existing.get(row[column.key])
+            if match is not None:
+                ids[row['id']] = match
+            else:
+                existing[row[column.key]] = row['id']
+                fresh.append(row)
+        return fresh
+
+    def _unique(self, rows, column, sep):
+        """Rename rows whose ``column`` value is taken, in the database or the batch."""
+        taken = self._existing(column, [row[column.key] for row in rows])
+        for row in rows:
+            value = row[column.key]
+            if value in taken:
+                value = row[column.key] = allocate(db.session, column, value, sep, exclude=taken)
+            taken.add(value)
+        return rows
+
+    def _prepare_category(self, rows):
+        return self._merge(Category, rows, Category.slug, self.category_ids)
+
+    def _prepare_user(self, rows):
+        rows = self._merge(User, rows, User.email, self.user_ids)
+        return self._unique(rows, User.username, sep='')
+
+    def _prepare_post(self, rows):
+        for row in rows:
+            row['user_id'] = self.user_ids.get(row.get('user_id'), row.get('user_id'))
+            row['category_id'] = self.category_ids.get(row.get('category_id'), row.get('category_id'))
+        return self._unique(self._new(Post, rows), Post.slug, sep='-')
+
+    def _prepare_comment(self, rows):
+        rows = self._new(Comment, rows)
+        stored = self._existing(Comment.id, [row.get('parent_id') for row in rows])
+        waiting = []
+        for row in rows:
+            row['user_id'] = self.user_ids.get(row.get('user_id'), row.get('user_id'))
+            parent_id = row.get('parent_id')
+            if parent_id is not None and parent_id not in stored:
+                waiting.append({'child_id': row['id'], 'parent_id': parent_id})
+                row['parent_id'] = None
+        if waiting:
+            db.session.execute(reply_links.insert(), waiting)
+        return rows
+
+    def _prepare_like(self, rows):
+        for row in rows:
+            row['user_id'] = self.user_ids.get(row.get('user_id'), row.get('user_id'))
+        rows = self._new(Like, rows)
+        liked = set(db.session.execute(
+            select(Like.user_id, Like.post_id).where(Like.post_id.in_({row['post_id'] for row in rows}))
+        ).all()) if rows else set()
+        fresh = []
+        for row in rows:
+            key = (row['user_id'], row['post_id'])
+            if key not in liked:
+                liked.add(key)
+                fresh.append(row)
+        return fresh
+
+    def finish(self, rebuild_derived=True):
+        for kind, _ in MODELS:
+            self.flush(kind)
+        # Reply links that waited for their parent, now that every comment exists
+        comments = Comment.__table__
+        parent = select(reply_links.c.parent_id).where(reply_links.c.child_id == comments.c.id) \
+            .scalar_subquery()
+        db.session.execute(update(comments).where(comments.c.id.in_(select(reply_links.c.child_id)))
+                           .values(parent_id=parent))
+        db.session.execute(delete(reply_links))
+        db.session.commit()
+
+        if rebuild_derived:
+            reconcile_counters()
+            rollups.rebuild()
+            post_trending.rebuild(trending_events())
+        category_cache.invalidate()
+        page_cache.clear()
+        return self.counts
+
+
+def import_ndjson(lines, batch_size=BATCH_SIZE, rebuild_derived=True):
+    """Load records from an iterable of NDJSON lines; returns ``{type: rows inserted}``.
+
+    ``rebuild_derived=False`` skips rebuilding counters, rollups and
+    trending scores.
+    """
+    importer = _Importer(batch_size)
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            importer.add(json.loads(line))
+        except ValueError as exc:
+            raise ValueError(f'Line {number}: {exc}') from exc
+    return importer.finish(rebuild_derived)
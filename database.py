@@ -1,10 +1,26 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, column, event, func, inspect, literal, or_, select, table
+from sqlalchemy.orm import column_property, query_expression
+from collections import Counter
 from datetime import datetime
 import uuid
 
 from flask_login import UserMixin
 
+from category_cache import CategoryCache
+from page_cache import ALL, PageCache
+from related_posts import RelatedIndex
+from rollups import DailyRollups
+from search_index import SearchIndex
+from static_snapshots import SnapshotPublisher
+from trending import TrendingBoard
+from upload_store import UploadStore
+from view_buckets import ViewBuckets
+from view_counter import ViewCounter
+
 db = SQLAlchemy()
+view_counter = ViewCounter(db, 'posts')
+upload_store = UploadStore(db)
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -17,6 +33,8 @@ class User(UserMixin, db.Model):
     profile_image = db.Column(db.String(200), default='default-avatar.svg')
     role = db.Column(db.String(20), default='user')  # 'user' or 'admin'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Profile edits change what post pages show about their author
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
     # Relationships
@@ -45,6 +63,16 @@ class Post(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     published_at = db.Column(db.DateTime)
+
+    # Denormalized counters, maintained by the Like/Comment mapper events below
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    approved_comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    # Kept in sync with content on save so list pages can skip loading the body
+    word_count = db.Column(db.Integer)
+    # Filled by feed queries (feeds.py) with the start of content
+    content_preview = query_expression()
     
     # Foreign keys
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
@@ -54,26 +82,44 @@ class Post(db.Model):
     category = db.relationship('Category', backref='posts', lazy=True)
     comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')
     likes = db.relationship('Like', backref='post', lazy=True, cascade='all, delete-orphan')
+
+    # Seek index for the keyset-paginated feed (see keyset.py)
+    __table_args__ = (db.Index('ix_posts_published', 'is_published', 'published_at', 'id'),)
     
     def increment_views(self):
-        self.views += 1
-        db.session.commit()
+        view_counter.increment(self.id)
+
+    @property
+    def view_count(self):
+        """Stored views plus views still buffered by the view counter."""
+        return (self.views or 0) + view_counter.pending(self.id)
 
     @property
     def reading_time(self):
         """Rough reading time in minutes based on word count."""
-        word_count = len((self.content or '').split())
-        return max(1, round(word_count / 200))
+        words = self.word_count if self.word_count is not None else count_words(self.content)
+        return max(1, round(words / 200))
+
+    @property
+    def preview_text(self):
+        """Start of the content for cards, without loading the body in feeds."""
+        return self.content_preview if self.content_preview is not None else (self.content or '')
     
     def __repr__(self):
         return f'<Post {self.title}>'
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Moderation queue (pending first, newest first) and per-post listings
+        db.Index('ix_comments_moderation', 'is_approved', 'created_at', 'id'),
+        db.Index('ix_comments_post_created', 'post_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     content = db.Column(db.Text, nullable=False)
-    is_approved = db.Column(db.Boolean, default=True)
+    # active_history: the counter events need the previous value on update
+    is_approved = column_property(db.Column(db.Boolean, default=True), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -98,8 +144,9 @@ class Like(db.Model):
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     post_id = db.Column(db.String(36), db.ForeignKey('posts.id'), nullable=False)
     
-    # Unique constraint
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_like'),)
+    # Unique constraint; post_id is indexed on its own for per-post counts
+    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_like'),
+                      db.Index('ix_likes_post_id', 'post_id'))
     
     def __repr__(self):
         return f'<Like {self.id}>'
@@ -113,4 +160,249 @@ class Category(db.Model):
     description = db.Column(db.String(200))
     
     def __repr__(self):
-        return f'<Category {self.name}>'
\ No newline at end of file
+        return f'<Category {self.name}>'
+
+
+# Versioned in-process snapshot of the categories table
+category_cache = CategoryCache(db, Category)
+
+# Full-text index over post title/tags/content (FTS5 or tsvector)
+post_search = SearchIndex(db, Post)
+
+# Uploaded images referenced by these columns are kept; the rest can be pruned
+upload_store.track(Post.cover_image)
+upload_store.track(Post.content)
+upload_store.track(User.profile_image)
+
+# Decayed view/like/comment scores behind the featured posts
+post_trending = TrendingBoard(db, Post)
+
+# When views happened (hourly, then daily), for windowed statistics
+post_views = ViewBuckets(db, Post)
+
+# Precomputed TF-IDF neighbours behind the related posts on a post page
+post_related = RelatedIndex(db, Post, fields={Post.title: 2.0, Post.content: 1.0},
+                            tags=Post.tags, where={Post.is_published: True})
+
+# Anonymous page cache: tags purged when these rows change
+page_cache = PageCache(db)
+page_cache.track(Post, lambda post: {'posts', f'post:{post.id}', f'user:{post.user_id}'})
+page_cache.track(Comment, lambda comment: {f'post:{comment.post_id}'})
+page_cache.track(Like, lambda like: {f'post:{like.post_id}'})
+page_cache.track(User, lambda user: {f'user:{user.id}'})
+page_cache.track(Category, lambda category: {ALL})
+
+# Static snapshots of post and feed pages (sources are registered in app.py)
+snapshots = SnapshotPublisher(db)
+snapshots.track(Post, lambda post: {('posts', post.id), ('feeds', None)})
+snapshots.track(Comment, lambda comment: {('posts', comment.post_id)})
+snapshots.track(Category, lambda category: {('feeds', None)})
+
+# Daily counts behind the admin dashboard and /api/analytics
+rollups = DailyRollups(db)
+rollups.track('users', User, User.created_at)
+rollups.track('posts', Post, Post.created_at, dimension=Post.category_id)
+rollups.track('published', Post, Post.published_at, where={Post.is_published: True},
+              dimension=Post.category_id)
+rollups.track('comments', Comment, Comment.created_at, dimension=Post.category_id, via=Comment.post_id)
+rollups.track('approved_comments', Comment, Comment.created_at, where={Comment.is_approved: True},
+              dimension=Post.category_id, via=Comment.post_id)
+rollups.track('likes', Like, Like.created_at, dimension=Post.category_id, via=Like.post_id)
+
+
+def count_words(content):
+    return len((content or '').split())
+
+
+@event.listens_for(Post, 'before_insert')
+@event.listens_for(Post, 'before_update')
+def _count_words(mapper, connection, target):
+    if target.word_count is None or inspect(target).attrs.content.history.has_changes():
+        target.word_count = count_words(target.content)
+
+
+# Counter maintenance. A lightweight table() is used on purpose so these
+# UPDATEs do not fire Post.updated_at's onupdate.
+COUNTER_COLUMNS = ('like_count', 'comment_count', 'approved_comment_count')
+_post_counters = table('posts', column('id'), *(column(name) for name in COUNTER_COLUMNS))
+
+
+def _adjust_counters(connection, post_id, **deltas):
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas or post_id is None:
+        return
+    connection.execute(
+        _post_counters.update()
+        .where(_post_counters.c.id == post_id)
+        .values({name: _post_counters.c[name] + delta for name, delta in deltas.items()})
+    )
+
+
+@event.listens_for(Like, 'after_insert')
+def _like_inserted(mapper, connection, target):
+    _adjust_counters(connection, target.post_id, like_count=1)
+
+
+@event.listens_for(Like, 'after_delete')
+def _like_deleted(mapper, connection, target):
+    _adjust_counters(connection, target.post_id, like_count=-1)
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, target):
+    _adjust_counters(connection, target.post_id, comment_count=1,
+                     approved_comment_count=1 if target.is_approved else 0)
+
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    _adjust_counters(connection, target.post_id, comment_count=-1,
+                     approved_comment_count=-1 if target.is_approved else 0)
+
+
+@event.listens_for(Comment, 'after_update')
+def _comment_updated(mapper, connection, target):
+    history = inspect(target).attrs.is_approved.history
+    if history.deleted and bool(history.deleted[0]) != bool(target.is_approved):
+        _adjust_counters(connection, target.post_id,
+                         approved_comment_count=1 if target.is_approved else -1)
+
+
+def reconcile_counters():
+    """Recompute every post's counters from the likes/comments tables.
+
+    Only rows whose stored counters drifted are rewritten. Returns the number
+    of posts that were corrected.
+    """
+    likes = Like.__table__
+    comments = Comment.__table__
+    counts = {
+        'like_count': select(func.count()).select_from(likes)
+            .where(likes.c.post_id == _post_counters.c.id).scalar_subquery(),
+        'comment_count': select(func.count()).select_from(comments)
+            .where(comments.c.post_id == _post_counters.c.id).scalar_subquery(),
+        'approved_comment_count': select(func.count()).select_from(comments)
+            .where(comments.c.post_id == _post_counters.c.id, comments.c.is_approved == True)  # noqa: E712
+            .scalar_subquery(),
+    }
+    drifted = or_(*(_post_counters.c[name] != expr for name, expr in counts.items()))
+    result = db.session.execute(_post_counters.update().where(drifted).values(counts))
+    db.session.commit()
+    return result.rowcount
+
+
+# Bulk moderation. One UPDATE/DELETE per batch bypasses the mapper events,
+# so the counters and rollups they maintain are adjusted here.
+
+def _comment_groups(ids, *criteria):
+    comments = Comment.__table__
+    posts = Post.__table__
+    day = func.date(comments.c.created_at)
+    return db.session.execute(
+        select(comments.c.post_id, day, posts.c.category_id, func.count(),
+               func.count(case((comments.c.is_approved == True, 1))))  # noqa: E712
+        .join(posts, posts.c.id == comments.c.post_id)
+        .where(comments.c.id.in_(ids), *criteria)
+        .group_by(comments.c.post_id, day, posts.c.category_id)
+    ).all()
+
+
+def approve_comments(ids):
+    """Approve the pending comments among ``ids`` in one UPDATE.
+
+    Returns the number of comments approved.
+    """
+    comments = Comment.__table__
+    pending = comments.c.is_approved == False  # noqa: E712
+    groups = _comment_groups(ids, pending)
+    if not groups:
+        return 0
+    db.session.execute(
+        comments.update().where(comments.c.id.in_(ids), pending)
+        .values(is_approved=True, updated_at=datetime.utcnow())
+    )
+    conn = db.session.connection()
+    per_post, per_day = Counter(), Counter()
+    for post_id, day, category_id, n, _ in groups:
+        per_post[post_id] += n
+        per_day[(day, category_id)] += n
+    for post_id, n in per_post.items():
+        _adjust_counters(conn, post_id, approved_comment_count=n)
+    rollups.add(conn, 'approved_comments', per_day)
+    db.session.commit()
+    page_cache.purge(*(f'post:{post_id}' for post_id in per_post))
+    snapshots.refresh(*(('posts', post_id) for post_id in per_post))
+    return sum(per_post.values())
+
+
+def delete_comments(ids):
+    """Delete the comments among ``ids`` in one DELETE.
+
+    Replies to them are kept as top-level comments, as when deleting one
+    comment through the ORM. Returns the number of comments deleted.
+    """
+    comments = Comment.__table__
+    groups = _comment_groups(ids)
+    if not groups:
+        return 0
+    db.session.execute(comments.update().where(comments.c.parent_id.in_(ids)).values(parent_id=None))
+    db.session.execute(comments.delete().where(comments.c.id.in_(ids)))
+    conn = db.session.connection()
+    removed, approved = Counter(), Counter()
+    removed_per_day, approved_per_day = Counter(), Counter()
+    for post_id, day, category_id, n, n_approved in groups:
+        removed[post_id] += n
+        approved[post_id] += n_approved
+        removed_per_day[(day, category_id)] -= n
+        approved_per_day[(day, category_id)] -= n_approved
+    for post_id in removed:
+        _adjust_counters(conn, post_id, comment_count=-removed[post_id],
+                         approved_comment_count=-approved[post_id])
+    rollups.add(conn, 'comments', removed_per_day)
+    rollups.add(conn, 'approved_comments', approved_per_day)
+    db.session.commit()
+    page_cache.purge(*(f'post:{post_id}' for post_id in removed))
+    snapshots.refresh(*(('posts', post_id) for post_id in removed))
+    return sum(removed.values())
+
+
+# Trending scores, fed by the same events as the counters
+@event.listens_for(Like, 'after_insert')
+def _like_trending(mapper, connection, target):
+    post_trending.record(connection, 'like', {target.post_id: 1}, target.created_at)
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_trending(mapper, connection, target):
+    post_trending.record(connection, 'comment', {target.post_id: 1}, target.created_at)
+
+
+@view_counter.on_flush
+def _views_flushed(connection, counts):
+    post_views.record(connection, counts)
+    post_trending.record(connection, 'view', counts)
+
+
+def trending_events():
+    """Every recorded event as ``(post_id, kind, when, n)`` for ``post_trending.rebuild``.
+
+    Views come from the view buckets; views from before the buckets existed
+    count as of when the post was published.
+    """
+    likes = Like.__table__
+    comments = Comment.__table__
+    posts = Post.__table__
+    bucketed = post_views.totals(None)
+    queries = (
+        select(likes.c.post_id, literal('like'), likes.c.created_at, literal(1)),
+        select(comments.c.post_id, literal('comment'), comments.c.created_at, literal(1)),
+        select(posts.c.id, literal('view'),
+               func.coalesce(posts.c.published_at, posts.c.created_at),
+               posts.c.views - func.coalesce(bucketed.c.views, 0))
+            .outerjoin(bucketed, bucketed.c.item_id == posts.c.id)
+            .where(posts.c.views > func.coalesce(bucketed.c.views, 0)),
+    )
+    for query in queries:
+        for row in db.session.execute(query.execution_options(yield_per=1000)):
+            yield tuple(row)
+    yield from post_views.events()
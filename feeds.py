@@ -0,0 +1,59 @@
+"""List-page queries for posts.
+
+Every feed card renders the author, the category, the counters and a short
+excerpt. ``post_cards`` eager-loads the two many-to-one relationships in the
+list query itself and swaps the (large) content column for a short SQL-side
+prefix. Counts come from the denormalized counter columns, so a page of any
+size costs a fixed number of queries.
+
+Dashboard and profile pages list an author's own posts as bare table rows
+(``post_rows``) and take their totals from one grouped query
+(``author_stats``), so their cost does not grow with the number of posts.
+"""
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import defer, joinedload, load_only, with_expression
+
+from database import db, Post
+
+# Enough characters for a 200-char plain-text excerpt after tags are stripped
+PREVIEW_CHARS = 600
+
+
+def post_cards(query=None):
+    """Apply feed-card loader options to a Post query."""
+    if query is None:
+        query = Post.query
+    return query.options(
+        joinedload(Post.author),
+        joinedload(Post.category),
+        defer(Post.content),
+        with_expression(Post.content_preview, func.substr(Post.content, 1, PREVIEW_CHARS)),
+    )
+
+
+def post_rows(query=None):
+    """Load only the columns an author's post table shows (no content)."""
+    if query is None:
+        query = Post.query
+    return query.options(load_only(
+        Post.title, Post.slug, Post.is_published, Post.views, Post.like_count,
+        Post.created_at, Post.updated_at, Post.published_at,
+    ))
+
+
+def author_stats(user_id):
+    """Post, published, view and like totals for one author, in one query."""
+    row = db.session.execute(
+        select(
+            func.count(Post.id).label('total_posts'),
+            func.count(case((Post.is_published == True, 1))).label('published_posts'),  # noqa: E712
+            func.coalesce(func.sum(Post.views), 0).label('total_views'),
+            func.coalesce(func.sum(Post.like_count), 0).label('total_likes'),
+        ).where(Post.user_id == user_id)
+    ).one()
+    return row._asdict()
+
+
+def card_tags(posts):
+    """Page-cache tags for a page showing ``posts`` with their authors."""
+    return [tag for post in posts for tag in (f'post:{post.id}', f'user:{post.user_id}')]
@@ -0,0 +1,162 @@
+"""Conditional GETs and Cache-Control for public pages.
+
+Views marked with :meth:`HttpCache.policy` get a ``Cache-Control`` header
+for their kind of page, plus ``Vary: Cookie``. They also get an ``ETag``,
+and a request whose ``If-None-Match`` matches it is answered with an empty
+304.
+
+The kinds are:
+
+* ``page``: a single post. Clients revalidate on every visit.
+* ``feed``: a list of posts. Clients and shared caches may reuse it for
+  ``HTTP_CACHE_FEED_MAX_AGE`` seconds.
+* ``api``: JSON. Clients revalidate on every visit.
+
+A response is only ``public`` when the visitor is logged out and the
+response sets no cookie. Otherwise it is ``private, no-cache``.
+
+The ETag comes from one of two places:
+
+* A view can call :meth:`HttpCache.validate` with a few cheap values that
+  change whenever its output does, such as a post's ``updated_at`` and its
+  counters. A match is then answered before the view loads or renders
+  anything.
+* Everything else, including every logged-in request, gets a hash of the
+  rendered body. That saves bandwidth but not rendering.
+
+Validator ETags are weak on purpose. They leave out view counts and
+sidebars, such as similar posts, which can lag until the post itself
+changes.
+
+``Last-Modified`` is sent too, but it only follows the post's own edits.
+Counters change without touching ``updated_at``, so only the ETag decides
+a 304. A client that sends only ``If-Modified-Since`` always gets the full
+page.
+"""
+import functools
+import hashlib
+import os
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+POLICIES = {
+    'page': 'public, no-cache',
+    'feed': 'public, max-age={feed_max_age}',
+    'api': 'public, no-cache',
+}
+PRIVATE = 'private, no-cache'
+
+# Carried over to the 304 so caches can refresh what they hold
+KEPT_HEADERS = ('Cache-Control', 'ETag', 'Last-Modified', 'Vary')
+
+
+def templates_version(app):
+    """Changes when a template is edited or deployed, so old ETags stop matching."""
+    latest, count = 0, 0
+    folders = {os.path.join(app.root_path, app.template_folder)} if app.template_folder else set()
+    for folder in folders:
+        for dirpath, _, filenames in os.walk(folder):
+            for name in filenames:
+                try:
+                    latest = max(latest, os.stat(os.path.join(dirpath, name)).st_mtime_ns)
+                except OSError:
+                    continue
+                count += 1
+    return f'{latest:x}.{count}'
+
+
+class HttpCache:
+    def __init__(self, app=None):
+        self.feed_max_age = 60
+        self.version = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.feed_max_age = int(app.config.get('HTTP_CACHE_FEED_MAX_AGE', self.feed_max_age))
+        self.version = templates_version(app)
+        app.after_request(self._finish)
+        app.extensions['http_cache'] = self
+
+    def policy(self, kind):
+        """Mark a view as a ``kind`` page (a key of ``POLICIES``).
+
+        Goes directly above the view function, below ``page_cache.cached``,
+        so the validators are part of what the page cache stores.
+        """
+        if kind not in POLICIES:
+            raise ValueError(f'Unknown cache policy {kind!r}')
+
+        def decorate(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                response = make_response(view(*args, **kwargs))
+                validators = g.pop('http_cache_validators', None)
+                if validators is not None and response.status_code == 200:
+                    self._set_validators(response, *validators)
+                return response
+            wrapper.http_cache_policy = kind
+            return wrapper
+        return decorate
+
+    def validate(self, *parts, last_modified=None):
+        """Answer with a 304 if the client's copy matches ``parts``, else None.
+
+        ``parts`` must change whenever the page would render differently for
+        a logged-out visitor. Logged-in visitors and requests with pending
+        flashed messages always get ``None`` and fall back to a body hash.
+        """
+        if current_user.is_authenticated or '_flashes' in session:
+            return None
+        digest = hashlib.sha1(repr((self.version,) + parts).encode('utf-8')).hexdigest()[:32]
+        g.http_cache_validators = (digest, last_modified)
+        if is_resource_modified(request.environ, etag=digest):
+            return None
+        response = current_app.response_class(status=304)
+        self._set_validators(response, digest, last_modified)
+        return response
+
+    @staticmethod
+    def _set_validators(response, etag, last_modified):
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+
+    def _policy_for_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, 'http_cache_policy', None)
+
+    def _shared(self):
+        """Whether a shared cache may keep this response for everyone."""
+        if current_user.is_authenticated:
+            return False
+        if session.modified:
+            return False
+        return not (session and current_app.session_interface.should_set_cookie(current_app, session))
+
+    def _finish(self, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+            return response
+        kind = self._policy_for_request()
+        if kind is None:
+            return response
+
+        if self._shared():
+            response.headers['Cache-Control'] = POLICIES[kind].format(feed_max_age=self.feed_max_age)
+        else:
+            response.headers['Cache-Control'] = PRIVATE
+        response.vary.add('Cookie')
+        if response.status_code == 304 or response.is_streamed or response.direct_passthrough:
+            return response
+
+        if 'ETag' not in response.headers:
+            response.add_etag()
+        if is_resource_modified(request.environ, etag=response.headers['ETag']):
+            return response
+        not_modified = current_app.response_class(status=304)
+        for name in KEPT_HEADERS:
+            if name in response.headers:
+                not_modified.headers[name] = response.headers[name]
+        return not_modified
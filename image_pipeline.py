@@ -0,0 +1,306 @@
+"""Background processing of uploaded images into responsive variants.
+
+Uploads are checked, spooled to disk and handed to a small process pool so
+the request returns straight away. A worker decodes the image once and
+writes every width variant in JPEG and WebP (each file renamed into place
+atomically), then a ``<stem>.json`` manifest describing them. The manifest
+doubles as the job status shared by every worker process, and templates use
+it (``image_srcset``) to emit ``srcset`` lists.
+
+Files are content-addressed (see ``upload_store``): the stored filename is
+``ab/cd/<sha256>.jpg``, the largest JPEG variant, so code and templates that
+only know a single upload filename keep working unchanged, and uploading an
+image that is already stored does no work at all.
+"""
+import atexit
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import url_for
+from PIL import Image, ImageOps, features
+
+from upload_store import DIGEST_RE, shard_dir
+
+# (name, bounding box edge in px), largest first; the first is the canonical file
+VARIANTS = (('full', 1200), ('card', 800), ('thumb', 400))
+FORMATS = (('jpeg', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+           ('webp', 'webp', {'quality': 80, 'method': 4}))
+
+CHUNK_SIZE = 64 * 1024
+# Larger images are refused before any pixel data is decoded (~ a 48 MP photo)
+MAX_PIXELS = 50_000_000
+
+
+def _variant_name(stem, variant, ext):
+    base = f'{shard_dir(stem)}/{stem}'
+    return f'{base}.{ext}' if variant == VARIANTS[0][0] else f'{base}-{variant}.{ext}'
+
+
+def stored_name(stem):
+    """Filename to store for an upload: its largest JPEG variant."""
+    return _variant_name(stem, VARIANTS[0][0], 'jpg')
+
+
+def _replace_atomically(path, write):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_manifest(path, manifest):
+    def write(tmp):
+        with open(tmp, 'w') as fh:
+            json.dump(manifest, fh)
+    _replace_atomically(path, write)
+
+
+def check_dimensions(img, max_pixels=MAX_PIXELS):
+    """Refuse decompression bombs using only the header of an opened image."""
+    if img.width * img.height > max_pixels:
+        raise ValueError(f'Image is too large ({img.width}x{img.height} pixels)')
+
+
+def process_image(source, dest_dir, stem, max_pixels=MAX_PIXELS):
+    """Render every variant of ``source`` under ``dest_dir``; runs in a worker.
+
+    Always leaves a manifest behind (``status`` ``ready`` or ``failed``) and
+    removes the spooled source.
+    """
+    formats = [f for f in FORMATS if f[0] != 'webp' or features.check('webp')]
+    variants = []
+    os.makedirs(os.path.join(dest_dir, shard_dir(stem)), exist_ok=True)
+    try:
+        with Image.open(source) as img:
+            check_dimensions(img, max_pixels)
+            # Let the JPEG decoder scale by 1/2..1/8 while decoding, so a
+            # phone photo never exists in memory at full resolution
+            scale = VARIANTS[0][1] / max(img.size)
+            if scale < 1:
+                img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            ImageOps.exif_transpose(img, in_place=True)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            for name, edge in VARIANTS:
+                # Shrunk in place, each variant from the previous, larger one
+                img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+                if variants and variants[-1]['width'] == img.width:
+                    continue  # source smaller than this size; nothing new to add
+                entry = {'name': name, 'width': img.width, 'height': img.height}
+                for fmt, ext, options in formats:
+                    filename = _variant_name(stem, name, ext)
+                    _replace_atomically(
+                        os.path.join(dest_dir, filename),
+                        lambda tmp, fmt=fmt, options=options: img.save(tmp, fmt.upper(), **options),
+                    )
+                    entry[fmt] = filename
+                variants.append(entry)
+        manifest = {'status': 'ready', 'variants': variants}
+    except Exception as exc:
+        manifest = {'status': 'failed', 'error': str(exc)}
+    finally:
+        if os.path.exists(source):
+            os.remove(source)
+
+    _write_manifest(os.path.join(dest_dir, shard_dir(stem), f'{stem}.json'), manifest)
+    return manifest
+
+
+class ImagePipeline:
+    """Queue uploads for :func:`process_image` on a bounded process pool.
+
+    ``IMAGE_WORKERS`` sets the pool size (0 processes inline, in the
+    request). Once ``IMAGE_MAX_PENDING`` jobs are queued in this process new
+    uploads are processed inline too, which pushes back on the client
+    instead of letting the queue grow without bound.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.upload_folder = None
+        self.spool_dir = None
+        self.workers = 0
+        self.max_pending = 0
+        self.max_pixels = MAX_PIXELS
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._jobs = {}
+        self._manifests = {}
+
+    def init_app(self, app):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        # Outside the static folder: originals keep their EXIF/GPS data until processed
+        self.spool_dir = app.config.get('IMAGE_SPOOL_DIR') or os.path.join(app.instance_path, 'image_spool')
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        self.max_pending = app.config.get('IMAGE_MAX_PENDING', 32)
+        self.max_pixels = app.config.get('IMAGE_MAX_PIXELS', MAX_PIXELS)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        app.extensions['image_pipeline'] = self
+        app.jinja_env.globals['image_srcset'] = self.srcset
+        app.request_class = self._spooling_request(app.request_class)
+        atexit.register(self.shutdown)
+
+    def _spooling_request(self, base):
+        spool_dir = self.spool_dir
+
+        class SpoolingRequest(base):
+            """Write uploaded files straight into the spool directory.
+
+            Werkzeug already keeps at most 500 KB of an upload in memory;
+            spooling next to the pipeline's files lets ``submit`` hard-link
+            the body into place instead of copying it. The spool is never
+            under the static folder, so raw uploads are not served.
+            """
+
+            def _get_file_stream(self, total_content_length, content_type,
+                                 filename=None, content_length=None):
+                return tempfile.NamedTemporaryFile(dir=spool_dir, prefix='body.')
+
+        return SpoolingRequest
+
+    # Submitting -------------------------------------------------------
+
+    def submit(self, file_storage):
+        """Check and spool an uploaded image and queue it for processing.
+
+        Returns the filename to store; raises ``ValueError`` if the upload is
+        not an image Pillow can read or has more than ``IMAGE_MAX_PIXELS``
+        pixels. Images stored before are not processed again.
+        """
+        stream = file_storage.stream
+        try:
+            with Image.open(stream) as img:
+                check_dimensions(img, self.max_pixels)
+                img.verify()
+        except ValueError:
+            raise
+        except Image.DecompressionBombError as exc:
+            raise ValueError('Image is too large') from exc
+        except Exception as exc:
+            raise ValueError('Invalid image') from exc
+
+        stream.seek(0)
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+        stem = digest.hexdigest()
+
+        self.store.register(stem)
+        if self.status(stem) not in ('ready', 'pending'):
+            source = os.path.join(self.spool_dir, stem)
+            _replace_atomically(source, lambda tmp: self._spool(stream, tmp))
+            self._dispatch(stem, source)
+        return stored_name(stem)
+
+    @staticmethod
+    def _spool(stream, path):
+        # Spooled by SpoolingRequest: link it into place rather than copy
+        try:
+            os.link(stream.name, path)
+        except (AttributeError, TypeError, OSError):
+            stream.seek(0)
+            with open(path, 'wb') as fh:
+                shutil.copyfileobj(stream, fh, CHUNK_SIZE)
+
+    def _dispatch(self, stem, source):
+        executor = self._get_executor()
+        with self._lock:
+            self._jobs = {k: f for k, f in self._jobs.items() if not f.done()}
+            busy = len(self._jobs) >= self.max_pending
+        if executor is None or busy:
+            process_image(source, self.upload_folder, stem, self.max_pixels)
+            return
+        future = executor.submit(process_image, source, self.upload_folder, stem, self.max_pixels)
+        with self._lock:
+            self._jobs[stem] = future
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+        # A pool inherited over fork (gunicorn preload) is unusable; start a new one
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._executor_pid = os.getpid()
+                    self._jobs = {}
+        return self._executor
+
+    def process_pending(self):
+        """Process uploads left in the spool by a worker that exited early."""
+        done = 0
+        for stem in sorted(os.listdir(self.spool_dir)):
+            if DIGEST_RE.match(stem):
+                process_image(os.path.join(self.spool_dir, stem), self.upload_folder, stem,
+                              self.max_pixels)
+                done += 1
+        return done
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # Lookups ----------------------------------------------------------
+
+    @staticmethod
+    def stem_for(filename):
+        """The content digest of a stored upload, or None for other names."""
+        stem = (filename or '').rsplit('/', 1)[-1].split('.', 1)[0]
+        if DIGEST_RE.match(stem) and filename.startswith(shard_dir(stem) + '/'):
+            return stem
+        return None
+
+    def manifest(self, filename):
+        """The variant manifest for a stored upload, or None if there isn't one yet."""
+        stem = self.stem_for(filename)
+        if stem is None:
+            return None
+        cached = self._manifests.get(stem)
+        if cached is not None:
+            return cached
+        try:
+            with open(os.path.join(self.upload_folder, shard_dir(stem), f'{stem}.json')) as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        # Finished manifests never change, so they can be kept for good
+        if manifest['status'] == 'ready':
+            if len(self._manifests) >= 4096:
+                self._manifests.clear()
+            self._manifests[stem] = manifest
+        return manifest
+
+    def status(self, stem):
+        """``pending``, ``ready``, ``failed``, or None for an unknown job."""
+        if not DIGEST_RE.match(stem or ''):
+            return None
+        future = self._jobs.get(stem)
+        if future is not None and not future.done():
+            return 'pending'
+        manifest = self.manifest(stored_name(stem))
+        if manifest is not None:
+            return manifest['status']
+        if os.path.exists(os.path.join(self.spool_dir, stem)):
+            return 'pending'
+        return None
+
+    def srcset(self, filename, fmt='jpeg', prefix='uploads/'):
+        """``srcset`` value listing every variant of an upload ('' if none)."""
+        manifest = self.manifest(filename)
+        if not manifest or manifest['status'] != 'ready':
+            return ''
+        return ', '.join(
+            f"{url_for('static', filename=prefix + v[fmt])} {v['width']}w"
+            for v in reversed(manifest['variants']) if fmt in v
+        )
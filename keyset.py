@@ -0,0 +1,126 @@
+"""Keyset (cursor) pagination and cached approximate totals.
+
+``keyset_paginate`` pages through a query ordered by a set of key columns,
+newest/highest first, using ``WHERE (a, b) < (:a, :b)`` instead of OFFSET,
+so page 500 costs the same as page 1 and no COUNT(*) is needed. The last
+key column must be unique (the primary key) to break ties. Cursors are
+opaque URL-safe tokens, usable in template links and JSON alike.
+
+``approximate_count`` memoizes a COUNT(*) for a short TTL for pages that
+still want to show a total.
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values, direction='next'):
+    payload = [direction] + [
+        {'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(values, direction)``; malformed tokens mean "first page"."""
+    if not token:
+        return None, 'next'
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, *values = json.loads(raw)
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        values = [datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v for v in values]
+        return values, direction
+    except (ValueError, TypeError, KeyError):
+        return None, 'next'
+
+
+def _beyond(keys, values, descending):
+    """``(k1, k2, ...) < (v1, v2, ...)`` (or ``>``), spelled out portably."""
+    clauses = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        step = key < value if descending else key > value
+        clauses.append(and_(*[k == v for k, v in zip(keys[:i], values[:i])], step))
+    return or_(*clauses)
+
+
+class KeysetPage:
+    """One page of keyset results; iterable like ``Pagination.items``."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=10, total=None):
+    """Fetch the page after (or before) ``cursor`` ordered by ``keys`` descending."""
+    values, direction = decode_cursor(cursor)
+    if values is not None and len(values) != len(keys):
+        values, direction = None, 'next'
+
+    forward = direction == 'next'
+    if values is not None:
+        query = query.filter(_beyond(keys, values, descending=forward))
+    order = [k.desc() if forward else k.asc() for k in keys]
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def cursor_for(item, towards):
+        return encode_cursor([getattr(item, k.key) for k in keys], towards)
+
+    has_next = more if forward else values is not None
+    has_prev = values is not None if forward else more
+    return KeysetPage(
+        rows,
+        per_page,
+        next_cursor=cursor_for(rows[-1], 'next') if rows and has_next else None,
+        prev_cursor=cursor_for(rows[0], 'prev') if rows and has_prev else None,
+        total=total,
+    )
+
+
+_count_cache = {}
+_count_lock = threading.Lock()
+COUNT_CACHE_MAX = 1024
+
+
+def approximate_count(key, query, ttl=60):
+    """COUNT(*) of ``query``, recomputed at most every ``ttl`` seconds per key."""
+    now = time.monotonic()
+    hit = _count_cache.get(key)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+
+    total = query.order_by(None).count()
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_MAX:
+            _count_cache.clear()
+        _count_cache[key] = (total, now + ttl)
+    return total
@@ -0,0 +1,281 @@
+"""Full-page cache for anonymous readers.
+
+Logged-out GETs of public pages (feeds, post pages, search) render the same
+HTML for everyone until a post, comment or like changes. Views decorated
+with :meth:`PageCache.cached` store their response body under the request's
+host, path and query string. The view tags it with what it shows
+(:meth:`PageCache.tag`, e.g. ``post:<id>``, ``user:<id>`` or ``posts`` for
+any list of posts), and mapper events registered with
+:meth:`PageCache.track` purge those tags when a tracked row is committed.
+
+Purging does not touch entries. Each tag remembers when it was last
+purged, and an entry is served only if none of its tags were purged after
+its render began. That also covers writes that commit while the page is
+being rendered. Entries expire after ``PAGE_CACHE_TTL`` seconds regardless,
+which bounds the staleness of what is not tagged (view counts, trending
+order).
+
+Backends:
+
+* ``memory``: per-process LRU bounded by ``PAGE_CACHE_MAX_BYTES``. Purges
+  only reach the worker that made the write; others catch up within the TTL.
+* ``file``: entries and tag stamps in ``PAGE_CACHE_DIR``, shared by every
+  worker on the host.
+* ``off``: disabled.
+
+Only the body, status, content type and validators (``STORED_HEADERS``) are
+stored, never cookies. A request
+carrying flashed messages is neither served from the cache nor stored. Work
+a view must still do on a hit, like counting a view, is registered with
+:meth:`PageCache.on_hit` and requested with :meth:`PageCache.replay`.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+ALL = '*'
+
+# Validators set by http_cache.HttpCache.policy, so a hit can still end in a 304
+STORED_HEADERS = ('ETag', 'Last-Modified')
+
+
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._purged = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old['body'])
+            self._entries[key] = entry
+            self._size += len(entry['body'])
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted['body'])
+
+    def purged_at(self, tags):
+        return max((self._purged.get(tag, 0) for tag in tags), default=0)
+
+    def purge(self, tags, ttl):
+        now = time.time_ns()
+        with self._lock:
+            for tag in tags:
+                self._purged[tag] = now
+            # Stamps older than the TTL can no longer make a live entry stale
+            if len(self._purged) > 10000:
+                cutoff = now - int(ttl * 1e9)
+                self._purged = {t: ns for t, ns in self._purged.items() if ns > cutoff or t == ALL}
+
+
+class FileBackend:
+    """Entries as files named by key hash; tag purge times as file mtimes."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.tag_dir = os.path.join(path, 'tags')
+        os.makedirs(self.tag_dir, exist_ok=True)
+        self._writes = 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + '.page')
+
+    def _tag_path(self, tag):
+        return os.path.join(self.tag_dir, hashlib.sha1(tag.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._entry_path(key), 'rb') as fh:
+                header, body = fh.read().split(b'\n', 1)
+        except (OSError, ValueError):
+            return None
+        entry = json.loads(header)
+        entry['body'] = body
+        return entry
+
+    def set(self, key, entry):
+        header = json.dumps({k: v for k, v in entry.items() if k != 'body'}).encode('utf-8')
+        path = self._entry_path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(header + b'\n' + entry['body'])
+        os.replace(tmp, path)
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete the least recently written entries beyond ``max_bytes``."""
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.page'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def purged_at(self, tags):
+        latest = 0
+        for tag in tags:
+            try:
+                latest = max(latest, os.stat(self._tag_path(tag)).st_mtime_ns)
+            except OSError:
+                pass
+        return latest
+
+    def purge(self, tags, ttl):
+        now = time.time_ns()
+        for tag in tags:
+            path = self._tag_path(tag)
+            with open(path, 'a'):
+                pass
+            os.utime(path, ns=(now, now))
+
+
+class PageCache:
+    def __init__(self, db):
+        self.db = db
+        self.backend = None
+        self.ttl = 60
+        self._actions = {}
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def init_app(self, app):
+        self.ttl = float(app.config.get('PAGE_CACHE_TTL', self.ttl))
+        max_bytes = int(app.config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        kind = app.config.get('PAGE_CACHE_BACKEND', 'memory')
+        if kind == 'file':
+            path = app.config.get('PAGE_CACHE_DIR') or os.path.join(app.instance_path, 'page_cache')
+            self.backend = FileBackend(path, max_bytes)
+        elif kind == 'memory':
+            self.backend = MemoryBackend(max_bytes)
+        else:
+            self.backend = None
+        app.extensions['page_cache'] = self
+
+    # Invalidation -----------------------------------------------------
+
+    def track(self, model, tags_for):
+        """Purge ``tags_for(obj)`` once a change to a ``model`` row commits."""
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, functools.partial(self._changed, tags_for))
+
+    def _changed(self, tags_for, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('page_cache_tags', set()).update(tags_for(target))
+
+    def _after_commit(self, session):
+        tags = session.info.pop('page_cache_tags', None)
+        if tags:
+            self.purge(*tags)
+
+    def _after_rollback(self, session):
+        session.info.pop('page_cache_tags', None)
+
+    def purge(self, *tags):
+        """Invalidate every entry tagged with any of ``tags``."""
+        if self.backend is not None and tags:
+            self.backend.purge(tags, self.ttl)
+
+    def clear(self):
+        """Invalidate every entry (e.g. after bulk SQL that bypasses the events)."""
+        self.purge(ALL)
+
+    # Caching views ----------------------------------------------------
+
+    def tag(self, *tags):
+        """Tag the response being rendered with ``tags``."""
+        pending = g.get('page_cache_tags')
+        if pending is not None:
+            pending.update(str(t) for t in tags)
+
+    def on_hit(self, name, fn):
+        """Register ``fn`` under ``name`` for :meth:`replay`."""
+        self._actions[name] = fn
+
+    def replay(self, name, *args):
+        """Run action ``name`` with ``args`` again whenever this page is served from cache."""
+        pending = g.get('page_cache_actions')
+        if pending is not None:
+            pending.append([name, list(args)])
+
+    def _key(self):
+        raw = f'{request.host}{request.full_path}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _cacheable(self):
+        return (self.backend is not None and request.method == 'GET'
+                and not current_user.is_authenticated and '_flashes' not in session)
+
+    def cached(self, view):
+        """Serve anonymous GETs of ``view`` from the cache when fresh."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self._cacheable():
+                return view(*args, **kwargs)
+            key = self._key()
+            entry = self.backend.get(key)
+            if entry is not None and self._fresh(entry):
+                for name, action_args in entry['actions']:
+                    self._actions[name](*action_args)
+                response = make_response(entry['body'], entry['status'])
+                response.mimetype = entry['mimetype']
+                response.headers.update(entry.get('headers', {}))
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            started = time.time_ns()
+            g.page_cache_tags = {ALL}
+            g.page_cache_actions = []
+            response = make_response(view(*args, **kwargs))
+            if (response.status_code == 200 and not response.direct_passthrough
+                    and not response.is_streamed and '_flashes' not in session):
+                self.backend.set(key, {
+                    'status': response.status_code, 'mimetype': response.mimetype,
+                    'started': started, 'expires': time.time() + self.ttl,
+                    'tags': sorted(g.page_cache_tags), 'actions': g.page_cache_actions,
+                    'headers': {name: response.headers[name] for name in STORED_HEADERS
+                                if name in response.headers},
+                    'body': response.get_data(),
+                })
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+
+    def _fresh(self, entry):
+        return entry['expires'] > time.time() and self.backend.purged_at(entry['tags']) < entry['started']
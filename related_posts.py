@@ -0,0 +1,330 @@
+"""Related posts from TF-IDF similarity, precomputed into a lookup table.
+
+Every published item gets a sparse TF-IDF vector. It is built from its
+title, tags and text, with title words and tags weighted up, and pruned to
+its ``MAX_TERMS`` strongest terms. The vector is L2-normalised. Cosine
+similarity is then the dot product of two vectors, so only items sharing a
+term are ever compared. A common term would make every item a candidate for
+every other, so each term contributes only its ``MAX_POSTINGS`` strongest
+postings: an item is scored against another through the terms where it
+ranks among those. The work per item is therefore bounded by
+``MAX_TERMS * MAX_POSTINGS`` however large the site grows.
+
+The vectors are stored as postings in ``related_terms_<table>``, and each
+item's ``k`` best neighbours in ``related_<table>``. A page then needs one
+lookup on ``(item_id, rank)``, joined to whatever card query it shows. The
+number of indexed items, needed for IDF, is kept in the one-row
+``related_meta_<table>`` so a save does not have to count the postings.
+
+``rebuild()`` recomputes everything as a batch job (``flask
+rebuild-related``). It reads the table twice, first for document
+frequencies and then for the pruned vectors. It holds only those vectors, as
+a SciPy sparse matrix, and multiplies blocks of it by the capped postings. It is never run
+on startup. Run it once after upgrading, after bulk imports and from time
+to time. Until then, items keep the neighbours they were given
+incrementally.
+
+When an item is published, edited, unpublished or deleted, mapper events
+update it in the same transaction:
+
+* its postings are rewritten;
+* its neighbours come from one join over the postings;
+* it is merged into the lists of the items it now outscores.
+
+Postings written incrementally use the document frequencies at the time
+they are written. The periodic ``rebuild()`` puts every item back on the
+same footing.
+"""
+import heapq
+import math
+import re
+from array import array
+from collections import Counter, defaultdict
+
+from sqlalchemy import Column, Float, Index, Integer, String, Table, delete, event, func, inspect, select, update
+
+MAX_TERMS = 64
+# Strongest postings of each term that candidates are drawn from
+MAX_POSTINGS = 1000
+# Neighbours considered when merging a changed item into other items' lists
+CANDIDATES = 200
+BATCH_SIZE = 500
+# Rows of the similarity matrix computed at a time by rebuild()
+BLOCK_SIZE = 256
+
+STOPWORDS = frozenset('''
+    about above after again against all also and any are because been before being below
+    between both but can could did does doing down during each few for from further had has
+    have having her here hers him his how into its itself just more most not now off once
+    only other our ours out over own same she should some such than that the their theirs
+    them then there these they this those through too under until very was were what when
+    where which while who whom why will with would you your yours amp nbsp quot http https
+    www com
+'''.split())
+_WORD = re.compile(r'[a-z][a-z0-9]{2,}')
+_TAG = re.compile(r'<[^>]+>')
+
+
+def tokens(text):
+    """Lower-cased words of ``text`` with HTML tags and stopwords removed."""
+    words = _WORD.findall(_TAG.sub(' ', text or '').lower())
+    return [w[:64] for w in words if w not in STOPWORDS]
+
+
+class RelatedIndex:
+    """Top-``k`` related items for one model.
+
+    ``fields`` maps text columns to weights. ``tags`` names a comma-separated
+    tag column whose values become ``tag:<name>`` terms. Only rows matching
+    ``where`` (``{column: value}``, e.g. ``{Post.is_published: True}``) are
+    indexed.
+    """
+
+    def __init__(self, db, model, fields, tags=None, tag_weight=3.0, where=None, k=6):
+        self.db = db
+        self.model = model
+        self.fields = {column.key: weight for column, weight in fields.items()}
+        self.tags = tags.key if tags is not None else None
+        self.tag_weight = tag_weight
+        self.where = {column.key: value for column, value in (where or {}).items()}
+        self.k = k
+
+        name = model.__tablename__
+        key_type = model.__table__.c.id.type
+        self.table = Table(
+            f'related_{name}', db.metadata,
+            Column('item_id', key_type, primary_key=True),
+            Column('rank', Integer, primary_key=True, autoincrement=False),
+            Column('related_id', key_type, nullable=False),
+            Column('score', Float, nullable=False),
+            Index(f'ix_related_{name}_related', 'related_id'),
+        )
+        self.terms = Table(
+            f'related_terms_{name}', db.metadata,
+            Column('item_id', key_type, primary_key=True),
+            Column('term', String(64), primary_key=True),
+            Column('weight', Float, nullable=False),
+            # Postings: a term's strongest items first, from the index alone
+            Index(f'ix_related_terms_{name}_strongest', 'term', 'weight', 'item_id'),
+        )
+        self.meta = Table(
+            f'related_meta_{name}', db.metadata,
+            Column('id', Integer, primary_key=True, autoincrement=False),
+            Column('item_count', Integer, nullable=False),
+        )
+        self._watched = {*self.fields, *self.where, *([self.tags] if self.tags else [])}
+        event.listen(model, 'after_insert', self._inserted)
+        event.listen(model, 'after_update', self._updated)
+        event.listen(model, 'after_delete', self._deleted)
+
+    def init_app(self, app):
+        app.extensions[f'related.{self.model.__tablename__}'] = self
+
+    # Vectors ----------------------------------------------------------
+
+    def _counts(self, values):
+        """Weighted term frequencies of one item (``values`` maps column key to value)."""
+        counts = Counter()
+        for key, weight in self.fields.items():
+            for word in tokens(values.get(key)):
+                counts[word] += weight
+        if self.tags:
+            for tag in (values.get(self.tags) or '').split(','):
+                tag = tag.strip().lower()
+                if tag:
+                    counts[f'tag:{tag}'[:64]] += self.tag_weight
+        return counts
+
+    def _vector(self, counts, df, total):
+        """Pruned, normalised TF-IDF weights; ``df`` includes this item."""
+        weights = {term: (1 + math.log(tf)) * (math.log((1 + total) / (1 + df.get(term, 1))) + 1)
+                   for term, tf in counts.items()}
+        top = heapq.nlargest(MAX_TERMS, weights.items(), key=lambda item: item[1])
+        norm = math.sqrt(sum(w * w for _, w in top)) or 1.0
+        return {term: w / norm for term, w in top}
+
+    def _published(self, values):
+        return all(values.get(key) == value for key, value in self.where.items())
+
+    # Batch ------------------------------------------------------------
+
+    def _scan(self):
+        """``(key, term counts)`` of every indexed item, streamed from the table."""
+        table = self.model.__table__
+        columns = [table.c.id] + [table.c[key] for key in sorted(self._watched)]
+        stmt = select(*columns).where(*(table.c[key] == value for key, value in self.where.items()))
+        with self.db.engine.connect() as conn:
+            for row in conn.execution_options(yield_per=BATCH_SIZE).execute(stmt):
+                values = row._mapping
+                yield values['id'], self._counts(values)
+
+    def rebuild(self):
+        """Recompute every vector and neighbour list; returns the number of items indexed."""
+        # Only this batch job needs them, so web workers never import them
+        import numpy as np
+        from scipy import sparse
+
+        total, df = 0, Counter()
+        for _, counts in self._scan():
+            total += 1
+            df.update(counts.keys())
+
+        keys, vocab = [], {}
+        rows, cols, weights = array('i'), array('i'), array('d')
+        for key, counts in self._scan():
+            vector = self._vector(counts, df, total)
+            if not vector:
+                continue
+            for term, weight in vector.items():
+                rows.append(len(keys))
+                cols.append(vocab.setdefault(term, len(vocab)))
+                weights.append(weight)
+            keys.append(key)
+        del df
+
+        matrix = sparse.csr_matrix(
+            (np.frombuffer(weights, dtype=np.float64), (np.frombuffer(rows, dtype=np.int32),
+                                                         np.frombuffer(cols, dtype=np.int32))),
+            shape=(len(keys), len(vocab)))
+        # Each term's MAX_POSTINGS strongest postings, as the incremental join reads them
+        postings = matrix.tocsc()
+        for term in range(postings.shape[1]):
+            lo, hi = postings.indptr[term], postings.indptr[term + 1]
+            if hi - lo > MAX_POSTINGS:
+                column = postings.data[lo:hi]
+                column[np.argpartition(-column, MAX_POSTINGS)[MAX_POSTINGS:]] = 0
+        postings.eliminate_zeros()
+        postings = postings.T.tocsr()
+
+        related = []
+        for start in range(0, len(keys), BLOCK_SIZE):
+            scores = (matrix[start:start + BLOCK_SIZE] @ postings).tocsr()
+            for offset in range(scores.shape[0]):
+                lo, hi = scores.indptr[offset], scores.indptr[offset + 1]
+                others, values = scores.indices[lo:hi], scores.data[lo:hi]
+                keep = (others != start + offset) & (values > 0)
+                others, values = others[keep], values[keep]
+                if len(values) > self.k:
+                    best = np.argpartition(-values, self.k)[:self.k]
+                    others, values = others[best], values[best]
+                order = np.argsort(-values, kind='stable')
+                key = keys[start + offset]
+                related.extend({'item_id': key, 'rank': rank, 'related_id': keys[others[i]],
+                                'score': float(values[i])} for rank, i in enumerate(order))
+
+        terms = list(vocab)
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(self.terms))
+            conn.execute(delete(self.table))
+            conn.execute(delete(self.meta))
+            conn.execute(self.meta.insert().values(id=1, item_count=len(keys)))
+            for start in range(0, len(rows), BATCH_SIZE):
+                conn.execute(self.terms.insert(), [
+                    {'item_id': keys[rows[i]], 'term': terms[cols[i]], 'weight': weights[i]}
+                    for i in range(start, min(start + BATCH_SIZE, len(rows)))])
+            for start in range(0, len(related), BATCH_SIZE):
+                conn.execute(self.table.insert(), related[start:start + BATCH_SIZE])
+        return len(keys)
+
+    def _rows(self, key, scored):
+        best = heapq.nlargest(self.k, ((score, other) for other, score in scored if score > 0),
+                              key=lambda item: item[0])
+        return [{'item_id': key, 'rank': rank, 'related_id': other, 'score': score}
+                for rank, (score, other) in enumerate(best)]
+
+    # Incremental ------------------------------------------------------
+
+    def _inserted(self, mapper, connection, target):
+        self._reindex(connection, target)
+
+    def _updated(self, mapper, connection, target):
+        state = inspect(target)
+        if any(state.attrs[key].history.has_changes() for key in self._watched):
+            self._reindex(connection, target)
+
+    def _deleted(self, mapper, connection, target):
+        self._remove(connection, target.id)
+
+    def _remove(self, conn, key):
+        if conn.execute(delete(self.terms).where(self.terms.c.item_id == key)).rowcount:
+            self._count_items(conn, -1)
+        conn.execute(delete(self.table).where(self.table.c.item_id == key))
+        # Lists that pointed here keep their other entries until the next rebuild
+        conn.execute(delete(self.table).where(self.table.c.related_id == key))
+
+    def _reindex(self, conn, target):
+        key = target.id
+        self._remove(conn, key)
+        values = {name: getattr(target, name) for name in self._watched}
+        if not self._published(values):
+            return
+
+        counts = self._counts(values)
+        terms = self.terms
+        total = self._indexed(conn) + 1
+        df = Counter()
+        words = list(counts)
+        for start in range(0, len(words), BATCH_SIZE):
+            df.update(dict(conn.execute(
+                select(terms.c.term, func.count()).where(terms.c.term.in_(words[start:start + BATCH_SIZE]))
+                .group_by(terms.c.term)).all()))
+        for term in counts:
+            df[term] += 1
+        vector = self._vector(counts, df, total)
+        if not vector:
+            return
+        conn.execute(terms.insert(), [{'item_id': key, 'term': term, 'weight': weight}
+                                      for term, weight in vector.items()])
+        self._count_items(conn, 1)
+
+        # Sparse dot product with the strongest postings of each term
+        totals = Counter()
+        for term, weight in vector.items():
+            for other, other_weight in conn.execute(
+                    select(terms.c.item_id, terms.c.weight).where(terms.c.term == term)
+                    .order_by(terms.c.weight.desc()).limit(MAX_POSTINGS)):
+                if other != key:
+                    totals[other] += weight * other_weight
+        scored = totals.most_common(CANDIDATES)
+        rows = self._rows(key, scored)
+        if rows:
+            conn.execute(self.table.insert(), rows)
+        self._merge_into_others(conn, key, scored)
+
+    def _indexed(self, conn):
+        """Number of items with postings."""
+        count = conn.execute(select(self.meta.c.item_count)).scalar()
+        if count is None:
+            # Not built yet: count once, then keep the count up to date
+            count = conn.execute(select(func.count(func.distinct(self.terms.c.item_id)))).scalar()
+            conn.execute(self.meta.insert().values(id=1, item_count=count))
+        return count
+
+    def _count_items(self, conn, delta):
+        conn.execute(update(self.meta).values(item_count=self.meta.c.item_count + delta))
+
+    def _merge_into_others(self, conn, key, scored):
+        """Put ``key`` into the lists of candidates it now ranks in."""
+        if not scored:
+            return
+        t = self.table
+        lists = defaultdict(list)
+        for row in conn.execute(select(t.c.item_id, t.c.related_id, t.c.score)
+                                .where(t.c.item_id.in_([other for other, _ in scored]))):
+            lists[row.item_id].append((row.related_id, row.score))
+        changed = []
+        for other, score in scored:
+            current = lists[other]
+            if len(current) < self.k or score > min(s for _, s in current):
+                changed.append((other, self._rows(other, current + [(key, score)])))
+        for other, rows in changed:
+            conn.execute(delete(t).where(t.c.item_id == other))
+            conn.execute(t.insert(), rows)
+
+    # Reading ----------------------------------------------------------
+
+    def load(self, query, key, limit=None):
+        """Entities of ``query`` related to ``key``, best first, in one indexed lookup."""
+        t = self.table
+        return query.join(t, t.c.related_id == self.model.id) \
+            .filter(t.c.item_id == key).order_by(t.c.rank).limit(limit or self.k).all()
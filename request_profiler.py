@@ -0,0 +1,174 @@
+"""Opt-in per-request timing: SQL, templates and named spans.
+
+With ``PROFILE_REQUESTS`` on, every request records how many SQL statements
+it ran and for how long (engine cursor events), how long templates took to
+render (Flask's template signals), and the time spent in spans marked with
+:func:`span` / :func:`timed`, such as Markdown rendering or HTML sanitizing.
+The totals go out as a ``Server-Timing`` header (shown per request in the
+browser's network panel) and as one JSON log line on the
+``request_profiler`` logger.
+
+A ``PROFILE_SAMPLE_RATE`` fraction of requests also runs under cProfile;
+those that take at least ``PROFILE_SLOW_MS`` are dumped to ``PROFILE_DIR``
+as ``.prof`` files for ``python -m pstats`` or snakeviz.
+
+Off (the default), nothing is hooked up and spans cost one ``g`` lookup.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('request_profiler')
+
+
+class RequestProfile:
+    """Timings collected during one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.templates = 0.0
+        self.spans = {}
+        self.profiler = None
+        self._template_started = []
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+def _current():
+    return g.get('request_profile') if has_request_context() else None
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the current request's ``name`` span."""
+    profile = _current()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of :func:`span`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Engine-wide listeners, installed once; they ignore work outside a profiled request
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    profile = _current()
+    starts = conn.info.get('profile_query_start')
+    if profile is not None and starts:
+        profile.queries += 1
+        profile.sql += time.perf_counter() - starts.pop()
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.slow_ms = 500.0
+        self.sample_rate = 0.0
+        self.profile_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['request_profiler'] = self
+        if not app.config.get('PROFILE_REQUESTS'):
+            return
+        self.slow_ms = float(app.config.get('PROFILE_SLOW_MS', self.slow_ms))
+        self.sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE', self.sample_rate))
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+        if not logger.handlers:
+            # Opted in, so make the log lines visible without extra logging setup
+            logger.addHandler(logging.StreamHandler())
+            logger.setLevel(logging.INFO)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        profile = g.request_profile = RequestProfile()
+        if self.sample_rate and random.random() < self.sample_rate:
+            profile.profiler = cProfile.Profile()
+            profile.profiler.enable()
+
+    def _template_started(self, app, template, context, **extra):
+        profile = _current()
+        if profile is not None:
+            profile._template_started.append(time.perf_counter())
+
+    def _template_finished(self, app, template, context, **extra):
+        profile = _current()
+        if profile is not None and profile._template_started:
+            elapsed = time.perf_counter() - profile._template_started.pop()
+            # Nested renders (render_template inside a template) count once
+            if not profile._template_started:
+                profile.templates += elapsed
+
+    def _finish(self, response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+        total = time.perf_counter() - profile.started
+        if profile.profiler is not None:
+            profile.profiler.disable()
+
+        metrics = [('sql', profile.sql, f'{profile.queries} queries'), ('tpl', profile.templates, 'templates')]
+        metrics += [(name, seconds, None) for name, seconds in sorted(profile.spans.items())]
+        metrics.append(('total', total, None))
+        response.headers.add('Server-Timing', ', '.join(
+            f'{name};dur={seconds * 1000:.1f}' + (f';desc="{desc}"' if desc else '')
+            for name, seconds, desc in metrics
+        ))
+
+        record = {
+            'method': request.method, 'path': request.path, 'endpoint': request.endpoint,
+            'status': response.status_code, 'total_ms': round(total * 1000, 1),
+            'queries': profile.queries, 'sql_ms': round(profile.sql * 1000, 1),
+            'template_ms': round(profile.templates * 1000, 1),
+            **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in profile.spans.items()},
+        }
+        if profile.profiler is not None and total * 1000 >= self.slow_ms:
+            record['profile'] = self._dump(profile.profiler)
+        logger.info(json.dumps(record, separators=(',', ':')))
+        return response
+
+    def _dump(self, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'index'
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method}-{slug}-{os.getpid()}-{random.randrange(1 << 24):06x}'
+        path = os.path.join(self.profile_dir, name + '.prof')
+        profiler.dump_stats(path)
+        return path
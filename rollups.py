@@ -0,0 +1,283 @@
+"""Daily counters for admin dashboards and analytics.
+
+Admin pages used to count and group whole tables on every load. A
+``DailyRollups`` table instead keeps one row per ``(metric, day,
+dimension)``: how many users signed up, posts were created or published,
+comments and likes were left that day, optionally split by a dimension such
+as the post's category. Mapper events keep the rows current as objects are
+inserted, updated and deleted, so totals and per-day series are sums over a
+few hundred rows, and reads are cached for ``ANALYTICS_CACHE_TTL`` seconds.
+
+``rebuild()`` recomputes every row from the source tables with one grouped
+query per metric; run it after bulk SQL changes or to fix drift.
+"""
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, Date, Integer, String, Table, delete, event, func, inspect, select
+
+from schema import upsert_add
+
+Metric = namedtuple('Metric', 'name model day where dimension via')
+
+
+def _day(value):
+    if value is None:
+        return None
+    if isinstance(value, str):  # SQLite's date() returns text
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class DailyRollups:
+    """Incrementally maintained per-day counts of rows.
+
+    Metrics are declared with :meth:`track`; each one counts rows of a model
+    by the date of one of its columns, optionally only rows matching
+    ``where`` (``{attribute: value}``) and split by ``dimension`` (a column of
+    the model, or of the row ``via`` references).
+    """
+
+    def __init__(self, db, table_name='daily_rollups', ttl=60):
+        self.db = db
+        self.ttl = ttl
+        self.metrics = []
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.table = Table(
+            table_name, db.metadata,
+            Column('metric', String(32), primary_key=True),
+            Column('day', Date, primary_key=True),
+            Column('dimension', String(64), primary_key=True, default=''),
+            Column('value', Integer, nullable=False, default=0),
+        )
+
+    def init_app(self, app):
+        self.ttl = app.config.get('ANALYTICS_CACHE_TTL', self.ttl)
+        app.extensions['rollups'] = self
+
+    # Declaring --------------------------------------------------------
+
+    def track(self, name, model, day, where=None, dimension=None, via=None):
+        metric = Metric(name, model, day, dict(where or {}), dimension, via)
+        self.metrics.append(metric)
+        self._listen(model)
+        if via is not None:
+            # Rows move between dimensions when the referenced row's changes
+            self._listen(dimension.class_)
+        return metric
+
+    def _listen(self, model):
+        if event.contains(model, 'after_update', self._updated):
+            return
+        event.listen(model, 'after_insert', self._inserted)
+        event.listen(model, 'before_update', self._before_update)
+        event.listen(model, 'after_update', self._updated)
+        event.listen(model, 'before_delete', self._before_delete)
+
+    def _columns(self, metric):
+        cols = [metric.day, *metric.where]
+        cols.append(metric.via if metric.via is not None else metric.dimension)
+        return [c for c in cols if c is not None]
+
+    def _key(self, metric, values):
+        """``(day, dimension)`` counted for a row with ``values``, or None."""
+        day = _day(values.get(metric.day.key))
+        if day is None or any(values.get(attr.key) != value for attr, value in metric.where.items()):
+            return None
+        dimension = values.get((metric.via if metric.via is not None else metric.dimension).key) \
+            if metric.dimension is not None else ''
+        return day, dimension
+
+    def _resolve(self, conn, metric, key):
+        """Look the dimension up through ``via`` (e.g. a comment's post's category)."""
+        if key is None or metric.via is None:
+            return key
+        day, ref = key
+        target = metric.dimension.class_
+        pk = inspect(target).primary_key[0]
+        dimension = conn.execute(select(metric.dimension).where(pk == ref)).scalar()
+        return day, dimension
+
+    # Maintaining ------------------------------------------------------
+
+    def _watched(self, target):
+        cols = {c.key: c for m in self._for(target) for c in self._columns(m)}
+        cols.update((m.dimension.key, m.dimension) for m in self._referencing(target))
+        return cols
+
+    def _current(self, target):
+        return {key: getattr(target, key) for key in self._watched(target)}
+
+    def _stored(self, conn, target):
+        """The row's values as last written, read inside the flush."""
+        cols = self._watched(target)
+        pk = inspect(target).mapper.primary_key[0]
+        row = conn.execute(select(*cols.values()).where(pk == getattr(target, pk.key))).first()
+        return dict(zip(cols, row)) if row is not None else None
+
+    def _for(self, target):
+        return [m for m in self.metrics if isinstance(target, m.model)]
+
+    def _referencing(self, target):
+        """Metrics whose dimension is read from ``target`` through ``via``."""
+        return [m for m in self.metrics if m.via is not None and isinstance(target, m.dimension.class_)]
+
+    def add(self, conn, name, counts):
+        """Add ``counts`` (``{(day, dimension): n}``) to a metric.
+
+        For bulk SQL statements that bypass the mapper events.
+        """
+        self._apply(conn, Counter({(name, _day(day), dimension): n
+                                   for (day, dimension), n in counts.items()}))
+
+    def _apply(self, conn, changes):
+        rows = [{'metric': name, 'day': day, 'dimension': dimension or '', 'value': n}
+                for (name, day, dimension), n in sorted(changes.items(), key=str) if n]
+        if rows:
+            upsert_add(conn, self.table, rows, 'value')
+
+    def _inserted(self, mapper, conn, target):
+        values = self._current(target)
+        changes = Counter()
+        for metric in self._for(target):
+            key = self._resolve(conn, metric, self._key(metric, values))
+            if key is not None:
+                changes[(metric.name, *key)] += 1
+        self._apply(conn, changes)
+
+    def _before_update(self, mapper, conn, target):
+        state = inspect(target)
+        if any(state.attrs[key].history.has_changes() for key in self._watched(target)):
+            state.info['rollup_before'] = self._stored(conn, target)
+
+    def _updated(self, mapper, conn, target):
+        old = inspect(target).info.pop('rollup_before', None)
+        if old is None:
+            return
+        new = self._current(target)
+        changes = Counter()
+        for metric in self._for(target):
+            before, after = self._key(metric, old), self._key(metric, new)
+            if before != after:
+                before, after = self._resolve(conn, metric, before), self._resolve(conn, metric, after)
+                if before is not None:
+                    changes[(metric.name, *before)] -= 1
+                if after is not None:
+                    changes[(metric.name, *after)] += 1
+        for metric in self._referencing(target):
+            before, after = old[metric.dimension.key], new[metric.dimension.key]
+            if before != after:
+                for day, n in self._counts_for(conn, metric, target):
+                    changes[(metric.name, day, before)] -= n
+                    changes[(metric.name, day, after)] += n
+        self._apply(conn, changes)
+
+    def _counts_for(self, conn, metric, target):
+        """``(day, count)`` of the ``metric`` rows referencing ``target``."""
+        pk = inspect(target).mapper.primary_key[0]
+        day = func.date(metric.day)
+        rows = conn.execute(
+            select(day, func.count()).where(
+                metric.via == getattr(target, pk.key), metric.day.isnot(None),
+                *(attr == value for attr, value in metric.where.items())
+            ).group_by(day)
+        )
+        return [(_day(d), n) for d, n in rows]
+
+    def _before_delete(self, mapper, conn, target):
+        old = self._stored(conn, target)
+        if old is None:
+            return
+        changes = Counter()
+        for metric in self._for(target):
+            key = self._resolve(conn, metric, self._key(metric, old))
+            if key is not None:
+                changes[(metric.name, *key)] -= 1
+        self._apply(conn, changes)
+
+    def rebuild(self):
+        """Recompute every rollup row from the source tables.
+
+        Returns the number of rows written.
+        """
+        rows = []
+        for metric in self.metrics:
+            day = func.date(metric.day)
+            dimension = metric.dimension
+            cols = [day, dimension] if dimension is not None else [day]
+            stmt = select(*cols, func.count()).select_from(metric.model) \
+                .where(metric.day.isnot(None), *(attr == value for attr, value in metric.where.items()))
+            if metric.via is not None:
+                target = metric.dimension.class_
+                stmt = stmt.join(target, inspect(target).primary_key[0] == metric.via)
+            for row in self.db.session.execute(stmt.group_by(*cols)):
+                rows.append({'metric': metric.name, 'day': _day(row[0]),
+                             'dimension': (row[1] or '') if dimension is not None else '',
+                             'value': row[-1]})
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(self.table))
+            if rows:
+                conn.execute(self.table.insert(), rows)
+        self._cache.clear()
+        return len(rows)
+
+    def ensure_built(self):
+        """Rebuild if the table is empty (e.g. right after upgrading)."""
+        with self.db.engine.connect() as conn:
+            empty = conn.execute(select(self.table.c.metric).limit(1)).first() is None
+        if empty:
+            self.rebuild()
+
+    # Reading ----------------------------------------------------------
+
+    def cached(self, key, compute):
+        """``compute()``, reused for ``ANALYTICS_CACHE_TTL`` seconds under ``key``."""
+        now = time.monotonic()
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        value = compute()
+        with self._lock:
+            if len(self._cache) >= 256:
+                self._cache.clear()
+            self._cache[key] = (now + self.ttl, value)
+        return value
+
+    def totals(self, *names):
+        """``{metric: all-time count}`` for the named metrics."""
+        def compute():
+            t = self.table
+            rows = self.db.session.execute(
+                select(t.c.metric, func.sum(t.c.value)).where(t.c.metric.in_(names)).group_by(t.c.metric)
+            )
+            return dict({name: 0 for name in names}, **{name: int(n) for name, n in rows})
+        return self.cached(('totals', names), compute)
+
+    def series(self, name, days):
+        """``[(day, count)]`` for each of the last ``days`` days with any rows."""
+        def compute():
+            t = self.table
+            since = datetime.utcnow().date() - timedelta(days=days)
+            rows = self.db.session.execute(
+                select(t.c.day, func.sum(t.c.value))
+                .where(t.c.metric == name, t.c.day >= since).group_by(t.c.day).order_by(t.c.day)
+            )
+            return [(_day(day), int(n)) for day, n in rows if n]
+        return self.cached(('series', name, days), compute)
+
+    def by_dimension(self, name, limit=None):
+        """``[(dimension, count)]``, largest first, over all time."""
+        def compute():
+            t = self.table
+            total = func.sum(t.c.value)
+            stmt = select(t.c.dimension, total).where(t.c.metric == name) \
+                .group_by(t.c.dimension).having(total > 0).order_by(total.desc(), t.c.dimension)
+            if limit:
+                stmt = stmt.limit(limit)
+            return [(dimension, int(n)) for dimension, n in self.db.session.execute(stmt)]
+        return self.cached(('by_dimension', name, limit), compute)
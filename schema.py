@@ -0,0 +1,89 @@
+"""Additive schema upgrades for databases created by an older release.
+
+Both apps bootstrap their schema with ``db.create_all()``, which creates
+missing tables but never alters existing ones. ``add_missing_columns`` fills
+that gap for purely additive changes: new defaulted columns and new indexes,
+plus ``backfill`` for populating a new derived column on existing rows.
+``upsert_add`` is the portable insert-or-increment used by the aggregate
+tables (trending scores, view buckets).
+"""
+from sqlalchemy import and_, bindparam, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+
+def add_missing_columns(db):
+    """Add model columns/indexes missing from existing tables.
+
+    Returns the list of ``table.column`` names that were added so callers can
+    backfill them (e.g. recompute denormalized counters).
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c['name'] for c in inspector.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in present:
+                    continue
+                ddl = CreateColumn(col).compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                added.append(f'{table.name}.{col.name}')
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+    return added
+
+
+def backfill(db, table, target, source, compute, batch_size=500):
+    """Fill NULL ``target`` values from ``compute(source_value)``, in batches.
+
+    Walks ``table`` in primary-key order so memory stays flat on large
+    tables. Returns the number of rows updated.
+    """
+    key = table.c.id
+    last, updated = None, 0
+    while True:
+        stmt = select(key, table.c[source]).where(table.c[target].is_(None))
+        if last is not None:
+            stmt = stmt.where(key > last)
+        rows = db.session.execute(stmt.order_by(key).limit(batch_size)).all()
+        if not rows:
+            return updated
+        last = rows[-1][0]
+        db.session.execute(
+            table.update().where(key == bindparam('row_id')).values({target: bindparam('value')}),
+            [{'row_id': row[0], 'value': compute(row[1])} for row in rows],
+        )
+        db.session.commit()
+        updated += len(rows)
+
+
+def upsert_add(conn, table, rows, column):
+    """Insert ``rows``, adding ``column`` onto rows whose primary key exists.
+
+    Other non-key columns take the new row's values. Uses ``ON CONFLICT`` on
+    SQLite and PostgreSQL and an UPDATE, then INSERT, per row elsewhere.
+    """
+    keys = list(table.primary_key.columns)
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        set_ = {c.name: stmt.excluded[c.name] for c in table.columns if not c.primary_key}
+        set_[column] = table.c[column] + stmt.excluded[column]
+        conn.execute(stmt.on_conflict_do_update(index_elements=keys, set_=set_), rows)
+        return
+
+    for row in rows:
+        values = {name: value for name, value in row.items() if not table.c[name].primary_key}
+        values[column] = table.c[column] + row[column]
+        where = and_(*(key == row[key.name] for key in keys))
+        if not conn.execute(table.update().where(where).values(values)).rowcount:
+            conn.execute(table.insert().values(row))
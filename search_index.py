@@ -0,0 +1,196 @@
+"""Full-text search over a model's title/tags/content columns.
+
+SQLite uses an external-content FTS5 table kept in sync by triggers; Postgres
+uses a generated, weighted ``tsvector`` column with a GIN index.
+
+FTS5 addresses documents by an integer that must not change. An INTEGER
+primary key is used as is. Other keys (the root app's UUIDs) get a
+``<table>_fts_keys`` table that assigns each row a stable integer, and the
+index reads its content through a ``<table>_fts_docs`` view. The implicit
+``rowid`` is never used, because ``VACUUM`` may renumber it. Either way
+the database maintains the index on every insert/update/delete, and results
+are ranked with matches in the title weighted above tags and body. Other
+databases (or SQLite builds without FTS5) fall back to ILIKE matching.
+"""
+import re
+
+from sqlalchemy import Float, Integer, column, false, func, literal_column, or_, table, text
+
+
+class SearchIndex:
+    """Full-text index for one model.
+
+    ``fields`` is a sequence of ``(column, postgres_weight, bm25_weight)``
+    tuples, most important first.
+    """
+
+    language = 'english'
+
+    def __init__(self, db, model, fields=(('title', 'A', 10.0), ('tags', 'B', 4.0),
+                                          ('content', 'C', 1.0))):
+        self.db = db
+        self.model = model
+        self.table_name = model.__tablename__
+        self.fields = fields
+        self.fts_table = f'{self.table_name}_fts'
+        self.backend = None
+        pk = model.__table__.primary_key.columns.values()[0]
+        self.pk = pk.name
+        # A non-integer key is mapped to a stable integer document id
+        self.keys_table = None if isinstance(pk.type, Integer) else f'{self.fts_table}_keys'
+
+    # Schema -----------------------------------------------------------
+
+    def ensure_schema(self):
+        """Create the index (and backfill it) if it does not exist yet."""
+        dialect = self.db.engine.dialect.name
+        if dialect == 'sqlite' and self._sqlite_has_fts5():
+            self._ensure_sqlite()
+            self.backend = 'fts5'
+        elif dialect == 'postgresql':
+            self._ensure_postgres()
+            self.backend = 'tsvector'
+        else:
+            self.backend = 'like'
+
+    def rebuild(self):
+        """Rebuild the whole index from the base table."""
+        if self.backend is None:
+            self.ensure_schema()
+        with self.db.engine.begin() as conn:
+            if self.backend == 'fts5':
+                self._rebuild_sqlite(conn)
+            elif self.backend == 'tsvector':
+                conn.execute(text(f'REINDEX INDEX {self.table_name}_search_idx'))
+
+    def _sqlite_has_fts5(self):
+        with self.db.engine.connect() as conn:
+            try:
+                conn.execute(text('CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)'))
+                conn.execute(text('DROP TABLE temp._fts5_probe'))
+                return True
+            except Exception:
+                return False
+
+    def _ensure_sqlite(self):
+        names = [name for name, _, _ in self.fields]
+        cols = ', '.join(names)
+        new_cols = ', '.join(f'new.{name}' for name in names)
+        old_cols = ', '.join(f'old.{name}' for name in names)
+        t, fts, pk, keys = self.table_name, self.fts_table, self.pk, self.keys_table
+
+        if keys is None:
+            create = f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{t}', content_rowid='{pk}')"
+            doc = {'new': f'new.{pk}', 'old': f'old.{pk}'}
+            source = {'new': '', 'old': ''}
+        else:
+            create = f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{fts}_docs', content_rowid='doc')"
+            doc = {'new': 'doc', 'old': 'doc'}
+            source = {age: f' FROM {keys} WHERE {keys}.{pk} = {age}.{pk}' for age in ('new', 'old')}
+
+        with self.db.engine.begin() as conn:
+            current = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': fts},
+            ).scalar()
+            if current == create:
+                return
+            # Missing, or an older layout keyed on the implicit rowid
+            for trigger in ('ai', 'ad', 'au'):
+                conn.execute(text(f'DROP TRIGGER IF EXISTS {fts}_{trigger}'))
+            conn.execute(text(f'DROP TABLE IF EXISTS {fts}'))
+
+            insert_key = ''
+            delete_key = ''
+            if keys is not None:
+                pk_type = self.model.__table__.c[pk].type.compile(dialect=conn.dialect)
+                conn.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS {keys} '
+                    f'(doc INTEGER PRIMARY KEY, {pk} {pk_type} NOT NULL UNIQUE)'
+                ))
+                conn.execute(text(
+                    f'CREATE VIEW IF NOT EXISTS {fts}_docs AS SELECT {keys}.doc AS doc, {cols} '
+                    f'FROM {t} JOIN {keys} ON {keys}.{pk} = {t}.{pk}'
+                ))
+                insert_key = f'INSERT INTO {keys}({pk}) VALUES (new.{pk}); '
+                delete_key = f' DELETE FROM {keys} WHERE {pk} = old.{pk};'
+            conn.execute(text(create))
+            conn.execute(text(
+                f'CREATE TRIGGER {fts}_ai AFTER INSERT ON {t} BEGIN {insert_key}'
+                f"INSERT INTO {fts}(rowid, {cols}) SELECT {doc['new']}, {new_cols}{source['new']}; END"
+            ))
+            conn.execute(text(
+                f'CREATE TRIGGER {fts}_ad AFTER DELETE ON {t} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) "
+                f"SELECT 'delete', {doc['old']}, {old_cols}{source['old']};{delete_key} END"
+            ))
+            conn.execute(text(
+                f'CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {t} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) SELECT 'delete', {doc['old']}, {old_cols}{source['old']}; "
+                f"INSERT INTO {fts}(rowid, {cols}) SELECT {doc['new']}, {new_cols}{source['new']}; END"
+            ))
+            self._rebuild_sqlite(conn)
+
+    def _rebuild_sqlite(self, conn):
+        t, fts, pk, keys = self.table_name, self.fts_table, self.pk, self.keys_table
+        if keys is not None:
+            # Rows written while the triggers did not exist yet
+            conn.execute(text(f'DELETE FROM {keys} WHERE {pk} NOT IN (SELECT {pk} FROM {t})'))
+            conn.execute(text(
+                f'INSERT INTO {keys}({pk}) SELECT {pk} FROM {t} WHERE {pk} NOT IN (SELECT {pk} FROM {keys})'
+            ))
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    def _ensure_postgres(self):
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{self.language}', coalesce({name}, '')), '{weight}')"
+            for name, weight, _ in self.fields
+        )
+        with self.db.engine.begin() as conn:
+            conn.execute(text(
+                f'ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+                f'GENERATED ALWAYS AS ({vector}) STORED'
+            ))
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS {self.table_name}_search_idx '
+                f'ON {self.table_name} USING GIN (search_vector)'
+            ))
+
+    # Querying ---------------------------------------------------------
+
+    def search(self, query, terms):
+        """Restrict ``query`` to rows matching ``terms``, best matches first.
+
+        Callers may chain further ``order_by`` clauses as tie-breakers and
+        paginate the result as usual.
+        """
+        if self.backend is None:
+            self.ensure_schema()
+        words = re.findall(r'\w+', terms or '')
+        if not words:
+            return query.filter(false())
+
+        if self.backend == 'fts5':
+            match = ' '.join(f'"{word}"*' for word in words)
+            weights = ', '.join(str(w) for _, _, w in self.fields)
+            hits = text(
+                f'SELECT rowid AS doc_rowid, bm25({self.fts_table}, {weights}) AS rank '
+                f'FROM {self.fts_table} WHERE {self.fts_table} MATCH :match'
+            ).bindparams(match=match).columns(doc_rowid=Integer, rank=Float).subquery()
+            key = literal_column(f'{self.table_name}.{self.pk}')
+            if self.keys_table is not None:
+                keys = table(self.keys_table, column('doc'), column(self.pk))
+                query = query.join(keys, keys.c[self.pk] == key)
+                key = keys.c.doc
+            # bm25() is lower-is-better
+            return query.join(hits, hits.c.doc_rowid == key).order_by(hits.c.rank)
+
+        if self.backend == 'tsvector':
+            vector = literal_column(f'{self.table_name}.search_vector')
+            tsquery = func.websearch_to_tsquery(self.language, ' '.join(words))
+            return query.filter(vector.op('@@')(tsquery)).order_by(func.ts_rank(vector, tsquery).desc())
+
+        columns = [getattr(self.model, name) for name, _, _ in self.fields]
+        for word in words:
+            query = query.filter(or_(*(col.ilike(f'%{word}%') for col in columns)))
+        return query
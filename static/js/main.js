@@ -45,7 +45,7 @@ document.querySelectorAll('.like-btn').forEach(button => {
         const isLiked = this.classList.contains('liked');
         
         try {
-            const csrfToken = document.querySelector('meta[name="csrf-token"]').content;
+            const csrfToken = document.querySelector('meta[name="csrf-token"]')?.content || '';
             const response = await fetch(`/post/${postSlug}/like`, {
                 method: 'POST',
                 headers: {
@@ -0,0 +1,306 @@
+"""Static HTML snapshots of published posts and feed pages.
+
+Most traffic is logged-out reads of posts that rarely change. The publisher
+renders those pages to files that the web server can send without calling
+the app. Each page is rendered by its real view function, under a request
+for its real URL and with no session, so a snapshot is the same HTML a
+logged-out visitor gets from the app.
+
+Sources registered with :meth:`SnapshotPublisher.source` list the pages.
+Each page has a key, a URL, a file path and an optional stamp:
+
+* A page with a stamp (e.g. ``updated_at`` plus comment counters) is only
+  re-rendered when its stamp or the templates change, or when it is older
+  than ``SNAPSHOT_MAX_AGE``. The age limit bounds sidebars and counts that
+  are not part of the stamp.
+* A page without a stamp (the feeds) is rendered on every build. Its file
+  is only rewritten when the HTML differs.
+
+Pages that are no longer listed, because they were unpublished or deleted,
+are removed.
+
+Snapshots get built two ways:
+
+* ``flask publish-snapshots`` runs a full build.
+* With ``SNAPSHOT_ON_PUBLISH``, rows registered with
+  :meth:`SnapshotPublisher.track` refresh their pages after the request
+  that committed them.
+
+Views can tell a snapshot render apart with :func:`rendering`, and templates
+with the ``snapshot`` variable. They use it to skip counting a view and to
+add a small script. That script calls a JSON endpoint which:
+
+* counts the view;
+* refreshes the like and view counts;
+* reloads the page when the visitor turns out to be logged in (e.g. from a
+  remember-me cookie). The reload reaches the app because the JSON call has
+  set a session cookie by then.
+
+Serve snapshots only to requests that have no query string and carry no
+session or remember-me cookie. Everything else goes to the app. With nginx
+(``SNAPSHOT_DIR`` as the root)::
+
+    map "$cookie_session$cookie_remember_token$args" $snapshot_root {
+        ""      /srv/blog/instance/snapshots;
+        default /nonexistent;
+    }
+    location / {
+        root $snapshot_root;
+        try_files $uri/index.html @app;
+    }
+
+Category feeds are written to ``category/<slug>/index.html`` for servers
+that map ``/?category=<slug>`` onto that path.
+"""
+import hashlib
+import inspect
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from werkzeug.exceptions import HTTPException
+
+from http_cache import templates_version
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; concurrent builds may then race on the manifest
+    fcntl = None
+
+ENVIRON_KEY = 'snapshots.rendering'
+MANIFEST = 'manifest.json'
+
+
+class Page:
+    """One snapshot: ``url`` rendered into ``path`` (relative to ``SNAPSHOT_DIR``)."""
+
+    __slots__ = ('key', 'url', 'path', 'stamp')
+
+    def __init__(self, key, url, path, stamp=None):
+        self.key = key
+        self.url = url
+        self.path = path
+        self.stamp = stamp
+
+
+def rendering():
+    """Whether the current request is rendering a snapshot."""
+    return has_request_context() and bool(request.environ.get(ENVIRON_KEY))
+
+
+class SnapshotPublisher:
+    def __init__(self, db):
+        self.db = db
+        self.app = None
+        self.path = None
+        self.max_age = 24 * 3600
+        self.on_publish = False
+        self.base_url = 'http://localhost/'
+        self.version = ''
+        self._sources = {}
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def init_app(self, app):
+        self.app = app
+        self.path = app.config.get('SNAPSHOT_DIR') or os.path.join(app.instance_path, 'snapshots')
+        self.max_age = float(app.config.get('SNAPSHOT_MAX_AGE', self.max_age))
+        self.on_publish = bool(app.config.get('SNAPSHOT_ON_PUBLISH'))
+        server_name = app.config.get('SERVER_NAME')
+        if app.config.get('SNAPSHOT_BASE_URL'):
+            self.base_url = app.config['SNAPSHOT_BASE_URL']
+        elif server_name:
+            self.base_url = f"{app.config.get('PREFERRED_URL_SCHEME', 'http')}://{server_name}/"
+        self.version = templates_version(app)
+        app.context_processor(lambda: {'snapshot': rendering()})
+        if self.on_publish:
+            app.after_request(self._publish_pending)
+        app.extensions['snapshots'] = self
+
+    # Registration -----------------------------------------------------
+
+    def source(self, name):
+        """Register ``pages(keys)`` as the source ``name``.
+
+        ``pages`` yields :class:`Page` objects, only those with a key in
+        ``keys`` unless ``keys`` is None. It runs inside a request context
+        for ``SNAPSHOT_BASE_URL``, so ``url_for`` works.
+        """
+        def decorate(pages):
+            self._sources[name] = pages
+            return pages
+        return decorate
+
+    def track(self, model, pages_for):
+        """Refresh ``pages_for(obj)``, ``(source, key)`` pairs, when a ``model`` row commits.
+
+        A key of None refreshes every page of that source.
+        """
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, lambda mapper, connection, target: self._changed(pages_for, target))
+
+    def _changed(self, pages_for, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('snapshot_pages', set()).update(pages_for(target))
+
+    def _after_commit(self, session):
+        pages = session.info.pop('snapshot_pages', None)
+        if pages:
+            self.refresh(*pages)
+
+    def _after_rollback(self, session):
+        session.info.pop('snapshot_pages', None)
+
+    def refresh(self, *pages):
+        """Rebuild these ``(source, key)`` pages once the current request is done."""
+        if self.on_publish and has_request_context() and not rendering():
+            g.setdefault('snapshot_pages', set()).update(pages)
+
+    def _publish_pending(self, response):
+        pages = g.pop('snapshot_pages', None)
+        if pages:
+            self.build(only=pages)
+        return response
+
+    # Building ---------------------------------------------------------
+
+    def build(self, only=None, force=False):
+        """Bring the snapshots up to date; returns ``{'written', 'unchanged', 'removed'}`` counts.
+
+        ``only`` limits the build to ``(source, key)`` pairs; ``force``
+        re-renders and rewrites every page.
+        """
+        counts = {'written': 0, 'unchanged': 0, 'removed': 0}
+        os.makedirs(self.path, exist_ok=True)
+        with self._locked():
+            manifest = self._load_manifest()
+            for name, pages in self._sources.items():
+                if only is None:
+                    keys = None
+                else:
+                    wanted = {key for source, key in only if source == name}
+                    if not wanted:
+                        continue
+                    keys = None if None in wanted else wanted
+                self._build_source(name, pages, keys, force, manifest, counts)
+            self._save_manifest(manifest)
+        return counts
+
+    def _build_source(self, name, pages, keys, force, manifest, counts):
+        with self.app.test_request_context(base_url=self.base_url):
+            listed = [page for page in pages(keys) if keys is None or page.key in keys]
+
+        seen = set()
+        for page in listed:
+            entry_id = f'{name}:{page.key}'
+            seen.add(entry_id)
+            old = manifest.get(entry_id)
+            if old and old['path'] != page.path:
+                self._remove(old['path'])
+                old = None
+            stamp = None
+            if page.stamp is not None:
+                stamp = hashlib.sha1(repr((self.version, page.stamp)).encode('utf-8')).hexdigest()
+                if (not force and old and old.get('stamp') == stamp
+                        and time.time() - old['written'] < self.max_age and self._exists(page.path)):
+                    counts['unchanged'] += 1
+                    continue
+
+            html = self._render(page.url)
+            if html is None:
+                if old:
+                    self._remove(old['path'])
+                    del manifest[entry_id]
+                    counts['removed'] += 1
+                continue
+            digest = hashlib.sha1(html).hexdigest()
+            if not force and old and old.get('digest') == digest and self._exists(page.path):
+                counts['unchanged'] += 1
+            else:
+                self._write(page.path, html)
+                counts['written'] += 1
+            manifest[entry_id] = {'url': page.url, 'path': page.path, 'stamp': stamp,
+                                  'digest': digest, 'written': time.time()}
+
+        # Previously published pages the source no longer lists
+        prefix = f'{name}:'
+        for entry_id in [e for e in manifest if e.startswith(prefix) and e not in seen]:
+            if keys is None or any(entry_id == f'{prefix}{key}' for key in keys):
+                self._remove(manifest.pop(entry_id)['path'])
+                counts['removed'] += 1
+
+    def _render(self, url):
+        """The HTML a logged-out GET of ``url`` gets, or None if it is not a 200."""
+        app = self.app
+        # A fresh app context: its own g, session and (anonymous) current_user
+        with app.app_context(), app.test_request_context(
+                url, base_url=self.base_url, environ_overrides={ENVIRON_KEY: True}):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    if request.routing_exception is not None:
+                        return None
+                    # Skip the page cache and HTTP cache wrappers around the view
+                    view = inspect.unwrap(app.view_functions[request.url_rule.endpoint])
+                    rv = view(**request.view_args)
+            except HTTPException:
+                return None
+            response = app.make_response(rv)
+            if response.status_code != 200:
+                return None
+            return response.get_data()
+
+    # Files ------------------------------------------------------------
+
+    def _file(self, path):
+        full = os.path.normpath(os.path.join(self.path, path))
+        if not full.startswith(os.path.normpath(self.path) + os.sep):
+            raise ValueError(f'Snapshot path {path!r} leaves {self.path}')
+        return full
+
+    def _exists(self, path):
+        return os.path.exists(self._file(path))
+
+    def _write(self, path, data):
+        full = self._file(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        tmp = f'{full}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, full)
+
+    def _remove(self, path):
+        full = self._file(path)
+        try:
+            os.remove(full)
+            # Drop now-empty directories like post/<slug>/
+            os.removedirs(os.path.dirname(full))
+        except OSError:
+            pass
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST), encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        self._write(MANIFEST, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, '.lock'), 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
@@ -0,0 +1,77 @@
+"""Fixtures for both apps, each on a fresh in-memory SQLite database.
+
+``app.py`` shares its name with the ``app/`` package, so it is loaded by
+path (as ``benchmarks/routes.py`` does).
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+
+def settings(tmp_path, **extra):
+    return {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'SNAPSHOT_DIR': str(tmp_path / 'snapshots'),
+        'IMAGE_SPOOL_DIR': str(tmp_path / 'spool'),
+        'WTF_CSRF_ENABLED': False,
+        'TESTING': True,
+        **extra,
+    }
+
+
+def load_root_module():
+    module = sys.modules.get('blog_app')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('blog_app', os.path.join(ROOT, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def root_app(tmp_path, monkeypatch):
+    for key, value in settings(tmp_path, PAGE_CACHE_BACKEND='off').items():
+        monkeypatch.setattr(config.Config, key, value, raising=False)
+    return load_root_module().create_app(instance_path=str(tmp_path / 'instance'))
+
+
+@pytest.fixture
+def package_app(tmp_path):
+    from app import create_app
+    return create_app(type('TestConfig', (config.Config,), settings(tmp_path, PAGE_CACHE_BACKEND='off')),
+                      instance_path=str(tmp_path / 'instance'))
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+class QueryCounter:
+    """Counts statements sent to ``engine`` while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
@@ -0,0 +1,89 @@
+"""Dashboard and profile statistics cost the same number of queries for any number of posts."""
+from datetime import datetime
+
+import pytest
+
+from conftest import QueryCounter, login
+
+N = 5
+
+
+def count_queries(app, client, url):
+    client.get(url)  # warm-up: first-request caches and lazy setup
+    with app.app_context():
+        engine = app.extensions['sqlalchemy'].engine
+    with QueryCounter(engine) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert queries.count > 0
+    return queries.count
+
+
+def root_author(app):
+    from database import Category, User, db
+    with app.app_context():
+        author = User(username='author', email='author@example.com', password_hash='x')
+        reader = User(username='reader', email='reader@example.com', password_hash='x')
+        db.session.add_all([author, reader])
+        db.session.commit()
+        return author.id, reader.id, Category.query.first().id
+
+
+def add_root_posts(app, author_id, reader_id, category_id, start, count):
+    from database import Comment, Like, Post, db
+    with app.app_context():
+        for i in range(start, start + count):
+            post = Post(title=f'Post {i}', slug=f'post-{i}', content=f'<p>Body {i}</p>', user_id=author_id,
+                        category_id=category_id, is_published=i % 2 == 0, published_at=datetime.utcnow())
+            db.session.add(post)
+            db.session.flush()
+            db.session.add(Like(user_id=reader_id, post_id=post.id))
+            db.session.add(Comment(content='Nice', user_id=reader_id, post_id=post.id, is_approved=True))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('url', ['/dashboard', '/profile'])
+def test_root_author_pages_query_count_is_constant(root_app, url):
+    author_id, reader_id, category_id = root_author(root_app)
+    client = root_app.test_client()
+    login(client, author_id)
+
+    add_root_posts(root_app, author_id, reader_id, category_id, 0, N)
+    few = count_queries(root_app, client, url)
+    add_root_posts(root_app, author_id, reader_id, category_id, N, 9 * N)
+    many = count_queries(root_app, client, url)
+    assert many == few
+
+
+def add_package_blogs(app, author_id, reader_id, start, count):
+    from app import db
+    from app.models import Blog, Like
+    with app.app_context():
+        for i in range(start, start + count):
+            blog = Blog(title=f'Blog {i}', slug=f'blog-{i}', content=f'Body {i}', author_id=author_id,
+                        status='published' if i % 2 == 0 else 'draft')
+            db.session.add(blog)
+            db.session.flush()
+            db.session.add(Like(user_id=reader_id, blog_id=blog.id))
+        db.session.commit()
+
+
+def test_package_dashboard_query_count_is_constant(package_app):
+    from app import db
+    from app.models import User
+    with package_app.app_context():
+        author = User(username='author', email='author@example.com')
+        reader = User(username='reader', email='reader@example.com')
+        author.set_password('password1')
+        reader.set_password('password1')
+        db.session.add_all([author, reader])
+        db.session.commit()
+        author_id, reader_id = author.id, reader.id
+    client = package_app.test_client()
+    login(client, author_id)
+
+    add_package_blogs(package_app, author_id, reader_id, 0, N)
+    few = count_queries(package_app, client, '/dashboard')
+    add_package_blogs(package_app, author_id, reader_id, N, 9 * N)
+    many = count_queries(package_app, client, '/dashboard')
+    assert many == few
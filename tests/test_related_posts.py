@@ -0,0 +1,67 @@
+"""Incremental related-post updates agree with a full rebuild."""
+from sqlalchemy import func, select
+
+# Three topics with no words in common, so each post's neighbours are its topic mates
+TOPICS = {
+    'python': ['python flask routing blueprints', 'python django models migrations',
+               'python asyncio coroutines flask', 'python packaging wheels django'],
+    'baking': ['sourdough starter flour hydration', 'baguette flour crust oven',
+               'croissant butter lamination oven', 'sourdough crust scoring baguette'],
+    'hiking': ['alpine trails summit glacier', 'glacier crossing crampons rope',
+               'summit ridge scramble alpine', 'trails waterfalls camping rope'],
+}
+
+
+def neighbours(index):
+    t = index.table
+    rows = index.db.session.execute(select(t.c.item_id, t.c.related_id).order_by(t.c.item_id, t.c.rank))
+    lists = {}
+    for item_id, related_id in rows:
+        lists.setdefault(item_id, []).append(related_id)
+    return {item_id: sorted(related) for item_id, related in lists.items()}
+
+
+def indexed_count(index):
+    session = index.db.session
+    kept = session.execute(select(index.meta.c.item_count)).scalar()
+    actual = session.execute(select(func.count(func.distinct(index.terms.c.item_id)))).scalar()
+    assert kept == actual
+    return kept
+
+
+def test_incremental_updates_match_rebuild(package_app):
+    from app import db
+    from app.models import Blog, User, blog_related
+    with package_app.app_context():
+        author = User(username='author', email='author@example.com')
+        author.set_password('password1')
+        db.session.add(author)
+        db.session.commit()
+
+        blogs = {}
+        for topic, texts in TOPICS.items():
+            for i, text in enumerate(texts):
+                blog = Blog(title=text.title(), slug=f'{topic}-{i}', content=text, tags=topic,
+                            author_id=author.id, status='published')
+                db.session.add(blog)
+                db.session.commit()  # published one at a time, as on the site
+                blogs[blog.slug] = blog
+        assert indexed_count(blog_related) == 12
+
+        # Edit one post into another topic, unpublish one and delete one
+        blogs['python-3'].title = 'Glacier Camping'
+        blogs['python-3'].content = 'glacier camping waterfalls crampons'
+        blogs['python-3'].tags = 'hiking'
+        blogs['baking-1'].status = 'draft'
+        db.session.commit()
+        db.session.delete(blogs['hiking-0'])
+        db.session.commit()
+        assert indexed_count(blog_related) == 10
+
+        incremental = neighbours(blog_related)
+        assert blog_related.rebuild() == 10
+        assert neighbours(blog_related) == incremental
+        assert indexed_count(blog_related) == 10
+
+        related = [b.slug for b in blog_related.load(Blog.query, blogs['hiking-1'].id)]
+        assert set(related) == {'hiking-2', 'hiking-3', 'python-3'}
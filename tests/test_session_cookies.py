@@ -0,0 +1,54 @@
+"""Public pages answer anonymous readers without creating a session."""
+import pytest
+from flask import redirect
+
+PUBLIC_URLS = (
+    '/',
+    '/recent-stories',
+    '/popular-stories',
+    '/blog/hello',
+    '/search?q=x',
+    '/api/comments/{blog_id}',
+)
+
+
+@pytest.fixture
+def blog_id(package_app):
+    from app import db
+    from app.models import Blog, Comment, User
+    with package_app.app_context():
+        author = User(username='author', email='author@example.com')
+        author.set_password('password1')
+        db.session.add(author)
+        db.session.flush()
+        blog = Blog(title='Hello', slug='hello', content='Hello **world**', author_id=author.id,
+                    status='published', featured=True)
+        db.session.add(blog)
+        db.session.flush()
+        db.session.add(Comment(content='First', blog_id=blog.id, user_id=author.id))
+        db.session.commit()
+        return blog.id
+
+
+@pytest.mark.parametrize('url', PUBLIC_URLS)
+def test_anonymous_public_routes_set_no_cookie(package_app, blog_id, url):
+    response = package_app.test_client().get(url.format(blog_id=blog_id))
+    assert response.status_code == 200
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_google_login_keeps_the_oauth_session(package_app, monkeypatch):
+    from authlib.integrations.flask_client import FlaskOAuth2App
+    from app import oauth
+    # Register on copies so the provider is gone again after this test
+    monkeypatch.setattr(oauth, '_registry', dict(oauth._registry))
+    monkeypatch.setattr(oauth, '_clients', dict(oauth._clients))
+    oauth.register(name='google', client_id='id', client_secret='secret',
+                   authorize_url='https://accounts.example.com/authorize')
+    # Skip the request to the provider's metadata; the session is what is checked
+    monkeypatch.setattr(FlaskOAuth2App, 'authorize_redirect',
+                        lambda self, redirect_uri, **kwargs: redirect('https://accounts.example.com/authorize'))
+
+    response = package_app.test_client().get('/auth/google-login')
+    assert response.status_code == 302
+    assert 'Set-Cookie' in response.headers
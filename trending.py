@@ -0,0 +1,165 @@
+"""Time-decayed trending scores kept in a compact leaderboard table.
+
+An event (a view, like or comment) of weight ``w`` at time ``t`` adds
+``w * 2 ** ((t - era_start) / half_life)`` to its item's score. Every row in
+the same era shares that scale, so ordering by the stored score is ordering
+by the decayed score at any moment: recording an event is one upsert, and
+reading the leaderboard is one range scan of the ``(era, score)`` index.
+
+Eras last ``ERA_HALF_LIVES`` half-lives, which keeps the scale factor well
+inside float range. The first writer or reader in a new era rescales the
+previous era's rows with a single UPDATE and drops the ones that have
+decayed to nothing.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import timezone
+
+from sqlalchemy import Column, Float, Index, Integer, Table, delete, event, select, update
+
+from schema import upsert_add
+
+ERA_HALF_LIVES = 32
+# Scores below this (in units of one view happening now) are dropped
+MIN_SCORE = 0.01
+DEFAULT_WEIGHTS = {'view': 1.0, 'like': 5.0, 'comment': 10.0}
+
+
+def _hours(when):
+    if when is None:
+        return time.time() / 3600
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp() / 3600
+
+
+class TrendingBoard:
+    """Leaderboard of decayed engagement for one model.
+
+    ``record()`` is called with the connection of the transaction the event
+    is written in (a flush, a view-counter batch); ``rebuild()`` recomputes
+    every score from the source tables.
+    """
+
+    def __init__(self, db, model, weights=None, half_life_hours=24.0):
+        self.db = db
+        self.model = model
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.half_life = half_life_hours
+        self._rebased_era = None
+        self._lock = threading.Lock()
+
+        name = f'trending_{model.__tablename__}'
+        key_type = model.__table__.c.id.type
+        self.table = Table(
+            name, db.metadata,
+            Column('item_id', key_type, primary_key=True),
+            Column('score', Float, nullable=False, default=0.0),
+            Column('era', Integer, nullable=False),
+            Index(f'ix_{name}_rank', 'era', 'score', 'item_id'),
+        )
+        event.listen(model, 'after_delete', self._item_deleted)
+
+    def init_app(self, app):
+        self.half_life = float(app.config.get('TRENDING_HALF_LIFE_HOURS', self.half_life))
+        app.extensions[f'trending.{self.model.__tablename__}'] = self
+
+    # Scale ------------------------------------------------------------
+
+    @property
+    def era_hours(self):
+        return self.half_life * ERA_HALF_LIVES
+
+    def current_era(self):
+        return int(_hours(None) // self.era_hours)
+
+    def _factor(self, when, era):
+        return 2.0 ** ((_hours(when) - era * self.era_hours) / self.half_life)
+
+    def _ensure_era(self, conn, era):
+        """Bring rows left over from the previous era onto this era's scale."""
+        if self._rebased_era == era:
+            return
+        t = self.table
+        carry = 2.0 ** -ERA_HALF_LIVES
+        conn.execute(delete(t).where(t.c.era < era - 1))
+        conn.execute(delete(t).where(t.c.era == era - 1, t.c.score * carry < MIN_SCORE))
+        conn.execute(update(t).where(t.c.era == era - 1).values(score=t.c.score * carry, era=era))
+        self._rebased_era = era
+
+    # Writing ----------------------------------------------------------
+
+    def record(self, conn, kind, counts, when=None):
+        """Add ``counts`` (``{item_id: events}``) events of ``kind`` to the board."""
+        era = self.current_era()
+        self._ensure_era(conn, era)
+        scale = self.weights[kind] * self._factor(when, era)
+        rows = [{'item_id': key, 'score': n * scale, 'era': era}
+                for key, n in sorted(counts.items()) if n]
+        if rows:
+            upsert_add(conn, self.table, rows, 'score')
+
+    def _item_deleted(self, mapper, connection, target):
+        connection.execute(delete(self.table).where(self.table.c.item_id == target.id))
+
+    def rebuild(self, events):
+        """Replace every score with ones computed from ``(item_id, kind, when, n)`` events.
+
+        Returns the number of items on the rebuilt board.
+        """
+        era = self.current_era()
+        scores = Counter()
+        for key, kind, when, n in events:
+            if n:
+                scores[key] += n * self.weights[kind] * self._factor(when, era)
+
+        t = self.table
+        rows = [{'item_id': key, 'score': score, 'era': era}
+                for key, score in scores.items() if score >= MIN_SCORE]
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(t))
+            if rows:
+                conn.execute(t.insert(), rows)
+        self._rebased_era = era
+        return len(rows)
+
+    def ensure_built(self, events):
+        """Rebuild from ``events()`` if the board is empty (e.g. right after upgrading)."""
+        with self.db.engine.connect() as conn:
+            empty = conn.execute(select(self.table.c.item_id).limit(1)).first() is None
+        if empty:
+            self.rebuild(events())
+
+    # Reading ----------------------------------------------------------
+
+    def ranked(self):
+        """Query of ``(item_id, score)`` rows on the current board.
+
+        Join and filter it as needed, then page it with :attr:`keys`, e.g.
+        ``keyset_paginate(board.ranked().join(...), board.keys, cursor)``.
+        """
+        era = self.current_era()
+        if self._rebased_era != era:
+            with self._lock, self.db.engine.begin() as conn:
+                self._ensure_era(conn, era)
+        t = self.table
+        return self.db.session.query(t.c.item_id, t.c.score).filter(t.c.era == era)
+
+    @property
+    def keys(self):
+        return (self.table.c.score, self.table.c.item_id)
+
+    def top(self, limit, *criteria):
+        """Ids of the ``limit`` best-scoring items matching ``criteria`` on the model."""
+        t = self.table
+        rows = self.ranked().join(self.model, self.model.id == t.c.item_id).filter(*criteria) \
+            .order_by(t.c.score.desc(), t.c.item_id.desc()).limit(limit)
+        return [row.item_id for row in rows]
+
+    def load(self, query, ids):
+        """Entities of ``query`` with these ids, in the order given."""
+        if not ids:
+            return []
+        by_id = {item.id: item for item in query.filter(self.model.id.in_(ids))}
+        return [by_id[i] for i in ids if i in by_id]
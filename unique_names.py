@@ -0,0 +1,72 @@
+"""Allocate unique slugs and usernames in one query.
+
+Finding a free name by trying ``base``, ``base-1``, ``base-2``... costs a
+round trip per taken name, and popular titles ("my-first-post") build long
+chains. ``allocate`` instead reads every existing ``base`` / ``base<sep>N``
+value with one prefix query and picks the number after the highest one.
+
+Two requests can still pick the same name at once; ``add_unique`` inserts
+the row inside a savepoint and, if the unique constraint rejects the name,
+allocates again and retries.
+"""
+import re
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def next_free(base, taken, sep='-'):
+    """``base`` if it is not in ``taken``, else ``base<sep>N`` past the highest taken N."""
+    if base not in taken:
+        return base
+    pattern = re.compile(re.escape(base + sep) + r'(\d+)$')
+    numbers = [int(m.group(1)) for m in map(pattern.match, taken) if m]
+    return f'{base}{sep}{max(numbers, default=0) + 1}'
+
+
+def _fit(base, column, sep):
+    """Shorten ``base`` so a numeric suffix still fits in ``column``."""
+    length = getattr(column.type, 'length', None)
+    if length and len(base) > length - len(sep) - 6:
+        base = base[:length - len(sep) - 6].rstrip(sep or '-')
+    # An empty prefix would match (and read) every row
+    return base or 'untitled'
+
+
+def allocate(session, column, base, sep='-', exclude=()):
+    """A value of ``column`` (e.g. ``Blog.slug``) starting with ``base`` that no row uses yet.
+
+    Values in ``exclude`` are treated as taken too.
+    """
+    base = _fit(base, column, sep)
+    taken = set(session.execute(
+        select(column).where(column.like(_escape_like(base) + '%', escape='\\'))
+    ).scalars())
+    return next_free(base, taken | set(exclude), sep)
+
+
+def add_unique(session, obj, column, base, sep='-', attempts=5):
+    """Add ``obj`` to ``session`` with ``column`` set to a free value derived from ``base``.
+
+    The row is flushed in a savepoint so a concurrent insert of the same
+    value only costs a retry. Returns the value used.
+    """
+    tried = set()
+    while True:
+        value = allocate(session, column, base, sep, exclude=tried)
+        setattr(obj, column.key, value)
+        try:
+            with session.begin_nested():
+                session.add(obj)
+        except IntegrityError:
+            tried.add(value)
+            # Give up on errors from other constraints, or after a few races
+            taken = session.execute(select(column).where(column == value)).first() is not None
+            if not taken or len(tried) >= attempts:
+                raise
+            continue
+        return value
@@ -0,0 +1,167 @@
+"""Content-addressed storage for uploaded images.
+
+Uploads are named after the SHA-256 of the uploaded bytes and stored under
+two levels of shard directories (``ab/cd/<digest>...``) inside
+``UPLOAD_FOLDER``, so the same image uploaded twice is stored once and no
+directory grows past a few hundred entries. Image processing is
+deterministic, so equal uploads also share every processed variant.
+
+Because a stored name never changes meaning, uploads are served with
+far-future ``immutable`` cache headers. The ``image_uploads`` table counts
+how many rows reference each digest (kept up to date by mapper events on the
+columns passed to ``track``); ``prune`` recounts the references and deletes
+files nothing points at any more.
+"""
+import glob
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import request
+from sqlalchemy import Column, DateTime, Integer, String, Table, bindparam, event, inspect, select
+from sqlalchemy.orm import attributes
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+# A stored name anywhere in a value: a filename column or links in post content
+REFERENCE_RE = re.compile(r'([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})')
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+
+def shard_dir(digest):
+    """Directory of ``digest`` relative to the upload folder."""
+    return f'{digest[:2]}/{digest[2:4]}'
+
+
+def references(value):
+    """Digests of the content-addressed uploads mentioned in ``value``."""
+    if not value:
+        return set()
+    return {digest for a, b, digest in REFERENCE_RE.findall(value) if digest.startswith(a + b)}
+
+
+class UploadStore:
+    def __init__(self, db, table_name='image_uploads'):
+        self.db = db
+        self.upload_folder = None
+        self.tracked = []
+        self.table = Table(
+            table_name, db.metadata,
+            Column('digest', String(64), primary_key=True),
+            Column('ref_count', Integer, nullable=False, default=0, server_default='0'),
+            Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
+        )
+
+    def init_app(self, app):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        app.extensions['upload_store'] = self
+        app.after_request(self._cache_headers)
+
+    def _cache_headers(self, response):
+        if request.endpoint == 'static' and response.status_code == 200 and \
+                references(request.path):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = CACHE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    # Files ------------------------------------------------------------
+
+    def register(self, digest):
+        """Record a stored upload (with no references yet) if it is new."""
+        with self.db.engine.begin() as conn:
+            exists = conn.execute(
+                select(self.table.c.digest).where(self.table.c.digest == digest)
+            ).first()
+            if not exists:
+                conn.execute(self.table.insert().values(digest=digest, ref_count=0))
+
+    # Reference counting -----------------------------------------------
+
+    def track(self, attribute):
+        """Count references to uploads held in a mapped column."""
+        model, key = attribute.class_, attribute.key
+        self.tracked.append(attribute)
+        # Load the old value when the column is overwritten so it can be released
+        event.listen(attribute, 'set', lambda *args: None, active_history=True)
+
+        @event.listens_for(model, 'after_insert')
+        def _inserted(mapper, connection, target):
+            self._adjust(connection, references(getattr(target, key)), 1)
+
+        @event.listens_for(model, 'after_update')
+        def _updated(mapper, connection, target):
+            history = attributes.get_history(target, key)
+            if not history.has_changes():
+                return
+            old = set().union(*(references(v) for v in history.deleted))
+            new = set().union(*(references(v) for v in history.added))
+            self._adjust(connection, old - new, -1)
+            self._adjust(connection, new - old, 1)
+
+        @event.listens_for(model, 'after_delete')
+        def _deleted(mapper, connection, target):
+            state = inspect(target).attrs[key]
+            if state.loaded_value is not attributes.NO_VALUE:
+                self._adjust(connection, references(state.loaded_value), -1)
+
+    def _adjust(self, connection, digests, delta):
+        t = self.table
+        for digest in digests:
+            updated = connection.execute(
+                t.update().where(t.c.digest == digest).values(ref_count=t.c.ref_count + delta)
+            ).rowcount
+            if not updated and delta > 0:
+                connection.execute(t.insert().values(digest=digest, ref_count=delta))
+
+    def recount(self, batch_size=500):
+        """Recompute every reference count from the tracked columns."""
+        counts = Counter()
+        for attribute in self.tracked:
+            model = attribute.class_
+            key = inspect(model).primary_key[0]
+            last = None
+            while True:
+                stmt = select(key, attribute).where(attribute.like('%/%/%'))
+                if last is not None:
+                    stmt = stmt.where(key > last)
+                rows = self.db.session.execute(stmt.order_by(key).limit(batch_size)).all()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                for _, value in rows:
+                    counts.update(references(value))
+
+        t = self.table
+        known = set(self.db.session.execute(select(t.c.digest)).scalars())
+        self.db.session.execute(t.update().values(ref_count=0))
+        if counts.keys() & known:
+            self.db.session.execute(
+                t.update().where(t.c.digest == bindparam('d')).values(ref_count=bindparam('n')),
+                [{'d': d, 'n': n} for d, n in counts.items() if d in known],
+            )
+        missing = [{'digest': d, 'ref_count': n} for d, n in counts.items() if d not in known]
+        if missing:
+            self.db.session.execute(t.insert(), missing)
+        self.db.session.commit()
+
+    def prune(self, grace=timedelta(days=1)):
+        """Delete uploads no row references, keeping ones younger than ``grace``.
+
+        The grace period covers uploads whose post or profile has not been
+        saved yet. Returns the number of images removed.
+        """
+        self.recount()
+        t = self.table
+        cutoff = datetime.utcnow() - grace
+        orphans = self.db.session.execute(
+            select(t.c.digest).where(t.c.ref_count <= 0, t.c.created_at < cutoff)
+        ).scalars().all()
+        for digest in orphans:
+            for path in glob.glob(os.path.join(self.upload_folder, shard_dir(digest), digest + '*')):
+                os.remove(path)
+        if orphans:
+            self.db.session.execute(t.delete().where(t.c.digest.in_(orphans)))
+            self.db.session.commit()
+        return len(orphans)
@@ -0,0 +1,167 @@
+"""Per-item view counts in hourly and daily time buckets.
+
+The view counter only keeps a running total per row, so "views in the last
+7 days" cannot be answered from it. ``ViewBuckets`` is fed the same batches
+the counter writes (see ``ViewCounter.on_flush``) and adds each batch to the
+current hour's bucket of every item in it: one upsert per flush.
+
+Buckets are keyed by hours since the epoch. Hourly buckets older than
+``VIEW_BUCKET_HOURLY_DAYS`` are rolled up into one bucket per day (keyed by
+the day's first hour) and daily buckets older than
+``VIEW_BUCKET_RETENTION_DAYS`` are dropped, so the table stays at roughly
+one row per item per active day. Windowed sums are range reads of the
+``(hour, item_id, views)`` index; windows reaching past the hourly range are
+accurate to the day.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Column, Index, Integer, Table, delete, event, func, select
+
+from schema import upsert_add
+
+HOURS_PER_DAY = 24
+
+
+def hour_of(when=None):
+    """Hours since the epoch (UTC) of ``when``, or of now."""
+    if when is None:
+        return int(time.time() // 3600)
+    if isinstance(when, timedelta):
+        return hour_of() - int(when.total_seconds() // 3600)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return int(when.timestamp() // 3600)
+
+
+def hour_start(hour):
+    """Naive UTC datetime at which bucket ``hour`` starts."""
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None)
+
+
+class ViewBuckets:
+    """Time-bucketed view counts for one model.
+
+    Windows passed to the query methods are either a ``timedelta`` (that long
+    ago until now), a datetime to start from, or None for all time.
+    """
+
+    def __init__(self, db, model, hourly_days=2, retention_days=400):
+        self.db = db
+        self.model = model
+        self.hourly_days = hourly_days
+        self.retention_days = retention_days
+        self._compacted_hour = None
+        self._lock = threading.Lock()
+
+        name = f'view_buckets_{model.__tablename__}'
+        self.table = Table(
+            name, db.metadata,
+            Column('item_id', model.__table__.c.id.type, primary_key=True),
+            Column('hour', Integer, primary_key=True, autoincrement=False),
+            Column('views', Integer, nullable=False, default=0),
+            Index(f'ix_{name}_hour', 'hour', 'item_id', 'views'),
+        )
+        event.listen(model, 'after_delete', self._item_deleted)
+
+    def init_app(self, app):
+        self.hourly_days = int(app.config.get('VIEW_BUCKET_HOURLY_DAYS', self.hourly_days))
+        self.retention_days = int(app.config.get('VIEW_BUCKET_RETENTION_DAYS', self.retention_days))
+        app.extensions[f'view_buckets.{self.model.__tablename__}'] = self
+
+    # Writing ----------------------------------------------------------
+
+    def record(self, conn, counts, when=None):
+        """Add ``counts`` (``{item_id: views}``) to the bucket of ``when`` (default now)."""
+        hour = hour_of(when)
+        rows = [{'item_id': key, 'hour': hour, 'views': n} for key, n in sorted(counts.items()) if n]
+        if rows:
+            upsert_add(conn, self.table, rows, 'views')
+        # Compact at most once an hour per process, in the flush that crosses it
+        if self._compacted_hour != hour:
+            self._compacted_hour = hour
+            self.compact(conn, hour)
+
+    def compact(self, conn=None, now=None):
+        """Roll old hourly buckets up into days and drop expired days.
+
+        Returns the number of rows deleted (before adding the day rows).
+        """
+        if conn is None:
+            with self._lock, self.db.engine.begin() as conn:
+                return self.compact(conn, now)
+
+        t = self.table
+        now = hour_of() if now is None else now
+        # Only whole days are rolled up, so a day never mixes granularities
+        cutoff = (now // HOURS_PER_DAY - self.hourly_days) * HOURS_PER_DAY
+        expired = (now // HOURS_PER_DAY - self.retention_days) * HOURS_PER_DAY
+        removed = conn.execute(delete(t).where(t.c.hour < expired)).rowcount
+
+        day = (t.c.hour // HOURS_PER_DAY) * HOURS_PER_DAY
+        hourly = (t.c.hour < cutoff, t.c.hour % HOURS_PER_DAY != 0)
+        days = conn.execute(
+            select(t.c.item_id, day.label('day'), func.sum(t.c.views).label('views'))
+            .where(*hourly).group_by(t.c.item_id, day)
+        ).all()
+        if days:
+            removed += conn.execute(delete(t).where(*hourly)).rowcount
+            upsert_add(conn, t, [{'item_id': row.item_id, 'hour': row.day, 'views': row.views}
+                                 for row in days], 'views')
+        return removed
+
+    def _item_deleted(self, mapper, connection, target):
+        connection.execute(delete(self.table).where(self.table.c.item_id == target.id))
+
+    # Reading ----------------------------------------------------------
+
+    def _since(self, window):
+        if window is None:
+            return ()
+        hour = hour_of(window)
+        # Hours rolled into a day bucket are found under the day's first hour
+        if hour < (hour_of() // HOURS_PER_DAY - self.hourly_days) * HOURS_PER_DAY:
+            hour -= hour % HOURS_PER_DAY
+        return (self.table.c.hour >= hour,)
+
+    def totals(self, window):
+        """Subquery of ``(item_id, views)`` summed over ``window``, for joins."""
+        t = self.table
+        return select(t.c.item_id, func.sum(t.c.views).label('views')) \
+            .where(*self._since(window)).group_by(t.c.item_id).subquery()
+
+    def top(self, window, limit, *criteria):
+        """``(item_id, views)`` of the most viewed items matching ``criteria`` in ``window``."""
+        t = self.table
+        views = func.sum(t.c.views)
+        stmt = select(t.c.item_id, views.label('views')).where(*self._since(window))
+        if criteria:
+            stmt = stmt.join(self.model, self.model.id == t.c.item_id).where(*criteria)
+        stmt = stmt.group_by(t.c.item_id).order_by(views.desc(), t.c.item_id).limit(limit)
+        return self.db.session.execute(stmt).all()
+
+    def total(self, window, *criteria):
+        """Views in ``window`` across the items matching ``criteria`` (e.g. one author's)."""
+        t = self.table
+        stmt = select(func.coalesce(func.sum(t.c.views), 0)).where(*self._since(window))
+        if criteria:
+            stmt = stmt.join(self.model, self.model.id == t.c.item_id).where(*criteria)
+        return self.db.session.execute(stmt).scalar()
+
+    def series(self, window, *criteria, step=HOURS_PER_DAY):
+        """``[(start, views)]`` per ``step`` hours in ``window``, oldest first, gaps omitted."""
+        t = self.table
+        slot = (t.c.hour // step) * step
+        stmt = select(slot.label('slot'), func.sum(t.c.views)).where(*self._since(window))
+        if criteria:
+            stmt = stmt.join(self.model, self.model.id == t.c.item_id).where(*criteria)
+        rows = self.db.session.execute(stmt.group_by(slot).order_by(slot)).all()
+        return [(hour_start(hour), views) for hour, views in rows]
+
+    def events(self):
+        """Every bucket as ``(item_id, 'view', start, views)``, for ``TrendingBoard.rebuild``."""
+        t = self.table
+        stmt = select(t.c.item_id, t.c.hour, t.c.views).execution_options(yield_per=1000)
+        for item_id, hour, views in self.db.session.execute(stmt):
+            yield item_id, 'view', hour_start(hour), views
@@ -0,0 +1,291 @@
+"""Write-behind view counter.
+
+Page views are accumulated in memory (or in a spool file shared by every
+worker on the host) and written to the database as aggregated deltas on a
+timer or once enough views are pending, instead of one UPDATE + COMMIT per
+page view.
+"""
+import atexit
+import os
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import has_app_context
+from sqlalchemy import bindparam, column, func, table
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; appends are still line-atomic
+    fcntl = None
+
+
+class MemoryBackend:
+    """Accumulate view deltas inside the current process."""
+
+    def __init__(self, key_type=str):
+        self.key_type = key_type
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._total = 0
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+            self._total += amount
+            return self._total
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._total = 0
+        return counts
+
+    def restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+            self._total += sum(counts.values())
+
+    def pending(self, key):
+        return self._counts.get(key, 0)
+
+    def reset(self):
+        self.drain()
+
+
+class FileBackend:
+    """Accumulate view deltas in a spool file shared by all local workers.
+
+    The file is the only record of pending views: every increment appends
+    one ``key<TAB>amount`` line, and ``pending()`` reads the file back
+    (incrementally, from where it last stopped). A flush claims the file
+    by renaming it to a uniquely named ``*.flush`` file, so the deltas from
+    every worker are written in a single batch. Claims left behind by a
+    worker that died mid-flush are picked up by the next flush.
+    """
+
+    def __init__(self, path, key_type=str):
+        self.key_type = key_type
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        self._added = 0
+        # (generation, offset, counts) of the spool file read so far by pending()
+        self._seen = (None, 0, Counter())
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _append(self, counts):
+        lines = ''.join(f'{key}\t{amount}\n' for key, amount in counts.items())
+        with self._locked(exclusive=False):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if f.tell() == 0:
+                    # Tells pending() this is a new file, even if it reuses an inode
+                    lines = f'#{uuid.uuid4().hex}\n' + lines
+                f.write(lines)
+
+    def _parse(self, data, counts):
+        for line in data.splitlines():
+            key, _, amount = line.partition('\t')
+            if key and amount and not key.startswith('#'):
+                counts[self.key_type(key)] += int(amount)
+
+    def add(self, key, amount=1):
+        self._append({key: amount})
+        with self._lock:
+            self._added += amount
+            return self._added
+
+    def _claims(self):
+        directory = os.path.dirname(self.path) or '.'
+        prefix = os.path.basename(self.path) + '.'
+        return [os.path.join(directory, name) for name in os.listdir(directory)
+                if name.startswith(prefix) and name.endswith('.flush')]
+
+    def drain(self):
+        with self._lock:
+            self._added = 0
+        claim = f'{self.path}.{os.getpid()}.{uuid.uuid4().hex}.flush'
+        counts = Counter()
+        # Claims are only created and consumed under the exclusive lock, so any
+        # other *.flush file found here belongs to a worker that died mid-flush
+        with self._locked(exclusive=True):
+            try:
+                os.replace(self.path, claim)
+            except FileNotFoundError:
+                pass
+            for path in self._claims():
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._parse(f.read(), counts)
+                os.remove(path)
+        return counts
+
+    def restore(self, counts):
+        self._append(counts)
+
+    def pending(self, key):
+        with self._lock:
+            generation, offset, counts = self._seen
+            try:
+                with open(self.path, 'rb') as f:
+                    header = f.readline()
+                    if not header.endswith(b'\n'):
+                        return 0  # just created, header not written yet
+                    if header != generation:
+                        # Claimed by a flush and started afresh since the last read
+                        generation, offset, counts = header, len(header), Counter()
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                self._seen = (None, 0, Counter())
+                return 0
+            # Only whole lines; a concurrent append may be half written
+            data = data[:data.rfind(b'\n') + 1]
+            self._parse(data.decode('utf-8'), counts)
+            self._seen = (generation, offset + len(data), counts)
+            return counts.get(key, 0)
+
+    def reset(self):
+        with self._lock:
+            self._added = 0
+
+
+class ViewCounter:
+    """Buffered ``views`` counter for one table.
+
+    ``increment()`` only touches the backend; a daemon thread flushes the
+    aggregated deltas every ``VIEW_COUNTER_FLUSH_INTERVAL`` seconds, or as
+    soon as ``VIEW_COUNTER_FLUSH_THRESHOLD`` views are pending, and a final
+    flush runs at interpreter exit. An interval of 0 writes every view
+    through immediately (handy for tests).
+
+    Functions registered with ``on_flush`` receive ``(connection, counts)``
+    for every batch, inside the transaction that writes it, so derived data
+    (trending scores, time buckets) is fed in the same batches.
+    """
+
+    def __init__(self, db, table_name, key_type=str, column_name='views'):
+        self.db = db
+        self.table_name = table_name
+        self.key_type = key_type
+        self.column_name = column_name
+        self._table = table(table_name, column('id'), column(column_name))
+        self.app = None
+        self.interval = 5.0
+        self.threshold = 200
+        self._backend = MemoryBackend(key_type)
+        self._inflight = Counter()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+        self._pid = None
+        self._listeners = []
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = float(app.config.get('VIEW_COUNTER_FLUSH_INTERVAL', 5.0))
+        self.threshold = int(app.config.get('VIEW_COUNTER_FLUSH_THRESHOLD', 200))
+
+        if app.config.get('VIEW_COUNTER_BACKEND', 'memory') == 'file':
+            spool_dir = app.config.get('VIEW_COUNTER_SPOOL_DIR') or app.instance_path
+            path = os.path.join(spool_dir, f'{self.table_name}-views.spool')
+            self._backend = FileBackend(path, self.key_type)
+        else:
+            self._backend = MemoryBackend(self.key_type)
+
+        app.extensions[f'view_counter.{self.table_name}'] = self
+        atexit.register(self.flush)
+
+    def increment(self, key, amount=1):
+        """Record ``amount`` views for the row with primary key ``key``."""
+        if self.app is None or self.interval <= 0:
+            self._write({key: amount})
+            return
+
+        self._ensure_worker()
+        if self._backend.add(key, amount) >= self.threshold:
+            self._wake.set()
+
+    def on_flush(self, fn):
+        """Call ``fn(connection, counts)`` with every batch of views written."""
+        self._listeners.append(fn)
+        return fn
+
+    def pending(self, key):
+        """Views recorded for ``key`` that are not in the database yet."""
+        return self._backend.pending(key) + self._inflight.get(key, 0)
+
+    def flush(self):
+        """Write every pending delta in one transaction; return views written."""
+        if self.app is None:
+            return 0
+        with self._flush_lock:
+            counts = self._backend.drain()
+            if not counts:
+                return 0
+            self._inflight = counts
+            try:
+                self._write(counts)
+            except Exception:
+                self._backend.restore(counts)
+                self.app.logger.exception('[Views] Flush to %s failed; deltas kept for retry.',
+                                          self.table_name)
+                return 0
+            finally:
+                self._inflight = Counter()
+            return sum(counts.values())
+
+    def _write(self, counts):
+        col = self._table.c[self.column_name]
+        stmt = self._table.update().where(
+            self._table.c.id == bindparam('row_id')
+        ).values({self.column_name: func.coalesce(col, 0) + bindparam('delta')})
+        # Sorted keys give every worker the same row-lock order
+        rows = [{'row_id': key, 'delta': amount}
+                for key, amount in sorted(counts.items()) if amount]
+        if not rows:
+            return
+
+        if has_app_context():
+            self._execute(stmt, rows, counts)
+        else:
+            with self.app.app_context():
+                self._execute(stmt, rows, counts)
+
+    def _execute(self, stmt, rows, counts):
+        with self.db.engine.begin() as conn:
+            conn.execute(stmt, rows)
+            for listener in self._listeners:
+                listener(conn, counts)
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._pid == pid and self._worker is not None and self._worker.is_alive():
+            return
+        if self._pid is not None and self._pid != pid:
+            # Forked child: the parent owns whatever was pending before the fork
+            self._backend.reset()
+            self._flush_lock = threading.Lock()
+            self._wake = threading.Event()
+        self._pid = pid
+        self._worker = threading.Thread(target=self._run, name=f'view-counter-{self.table_name}',
+                                        daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()